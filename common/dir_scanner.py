@@ -0,0 +1,162 @@
+"""
+目录扫描（t1、t2共用）：用os.scandir一次拿到文件名和类型，stat信息直接用DirEntry自带的，不再对每个文件调用
+os.path.exists/isfile；要跳过的目录在扫描时剪掉，不进入。
+
+    scan_tree       逐个生成文件，边扫描边处理，不用等整棵树扫完
+    scan_parallel   多个线程同时扫描多个目录（网络磁盘、冷缓存时等待磁盘的时间可以重叠），生成顺序不固定
+    FileTable       扫描结果按列存进数组，几十万文件也只占很少内存，按相对路径O(1)查找
+"""
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 并行扫描的默认线程数（扫描主要在等磁盘，线程可以比CPU核数多）
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+
+def _scan_dir(abs_dir, rel_dir, skip_dirs, ignore, on_error, sort):
+    """
+    扫描一个目录（不递归）
+    :return: (文件列表 [(相对路径, DirEntry)], 子目录列表 [(相对路径, 绝对路径)])
+    """
+    try:
+        with os.scandir(abs_dir) as it:
+            entries = sorted(it, key=lambda e: e.name) if sort else list(it)
+    except OSError as e:
+        if on_error is None:
+            raise
+        on_error(abs_dir, e)
+        return [], []
+
+    files = []
+    sub_dirs = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)  # 和os.walk一样，不进入指向目录的符号链接
+            if not is_dir and not entry.is_file():
+                continue  # 指向目录的符号链接、失效的符号链接、设备文件等
+        except OSError:
+            continue
+        if is_dir and entry.name in skip_dirs:
+            continue
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        if ignore is not None and ignore(rel_path, is_dir):
+            continue  # 被忽略的目录在这里剪掉，里面的内容一个都不扫描
+        if is_dir:
+            sub_dirs.append((rel_path, entry.path))
+        else:
+            files.append((rel_path, entry))
+    return files, sub_dirs
+
+
+def scan_tree(root_dir, skip_dirs=(), ignore=None, on_error=None, sort=False, max_depth=None):
+    """
+    遍历目录下的所有文件（深度优先：先生成目录里的文件，再依次进入子目录）
+    :param root_dir: 要扫描的目录
+    :param skip_dirs: 不进入的目录名称（任意层级）
+    :param ignore: 剪枝回调，参数为 (相对路径, 是否目录)，返回True的文件不生成、目录不进入
+    :param on_error: 打不开目录时的回调，参数为 (目录路径, 异常)；为None时抛出异常
+    :param sort: 同一目录下按名称排序（保证每次结果顺序一致）；为False时按scandir返回的顺序
+    :param max_depth: 最多进入几层子目录（0为只扫描root_dir本身）；为None时不限
+    :return: 生成 (相对路径, DirEntry)，DirEntry.path为完整路径，DirEntry.stat()在Windows上不用再访问磁盘
+    """
+    stack = [("", root_dir, 0)]
+    while stack:
+        rel_dir, abs_dir, depth = stack.pop()
+        files, sub_dirs = _scan_dir(abs_dir, rel_dir, skip_dirs, ignore, on_error, sort)
+        yield from files
+        if max_depth is None or depth < max_depth:
+            # 倒序入栈，出栈时按原来的顺序
+            stack.extend((rel_path, abs_path, depth + 1) for rel_path, abs_path in reversed(sub_dirs))
+
+
+def scan_parallel(roots, workers=DEFAULT_WORKERS, skip_dirs=(), ignore=None, on_error=None, max_depth=None,
+                  need_stat=False):
+    """
+    多个线程同时扫描多个目录树（每个子目录是一个任务，一棵大树的各个子目录也会分给不同线程）
+    :param roots: {键: 目录路径}，生成结果时用键区分是哪个目录里的文件
+    :param workers: 线程数（1为在当前线程中逐个扫描）
+    :param need_stat: 在扫描线程里顺便读取stat（DirEntry会缓存），调用方再调用DirEntry.stat()不用再访问磁盘；
+                      读不到stat的文件跳过
+    :param skip_dirs, ignore, on_error, max_depth: 同scan_tree
+    :return: 生成 (键, 相对路径, DirEntry)，不同目录之间的顺序不固定
+    """
+    def task(key, rel_dir, abs_dir, depth):
+        files, sub_dirs = _scan_dir(abs_dir, rel_dir, skip_dirs, ignore, on_error, False)
+        if need_stat:
+            files = [(rel_path, entry) for rel_path, entry in files if _warm_stat(entry)]
+        if max_depth is not None and depth >= max_depth:
+            sub_dirs = []
+        return key, files, [(key, rel_path, abs_path, depth + 1) for rel_path, abs_path in sub_dirs]
+
+    jobs = [(key, "", root, 0) for key, root in roots.items()]
+    if workers <= 1:
+        while jobs:
+            key, files, sub_jobs = task(*jobs.pop())
+            jobs.extend(reversed(sub_jobs))
+            for rel_path, entry in files:
+                yield key, rel_path, entry
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        running = {pool.submit(task, *job) for job in jobs}
+        try:
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, files, sub_jobs = future.result()
+                    running.update(pool.submit(task, *job) for job in sub_jobs)
+                    for rel_path, entry in files:
+                        yield key, rel_path, entry
+        finally:
+            # 调用方提前停止时，还没开始的任务不再执行
+            for future in running:
+                future.cancel()
+
+
+def _warm_stat(entry):
+    try:
+        entry.stat()
+        return True
+    except OSError:
+        return False
+
+
+class FileTable:
+    """按列存储的扫描结果：相对路径、大小、修改时间和标识（t2的目录树快照和压缩包目录树都基于它）"""
+
+    def __init__(self):
+        # 按列存储文件信息（数组比元组列表省内存，几十万文件也不怕）
+        self.paths = []  # 相对路径（按遍历顺序）
+        self.sizes = array('q')  # 文件大小（字节）
+        self.mtimes = array('q')  # 修改时间（纳秒）
+        self.idents = array('Q')  # 文件标识（文件夹中为inode编号，压缩包中为成员标识），摘要缓存用它识别文件
+        self.index = {}  # 相对路径 -> 下标（哈希索引，O(1)查找）
+
+    def _add(self, rel_path, size, mtime_ns, ident):
+        """追加一条文件记录"""
+        self.index[rel_path] = len(self.paths)
+        self.paths.append(rel_path)
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        self.idents.append(ident)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, rel_path):
+        return rel_path in self.index
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def path_set(self):
+        """返回相对路径集合视图（可直接做 & - | 集合运算）"""
+        return self.index.keys()
+
+    def stat(self, rel_path):
+        """获取文件的 (大小, 修改时间纳秒, 标识)，不存在返回None"""
+        i = self.index.get(rel_path)
+        if i is None:
+            return None
+        return self.sizes[i], self.mtimes[i], self.idents[i]
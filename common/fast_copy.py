@@ -0,0 +1,78 @@
+"""
+文件复制（t1、t2共用）：尽量让内核直接复制，数据不经过Python
+
+    try_reflink     只共享数据块，不复制数据（btrfs、xfs等支持reflink的文件系统）
+    copy_file       依次尝试 reflink -> copy_file_range -> sendfile，都不支持时退回普通复制
+"""
+import os
+import shutil
+
+try:
+    import fcntl  # 只有Linux/macOS有
+except ImportError:
+    fcntl = None
+
+# Linux ioctl FICLONE：让目标文件直接共享源文件的数据块
+FICLONE = 0x40049409
+
+# 每次让内核复制的最大字节数
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def try_reflink(src_fd, dst_fd):
+    """尝试reflink（不复制数据，只共享数据块），不支持就返回False"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _try_kernel_copy(copy_func, src_fd, dst_fd, size):
+    """
+    用内核复制函数（copy_file_range/sendfile）复制，数据不经过用户空间
+    :return: 是否复制成功；一个字节都没复制就失败（或内核直接返回0，如部分虚拟文件系统）时返回False，交给下一种方式
+    """
+    copied = 0
+    while copied < size:
+        try:
+            n = copy_func(src_fd, dst_fd, copied, min(CHUNK_SIZE, size - copied))
+        except OSError:
+            if copied == 0:
+                return False
+            raise
+        if n == 0:
+            if copied == 0:
+                return False
+            break  # 文件在复制过程中变短了
+        copied += n
+    return True
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def copy_file(src, dst):
+    """
+    复制文件内容和元数据（效果同shutil.copy2）
+    Linux上依次尝试 reflink -> copy_file_range -> sendfile，都不支持时退回普通的读写复制；
+    其他系统直接用shutil.copy2（Windows、macOS上shutil自己会用系统的快速复制）
+    """
+    if fcntl is None or not hasattr(os, "copy_file_range"):
+        return shutil.copy2(src, dst)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        done = (try_reflink(src_fd, dst_fd) or _try_kernel_copy(_copy_file_range, src_fd, dst_fd, size)
+                or _try_kernel_copy(_sendfile, src_fd, dst_fd, size))
+        if not done:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    shutil.copystat(src, dst)
+    return dst
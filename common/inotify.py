@@ -0,0 +1,92 @@
+"""
+Linux inotify（t1、t2的监听模式共用）：通过ctypes调用libc，不需要安装第三方库
+
+这里只负责初始化、添加/取消监听和解析事件；递归监听哪些目录、事件怎么处理由各自的监听器决定。
+"""
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify 事件类型（见 linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    """一个inotify实例（非阻塞的文件描述符）"""
+
+    def __init__(self):
+        """
+        :raises OSError: 当前系统不支持inotify
+        """
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, "找不到libc，无法使用inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "当前系统不支持inotify")
+
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify初始化失败")
+
+    def add_watch(self, abs_dir, mask=WATCH_MASK):
+        """
+        监听一个目录（不包括子目录）
+        :return: 监听编号；目录刚被删掉时返回None
+        :raises OSError: 监听数量超过系统限制等
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(abs_dir), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return None
+            raise OSError(err, f"无法监听目录: {abs_dir}")
+        return wd
+
+    def rm_watch(self, wd):
+        """取消监听"""
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """
+        等待并读取事件
+        :param timeout: 最长等待秒数
+        :return: [(监听编号, 事件类型, 文件名), ...]；事件针对被监听的目录本身时文件名为空字符串
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            raw_name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(raw_name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
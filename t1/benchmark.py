@@ -0,0 +1,331 @@
+"""
+整理流程性能测试：生成模拟的杂乱文件夹，无界面整理一遍（再增量整理一遍），统计耗时、文件数/秒、复制的数据量、
+系统调用次数和内存峰值，结果输出为JSON，方便对比不同版本
+
+用法示例：
+    python benchmark.py --files 20000 --dup-ratio 0.1 --collision-ratio 0.05 --output result.json
+    python benchmark.py --files 5000 --profile        # 加上热点函数耗时（单线程运行）
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import pstats
+import argparse
+import cProfile
+import tempfile
+import platform
+import threading
+import tracemalloc
+import contextlib
+from collections import Counter
+
+try:
+    import resource  # 只有Linux/macOS有
+except ImportError:
+    resource = None
+
+import main as organizer
+from dedupe import DEDUPE_MODES
+from file_ops import TRANSFER_MODES
+from conflict_policy import CONFLICT_POLICIES
+from transfer_engine import DEFAULT_WORKERS
+
+# 默认的扩展名比例（大致是下载文件夹里常见的样子）
+DEFAULT_EXT_MIX = ".jpg=20,.png=10,.pdf=10,.docx=6,.txt=8,.zip=5,.mp3=6,.mp4=4,.py=6,.exe=3,.json=4,.epub=2"
+
+# 分不出类的文件用的扩展名（整理时会被移进垃圾桶）
+UNKNOWN_EXTS = [".xyz", ".dat", ".bak", ""]
+
+NAME_STEMS = ["IMG_", "report_", "scan_", "song_", "setup_", "notes_", "data_", "draft_", "photo_", "invoice_"]
+
+# 统计次数的文件操作（Python审计事件，见 https://docs.python.org/3/library/audit_events.html）
+FS_AUDIT_EVENTS = frozenset({"open", "os.scandir", "os.listdir", "os.rename", "os.remove", "os.link", "os.mkdir",
+                             "os.utime", "os.chmod", "shutil.copyfile", "fcntl.ioctl", "sqlite3.connect"})
+
+# 热点分类：名称 -> [(文件名, 函数名)]，统计这些函数的累计耗时
+HOT_PATHS = {
+    "scan": [("file_walker.py", "walk_files"), ("file_walker.py", "list_files_parallel")],
+    "classify": [("classifier.py", "classify")],
+    "dedupe": [("main.py", "find_entry_duplicates")],
+    "plan": [("conflict_policy.py", "resolve_collisions")],
+    "transfer": [("transfer_engine.py", "_run_job")],
+    "state": [("organizer_state.py", "__init__"), ("organizer_state.py", "save")],
+}
+
+
+class FsCallCounter:
+    """用审计钩子统计文件操作次数（钩子装上就不能卸载，不统计时直接返回）"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.enabled = False
+        self._lock = threading.Lock()
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if self.enabled and event in FS_AUDIT_EVENTS:
+            with self._lock:
+                self.counts[event] += 1
+
+    def start(self):
+        self.counts = Counter()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        return dict(sorted(self.counts.items()))
+
+
+def read_proc_io():
+    """
+    本进程到目前为止的读写系统调用次数和字节数（Linux的/proc/self/io），其他系统返回None
+    :return: {"read_calls", "write_calls", "read_bytes", "write_bytes"}
+    """
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return {"read_calls": int(values["syscr"]), "write_calls": int(values["syscw"]),
+            "read_bytes": int(values["rchar"]), "write_bytes": int(values["wchar"])}
+
+
+def parse_ext_mix(text):
+    """把 ".jpg=20,.pdf=10" 解析成 ([扩展名], [权重])"""
+    exts, weights = [], []
+    for item in text.split(","):
+        ext, _, weight = item.strip().partition("=")
+        exts.append(ext if ext.startswith(".") else "." + ext)
+        weights.append(float(weight or 1))
+    return exts, weights
+
+
+def _pick_size(rng, args):
+    """文件大小：大部分文件很小，少数文件很大（lognormal分布）"""
+    size = int(rng.lognormvariate(0, 1.2) * args.min_size)
+    return max(0, min(size, args.max_size))
+
+
+def _random_dir(rng, depth):
+    """生成随机深度的相对目录（""为根目录）"""
+    parts = [f"dir{rng.randrange(10)}" for _ in range(rng.randint(0, depth))]
+    return os.path.join(*parts) if parts else ""
+
+
+def generate_tree(base, args):
+    """
+    生成模拟的杂乱文件夹：各种扩展名的文件散落在多层子目录里，其中一部分内容重复、一部分和别的文件同名
+    所有文件的修改时间都设在过去（和真实的下载文件夹一样，增量整理时能被记录）
+    :return: 目录树统计信息
+    """
+    rng = random.Random(args.seed)
+    exts, weights = parse_ext_mix(args.ext_mix)
+    stats = {"files": 0, "bytes": 0, "dirs": 0, "duplicates": 0, "name_collisions": 0, "unknown": 0}
+    names = []  # 已生成的文件名（用来制造同名文件）
+    paths = []  # 已生成的非空文件（用来制造内容重复的文件）
+    dirs = set()
+    base_time = 1577836800  # 2020-01-01
+
+    for i in range(args.files):
+        rel_dir = _random_dir(rng, args.depth)
+        if names and rng.random() < args.collision_ratio:
+            name = rng.choice(names)
+            stats["name_collisions"] += 1
+        else:
+            ext = rng.choice(UNKNOWN_EXTS) if rng.random() < args.unknown_ratio else rng.choices(exts, weights)[0]
+            name = f"{rng.choice(NAME_STEMS)}{i}{ext}"
+            names.append(name)
+        if os.path.splitext(name)[1] in UNKNOWN_EXTS:
+            stats["unknown"] += 1
+
+        # 同名文件放到没用过这个名字的目录里（同一个目录不能有两个同名文件）
+        path = os.path.join(base, rel_dir, name)
+        while os.path.exists(path):
+            rel_dir = os.path.join(rel_dir, "copy")
+            path = os.path.join(base, rel_dir, name)
+        if rel_dir not in dirs:
+            os.makedirs(os.path.join(base, rel_dir), exist_ok=True)
+            dirs.add(rel_dir)
+
+        if paths and rng.random() < args.dup_ratio:
+            shutil.copyfile(rng.choice(paths), path)
+            stats["duplicates"] += 1
+        else:
+            with open(path, 'wb') as f:
+                f.write(rng.randbytes(_pick_size(rng, args)))
+        mtime = base_time + rng.randrange(365 * 24 * 3600)
+        os.utime(path, (mtime, mtime))
+
+        size = os.path.getsize(path)
+        if size:
+            paths.append(path)
+        stats["files"] += 1
+        stats["bytes"] += size
+
+    stats["dirs"] = len(dirs)
+    return stats
+
+
+def _run_stage(name, func, files, nbytes, args, fs_counter, profiler=None):
+    """执行一个阶段，返回 (结果, 统计信息)"""
+    if args.trace_memory:
+        tracemalloc.start()
+    io_before = read_proc_io()
+    fs_counter.start()
+    start = time.perf_counter()
+    # 整理过程中的提示信息不打印，避免影响计时
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = func()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    seconds = time.perf_counter() - start
+    fs_calls = fs_counter.stop()
+    io_after = read_proc_io()
+    peak = None
+    if args.trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "files": files,
+        "bytes": nbytes,
+        "files_per_sec": round(files / seconds, 1) if seconds else None,
+        "mb_per_sec": round(nbytes / seconds / 1024 / 1024, 2) if seconds else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2) if peak is not None else None,
+        "syscalls": {k: io_after[k] - io_before[k] for k in io_after} if io_before is not None else None,
+        "fs_calls": fs_calls,
+    }
+
+
+def classify_all(base):
+    """只做分类（不复制），单独统计分类的速度"""
+    categories = Counter()
+    for filepath, filename, entry in organizer.walk_files(base):
+        categories[organizer.classifier.classify(filename, filepath, entry.stat())] += 1
+    return categories
+
+
+def profile_report(profiler, top):
+    """
+    整理出热点函数
+    :return: {"hot_paths": {分类: 累计秒数}, "top": [按累计耗时排序的前top个函数]}
+    """
+    stats = pstats.Stats(profiler).stats  # (文件名, 行号, 函数名) -> (原生调用数, 调用数, 自身耗时, 累计耗时, 调用者)
+    hot_paths = {}
+    for name, funcs in HOT_PATHS.items():
+        hot_paths[name] = round(sum(
+            cumtime for (filename, _, func), (_, _, _, cumtime, _) in stats.items()
+            if (os.path.basename(filename), func) in funcs
+        ), 4)
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        "hot_paths": hot_paths,
+        "top": [{
+            "function": f"{os.path.basename(filename)}:{lineno}({func})",
+            "calls": calls,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        } for (filename, lineno, func), (_, calls, tottime, cumtime, _) in rows],
+    }
+
+
+def run_benchmark(base, tree_stats, args):
+    """在已生成的目录树上依次执行：只分类、第一次整理、没有变化时再整理一遍（增量）"""
+    fs_counter = FsCallCounter()
+    profiler = cProfile.Profile() if args.profile else None
+    files, nbytes = tree_stats["files"], tree_stats["bytes"]
+
+    categories, classify_stats = _run_stage("classify", lambda: classify_all(base), files, nbytes, args,
+                                            fs_counter)
+
+    def organize():
+        return organizer.organize_folder(base, args.policy, args.mode, workers=args.workers, dedupe=args.dedupe)
+
+    (counts, transfer), organize_stats = _run_stage("organize", organize, files, nbytes, args, fs_counter, profiler)
+    snapshot = transfer.snapshot()
+    organize_stats.update(bytes_copied=snapshot["bytes_copied"], renamed=snapshot["renamed"],
+                          bytes_saved=snapshot["bytes_saved"])
+
+    stages = [classify_stats, organize_stats]
+    result = {"categories": {k or "垃圾桶": v for k, v in categories.items()}, "organize": counts}
+    if args.mode == "copy":
+        # 复制模式下原文件还在，第二次整理应该几乎全部跳过
+        (counts, _), rerun_stats = _run_stage("rerun", organize, files, nbytes, args, fs_counter)
+        stages.append(rerun_stats)
+        result["rerun"] = counts
+    report = {"stages": stages, "result": result}
+    if profiler is not None:
+        report["profile"] = profile_report(profiler, args.profile_top)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="整理流程性能测试")
+    parser.add_argument("--files", type=int, default=2000, help="文件数")
+    parser.add_argument("--depth", type=int, default=3, help="最大目录深度")
+    parser.add_argument("--ext-mix", default=DEFAULT_EXT_MIX, help="扩展名和比例，如 .jpg=3,.pdf=1")
+    parser.add_argument("--unknown-ratio", type=float, default=0.05, help="分不出类的文件的比例")
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="内容和之前某个文件完全相同的文件比例")
+    parser.add_argument("--collision-ratio", type=float, default=0.05, help="和之前某个文件同名（在别的目录）的文件比例")
+    parser.add_argument("--min-size", type=int, default=8192, help="典型文件大小（lognormal分布）")
+    parser.add_argument("--max-size", type=int, default=4 * 1024 * 1024, help="最大文件大小")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（相同参数生成相同的目录树）")
+    parser.add_argument("--policy", choices=CONFLICT_POLICIES, default="auto-rename", help="同名文件的处理方式")
+    parser.add_argument("--mode", choices=TRANSFER_MODES, default="copy", help="复制还是移动")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default=None, help="重复文件的处理方式（默认不查重）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="复制/移动文件的线程数")
+    parser.add_argument("--profile", action="store_true",
+                        help="用cProfile统计热点函数（cProfile只统计主线程，整理改为单线程运行）")
+    parser.add_argument("--profile-top", type=int, default=20, help="热点函数列出前几个")
+    parser.add_argument("--no-memory", dest="trace_memory", action="store_false",
+                        help="不统计内存峰值（tracemalloc会让耗时变长）")
+    parser.add_argument("--dir", default=None, help="生成目录树的位置（默认系统临时目录，结束后删除）")
+    parser.add_argument("--output", default=None, help="结果JSON文件（默认打印到屏幕）")
+    args = parser.parse_args()
+    if args.profile:
+        args.workers = 1
+
+    base = args.dir or tempfile.mkdtemp(prefix="t1_bench_")
+    try:
+        start = time.perf_counter()
+        tree_stats = generate_tree(base, args)
+        generate_seconds = time.perf_counter() - start
+
+        report = run_benchmark(base, tree_stats, args)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(base, ignore_errors=True)
+
+    environment = {"python": platform.python_version(), "platform": platform.platform(),
+                   "cpu_count": os.cpu_count()}
+    if resource is not None:
+        # ru_maxrss在Linux上单位是KB，macOS上是字节
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        environment["max_rss_mb"] = round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+    stages = report.pop("stages")
+    report = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("dir", "output")},
+        "environment": environment,
+        "tree": dict(tree_stats, generate_seconds=round(generate_seconds, 2)),
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 4),
+        **report,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
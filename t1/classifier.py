@@ -0,0 +1,284 @@
+"""
+文件分类器：规则预先编译成索引，分类一个文件只查几次字典，和规则条数无关
+
+规则可以写在JSON配置文件里（默认读取程序所在目录的 file_rules.json，没有就用内置规则）：
+
+    {
+        "categories": {                              按扩展名分类（可以写多段扩展名）
+            "图片": [".jpg", ".png"],
+            "压缩包": [".zip", ".tar.gz"]
+        },
+        "rules": [                                   特殊规则，按顺序匹配，优先于categories
+            {"category": "安装包", "glob": "*setup*.exe"},
+            {"category": "大视频", "ext": [".mp4", ".mov"], "min_size": 1073741824},
+            {"category": "空文件", "max_size": 0}
+        ],
+        "sniff": true                                按扩展名分不出来时，读文件开头几个字节判断类型
+    }
+"""
+import os
+import re
+import sys
+import json
+import fnmatch
+import hashlib
+import threading
+
+# 内置分类规则（没有配置文件时使用）
+DEFAULT_FILE_TYPES = {
+    "图片": [".jpg", ".jpeg", ".png", ".gif", ".bmp"],
+    "文档": [".pdf", ".docx", ".txt", ".md"],
+    "压缩包": [".zip", ".rar", ".7z", ".tar.gz", ".tgz"],
+    "音频": [".mp3", ".wav", ".flac", ".m4a"],
+    "视频": [".mp4", ".avi", ".mov"],
+    "代码": [".py", ".js", ".html"],
+    "应用程序": [".exe", ".msi", ".apk"],
+    "设计": [".psd", ".ai", ".fig"],
+    "电子书": [".epub", ".mobi"],
+    "配置": [".json", ".yaml", ".env"]
+}
+
+# 默认的规则配置文件名（放在程序所在目录）
+RULES_FILE_NAME = "file_rules.json"
+
+# 文件头 -> 对应的扩展名（识别出来后按扩展名分类）
+MAGIC_SIGNATURES = [
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"BM", ".bmp"),
+    (0, b"%PDF", ".pdf"),
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"Rar!\x1a\x07", ".rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"ID3", ".mp3"),
+    (0, b"fLaC", ".flac"),
+    (0, b"MZ", ".exe"),
+    (0, b"8BPS", ".psd"),
+    (4, b"ftyp", ".mp4"),
+]
+
+# RIFF容器要再看第8个字节开始的类型
+_RIFF_TYPES = {b"WAVE": ".wav", b"AVI ": ".avi"}
+
+# 识别文件类型只读开头这么多字节
+SNIFF_SIZE = 16
+
+
+def _normalize_ext(ext):
+    """扩展名统一成小写、以.开头"""
+    ext = ext.strip().lower()
+    return ext if ext.startswith(".") else "." + ext
+
+
+def _glob_key(pattern):
+    """glob规则末尾的固定扩展名（如 *setup*.exe -> .exe），用来把规则挂到扩展名索引上；没有就返回None"""
+    match = re.search(r"\.[^.*?\[\]]+$", pattern.lower())
+    # 规则写成 *.tar.gz 时只取最后一段（.gz），文件名的候选扩展名里一定有它
+    return match.group(0) if match else None
+
+
+class _Rule:
+    """一条编译好的特殊规则"""
+    __slots__ = ("order", "category", "exts", "glob", "regex", "min_size", "max_size")
+
+    def __init__(self, order, spec):
+        if "category" not in spec:
+            raise ValueError(f"第{order + 1}条规则缺少category: {spec}")
+        self.order = order
+        self.category = spec["category"]
+        self.exts = {_normalize_ext(ext) for ext in spec.get("ext", [])} or None
+        self.glob = spec.get("glob")
+        self.regex = re.compile(fnmatch.translate(self.glob.lower())) if self.glob else None
+        self.min_size = spec.get("min_size")
+        self.max_size = spec.get("max_size")
+
+    @property
+    def needs_size(self):
+        return self.min_size is not None or self.max_size is not None
+
+    def match(self, lower_name, suffixes, size):
+        if self.exts is not None and not any(ext in self.exts for ext in suffixes):
+            return False
+        if self.regex is not None and self.regex.match(lower_name) is None:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        return True
+
+
+class Classifier:
+    """文件分类器：扩展名字典索引 + 按扩展名分桶的特殊规则 + 可选的文件头识别"""
+
+    def __init__(self, file_types=None, rules=(), sniff=False):
+        """
+        :param file_types: 分类 -> 扩展名列表（默认用内置规则）
+        :param rules: 特殊规则列表（写法见模块说明），按顺序匹配，优先于扩展名分类
+        :param sniff: 按文件名分不出来时，是否读取文件头判断类型
+        """
+        self.file_types = {category: [_normalize_ext(ext) for ext in exts]
+                           for category, exts in (file_types or DEFAULT_FILE_TYPES).items()}
+        self.sniff = sniff
+        self._specs = list(rules)
+
+        # 扩展名 -> 分类（同一个扩展名写在多个分类里时，和原来一样取前面的分类）
+        self._ext_index = {}
+        for category, exts in self.file_types.items():
+            for ext in exts:
+                self._ext_index.setdefault(ext, category)
+
+        # 特殊规则：能确定扩展名的挂到扩展名下，其余的每个文件都要检查（数量通常很少）
+        self._rules = [_Rule(i, spec) for i, spec in enumerate(rules)]
+        self._rule_index = {}  # 扩展名 -> [规则]
+        self._generic_rules = []
+        for rule in self._rules:
+            keys = rule.exts
+            if keys is None and rule.regex is not None:
+                key = _glob_key(rule.glob)
+                keys = {key} if key else None
+            if keys is None:
+                self._generic_rules.append(rule)
+            else:
+                for key in keys:
+                    self._rule_index.setdefault(key, []).append(rule)
+        self.needs_size = any(rule.needs_size for rule in self._rules)
+
+        # 文件名最多看几段扩展名（如 .tar.gz 是两段）
+        keys = list(self._ext_index) + list(self._rule_index)
+        self._max_parts = max((key.count(".") for key in keys), default=1)
+
+        self._sniff_cache = {}  # (设备, inode, 修改时间) -> 识别出的扩展名
+        self._sniff_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path):
+        """从JSON配置文件创建分类器"""
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                config = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"规则配置文件格式错误: {path} - {e}")
+        return cls(config.get("categories"), config.get("rules", []), config.get("sniff", False))
+
+    def fingerprint(self):
+        """规则的指纹（规则一样指纹就一样，用来判断之前的分类结果还能不能用）"""
+        data = json.dumps([self.file_types, self._specs, self.sniff], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+    @property
+    def categories(self):
+        """所有分类名称（扩展名分类在前，特殊规则里新增的分类在后）"""
+        names = list(self.file_types)
+        for rule in self._rules:
+            if rule.category not in names:
+                names.append(rule.category)
+        return names
+
+    def category_for_ext(self, ext):
+        """根据单个扩展名获取分类（没有对应分类返回None）"""
+        return self._ext_index.get(ext.lower()) if ext else None
+
+    def _suffixes(self, lower_name):
+        """文件名的候选扩展名，从长到短（a.tar.gz -> .tar.gz、.gz）；开头的.不算（同os.path.splitext）"""
+        stem = lower_name.lstrip(".")
+        suffixes = []
+        end = len(stem)
+        for _ in range(self._max_parts):
+            pos = stem.rfind(".", 0, end)
+            if pos <= 0:
+                break
+            suffixes.append(stem[pos:])
+            end = pos
+        suffixes.reverse()
+        return suffixes
+
+    def classify(self, name, path=None, stat=None):
+        """
+        获取文件的分类
+        :param name: 文件名
+        :param path: 文件路径（有大小规则或开启文件头识别时才会用到）
+        :param stat: 文件的os.stat结果（已经有的话传进来，不再重复stat）
+        :return: 分类名称，分不出来返回None
+        """
+        lower_name = name.lower()
+        suffixes = self._suffixes(lower_name)
+
+        # 特殊规则：只检查挂在这些扩展名下的规则和通用规则
+        candidates = self._generic_rules
+        buckets = [self._rule_index[ext] for ext in suffixes if ext in self._rule_index]
+        if buckets:
+            candidates = sorted({rule.order: rule for bucket in buckets + [candidates] for rule in bucket}.values(),
+                                key=lambda rule: rule.order)
+        for rule in candidates:
+            if rule.needs_size:
+                if stat is None:
+                    if path is None:
+                        continue  # 不知道大小，大小规则不生效
+                    stat = os.stat(path)
+                size = stat.st_size
+            else:
+                size = None
+            if rule.match(lower_name, suffixes, size):
+                return rule.category
+
+        # 扩展名分类：长的扩展名优先（.tar.gz 在 .gz 之前）
+        for ext in suffixes:
+            category = self._ext_index.get(ext)
+            if category is not None:
+                return category
+
+        if self.sniff and path is not None:
+            ext = self.sniff_ext(path, stat)
+            if ext is not None:
+                return self._ext_index.get(ext)
+        return None
+
+    def sniff_ext(self, path, stat=None):
+        """读取文件头判断类型，返回对应的扩展名（结果按 (设备, inode, 修改时间) 缓存）"""
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        with self._sniff_lock:
+            if key in self._sniff_cache:
+                return self._sniff_cache[key]
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(SNIFF_SIZE)
+        except OSError:
+            return None
+        ext = None
+        if head.startswith(b"RIFF"):
+            ext = _RIFF_TYPES.get(head[8:12])
+        else:
+            for offset, magic, magic_ext in MAGIC_SIGNATURES:
+                if head.startswith(magic, offset):
+                    ext = magic_ext
+                    break
+        with self._sniff_lock:
+            self._sniff_cache[key] = ext
+        return ext
+
+
+def program_dir():
+    """程序所在目录（打包成exe后是exe所在目录）"""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def load_classifier(path=None):
+    """
+    加载分类器：指定了配置文件就读取它，否则读取程序目录下的 file_rules.json，都没有时用内置规则
+    """
+    if path is None:
+        default_path = os.path.join(program_dir(), RULES_FILE_NAME)
+        if not os.path.isfile(default_path):
+            return Classifier()
+        path = default_path
+    return Classifier.from_config(path)
@@ -0,0 +1,124 @@
+"""
+同名文件处理策略：整理前把所有文件的目标路径一次算好，不用每遇到一个同名文件就弹窗询问
+
+目标目录里已有的文件名在内存中建索引（每个目录只listdir一次），本次计划放进去的文件也登记到索引里，
+所以和已有文件重名、同一批文件之间重名，都在这一遍里处理掉。
+"""
+import os
+import filecmp
+
+# 同名文件处理策略
+CONFLICT_POLICIES = ("skip", "overwrite", "auto-rename", "keep-newer", "dedupe")
+
+# 索引中表示"目标目录里本来就有的文件"
+EXISTING = -1
+
+
+class DestinationIndex:
+    """目标目录中的文件名索引：目录 -> {文件名: 占用者}，占用者是EXISTING或占用这个名字的计划序号"""
+
+    def __init__(self):
+        self._dirs = {}
+
+    def _names(self, dest_dir):
+        names = self._dirs.get(dest_dir)
+        if names is None:
+            try:
+                entries = os.listdir(dest_dir)
+            except FileNotFoundError:
+                entries = []
+            # Windows下文件名不区分大小写
+            names = self._dirs[dest_dir] = {os.path.normcase(name): EXISTING for name in entries}
+        return names
+
+    def occupant(self, dest_dir, filename):
+        """占用这个文件名的是谁：EXISTING、计划序号，没有被占用返回None"""
+        return self._names(dest_dir).get(os.path.normcase(filename))
+
+    def claim(self, dest_dir, filename, plan_index):
+        """登记本次计划放入的文件"""
+        self._names(dest_dir)[os.path.normcase(filename)] = plan_index
+
+    def variants(self, dest_dir, filename):
+        """同名文件和之前自动改名的 name (1).ext、name (2).ext ...，生成 (文件名, 占用者)"""
+        names = self._names(dest_dir)
+        base, ext = os.path.splitext(filename)
+        name, n = filename, 0
+        while os.path.normcase(name) in names:
+            yield name, names[os.path.normcase(name)]
+            n += 1
+            name = f"{base} ({n}){ext}"
+
+    def free_name(self, dest_dir, filename):
+        """生成不重名的文件名：name (1).ext、name (2).ext ..."""
+        names = self._names(dest_dir)
+        base, ext = os.path.splitext(filename)
+        n = 1
+        while os.path.normcase(f"{base} ({n}){ext}") in names:
+            n += 1
+        return f"{base} ({n}){ext}"
+
+
+def resolve_collisions(entries, policy, index=None):
+    """
+    按策略一次算出所有文件的去向
+    :param entries: [(源文件路径, 目标目录, 文件名, 方式)]，方式为"copy"（复制）或"move"（移动）
+    :param policy: 同名文件处理策略（CONFLICT_POLICIES之一）
+    :param index: 目标目录索引（DestinationIndex），默认新建
+    :return: 计划 [[动作, 源文件路径, 目标文件路径, 方式]]，动作为：
+             "new"（目标不存在）、"overwrite"（覆盖）、"rename"（改名后放入）、
+             "skip"（保留原文件，不处理）、"duplicate"（内容完全相同，不处理）
+    """
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"未知的同名文件处理策略: {policy}")
+    index = index or DestinationIndex()
+    plan = []
+
+    for src, dest_dir, filename, mode in entries:
+        occupant = index.occupant(dest_dir, filename)
+        dst = os.path.join(dest_dir, filename)
+        if occupant is None:
+            action = "new"
+        elif policy == "skip":
+            action = "skip"
+        elif policy == "auto-rename":
+            action = "rename"
+        elif policy == "dedupe":
+            # 和同名文件、之前改名放入的文件都比较一下，有一样的就不用再放一份
+            same = any(same_content(src, _occupant_path(plan, other, os.path.join(dest_dir, name)))
+                       for name, other in index.variants(dest_dir, filename))
+            action = "duplicate" if same else "rename"
+        elif policy == "keep-newer" and not _is_newer(src, _occupant_path(plan, occupant, dst)):
+            action = "skip"
+        else:
+            action = "overwrite"
+
+        if action == "rename":
+            dst = os.path.join(dest_dir, index.free_name(dest_dir, filename))
+            index.claim(dest_dir, os.path.basename(dst), len(plan))
+        elif action == "overwrite" and occupant != EXISTING:
+            # 占用者是本批文件中前面的同名文件：前面的不再放入，由这个代替
+            action = plan[occupant][0] if plan[occupant][0] == "overwrite" else "new"
+            plan[occupant][0] = "skip"
+            index.claim(dest_dir, filename, len(plan))
+        elif action in ("new", "overwrite"):
+            index.claim(dest_dir, filename, len(plan))
+        plan.append([action, src, dst, mode])
+    return plan
+
+
+def _occupant_path(plan, occupant, dst):
+    """占用目标文件名的实际文件（已有文件就是目标路径本身，本批文件是它的源文件）"""
+    return dst if occupant == EXISTING else plan[occupant][1]
+
+
+def _is_newer(src, other):
+    """src是否比other新（按修改时间）"""
+    return os.stat(src).st_mtime_ns > os.stat(other).st_mtime_ns
+
+
+def same_content(src, other):
+    """两个文件内容是否完全相同（先比大小，大小相同再逐字节比较）"""
+    if os.path.getsize(src) != os.path.getsize(other):
+        return False
+    return filecmp.cmp(src, other, shallow=False)
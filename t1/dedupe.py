@@ -0,0 +1,181 @@
+"""
+重复文件识别：先按大小分组，大小相同的再比较开头和结尾的部分摘要，部分摘要也相同的才计算整个文件的摘要
+
+摘要按 (路径, 大小, 修改时间, inode) 缓存在目标文件夹的 .t1_digest_cache.sqlite 里，下次运行没变的文件不用再读。
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 重复文件的处理方式：skip 不再放入分类文件夹，hardlink 硬链接到已有的那份，reflink 共享数据块（不支持时复制）
+DEDUPE_MODES = ("skip", "hardlink", "reflink")
+
+# 缓存文件放在目标文件夹下（文件名以.t1_开头，整理时不会被当成要分类的文件）
+CACHE_FILE_NAME = ".t1_digest_cache.sqlite"
+
+# 部分摘要读取开头和结尾各这么多字节；文件不超过两块时部分摘要就是整个文件的摘要
+PARTIAL_BLOCK = 64 * 1024
+
+# 修改时间离本次运行太近的文件不写入缓存：同一时间精度内可能还会被改写，大小和时间都不变
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+def _to_sqlite_int(value):
+    """SQLite只支持有符号64位整数，超出范围的inode折算成负数保存"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def partial_digest(file_path, size):
+    """开头和结尾各PARTIAL_BLOCK字节的摘要"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        h.update(f.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            f.seek(max(PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+            h.update(f.read(PARTIAL_BLOCK))
+    return h.digest()
+
+
+def full_digest(file_path):
+    """整个文件的摘要（BLAKE2b，按块读取）"""
+    with open(file_path, 'rb') as f:
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=32)).digest()
+
+
+class DigestCache:
+    """文件摘要缓存：路径 -> (大小, 修改时间纳秒, inode, 部分摘要, 完整摘要)"""
+
+    def __init__(self, target_folder):
+        """
+        :param target_folder: 目标文件夹（缓存文件保存在这里）
+        """
+        self.target_folder = target_folder
+        self.cache_path = os.path.join(target_folder, CACHE_FILE_NAME)
+        self.entries = {}  # 上次运行保存的条目
+        self.used = {}  # 本次运行用到的条目（保存时只保留这些）
+        self.hits = 0  # 命中次数（不用读文件）
+        self.bytes_read = 0  # 计算摘要读取的字节数
+        self._racy_after = time.time_ns() - RACY_WINDOW_NS
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """读取上次保存的缓存（文件损坏就当没有缓存）"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            conn = sqlite3.connect(self.cache_path)
+            try:
+                rows = conn.execute("SELECT path, size, mtime_ns, inode, partial, full FROM digests").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return
+        for key, size, mtime_ns, inode, partial, full in rows:
+            self.entries[key] = [size, mtime_ns, inode, partial, full]
+
+    def _entry(self, file_path, stat):
+        """取出文件的缓存条目（stat变了就换成空条目）"""
+        key = os.path.relpath(file_path, self.target_folder)
+        signature = [stat.st_size, stat.st_mtime_ns, _to_sqlite_int(stat.st_ino)]
+        with self._lock:
+            entry = self.used.get(key) or self.entries.get(key)
+            if entry is None or entry[:3] != signature:
+                entry = signature + [None, None]
+            if stat.st_mtime_ns < self._racy_after:
+                self.used[key] = entry
+        return entry
+
+    def partial(self, file_path, stat):
+        entry = self._entry(file_path, stat)
+        if entry[3] is None:
+            entry[3] = partial_digest(file_path, stat.st_size)
+            with self._lock:
+                self.bytes_read += min(stat.st_size, 2 * PARTIAL_BLOCK)
+        else:
+            with self._lock:
+                self.hits += 1
+        return entry[3]
+
+    def full(self, file_path, stat):
+        entry = self._entry(file_path, stat)
+        if entry[4] is None:
+            entry[4] = full_digest(file_path)
+            with self._lock:
+                self.bytes_read += stat.st_size
+        else:
+            with self._lock:
+                self.hits += 1
+        return entry[4]
+
+    def save(self):
+        """保存本次用到的条目，没用到的旧条目一并淘汰"""
+        conn = sqlite3.connect(self.cache_path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                    "inode INTEGER, partial BLOB, full BLOB)"
+                )
+                conn.execute("DELETE FROM digests")
+                conn.executemany("INSERT INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+                                 ((key,) + tuple(entry) for key, entry in self.used.items()))
+        finally:
+            conn.close()
+
+
+def find_duplicates(file_paths, cache, workers=1):
+    """
+    找出内容完全相同的文件
+    :param file_paths: 文件路径列表，排在前面的优先作为保留的那份
+    :param cache: 摘要缓存（DigestCache）
+    :param workers: 计算摘要的线程数
+    :return: 重复的文件路径 -> 保留的那份的路径（空文件不算重复）
+    """
+    stats = {}
+    by_size = {}
+    for path in file_paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_size == 0 or path in stats:
+            continue
+        stats[path] = st
+        by_size.setdefault(st.st_size, []).append(path)
+
+    duplicates = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="t1-digest") as pool:
+        # 大小相同的才比较部分摘要
+        candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+        by_partial = _group(pool, candidates, lambda p: (stats[p].st_size, cache.partial(p, stats[p])))
+
+        for (size, _), group in by_partial.items():
+            if len(group) < 2:
+                continue
+            if size <= 2 * PARTIAL_BLOCK:
+                groups = [group]  # 部分摘要已经覆盖了整个文件
+            else:
+                groups = _group(pool, group, lambda p: cache.full(p, stats[p])).values()
+            for same in groups:
+                for path in same[1:]:
+                    duplicates[path] = same[0]
+    return duplicates
+
+
+def _group(pool, paths, key_func):
+    """并行计算每个文件的分组键并分组（组内保持原来的顺序；读不了的文件跳过）"""
+    def safe_key(path):
+        try:
+            return key_func(path)
+        except OSError:
+            return None
+
+    groups = {}
+    for path, key in zip(paths, pool.map(safe_key, paths)):
+        if key is not None:
+            groups.setdefault(key, []).append(path)
+    return groups
@@ -0,0 +1,99 @@
+"""
+文件复制/移动：同一个文件系统内移动只改名，不复制数据；跨盘时用内核复制（reflink/copy_file_range），数据不经过Python
+
+复制本身在和t2共用的 common/fast_copy.py 里
+"""
+import os
+import sys
+import errno
+import shutil
+import filecmp
+
+# 共用模块在仓库根目录的common文件夹（打包时由main.spec的pathex找到）
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from fast_copy import copy_file, try_reflink  # noqa: E402
+
+# 整理方式：copy 复制到分类文件夹（原文件保留，相当于备份），move 移动到分类文件夹
+TRANSFER_MODES = ("copy", "move")
+
+# 跨盘移动时先写到这个临时文件，校验通过再改成目标文件名
+TEMP_SUFFIX = ".t1part"
+
+
+def move_file(src, dst, verify=False):
+    """
+    移动文件（目标已存在时覆盖）
+    同一个文件系统内直接改名；跨文件系统时先复制到目标目录的临时文件，再改名为目标文件，最后删除源文件
+    :param verify: 跨文件系统时，删除源文件之前先逐字节核对复制结果，不一致就保留源文件并报错
+                   （不核对时也会先比较大小，复制不完整同样保留源文件）
+    :return: 是否只改了名（没有复制数据）
+    """
+    try:
+        os.replace(src, dst)
+        return True
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    temp = dst + TEMP_SUFFIX
+    try:
+        size = os.stat(src).st_size
+        copy_file(src, temp)
+        if os.path.getsize(temp) != size:
+            raise OSError(errno.EIO, f"复制不完整，已保留源文件: {src}")
+        if verify and not _same_file_content(src, temp):
+            raise OSError(errno.EIO, f"复制结果和源文件不一致，已保留源文件: {src}")
+        os.replace(temp, dst)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    os.remove(src)
+    return False
+
+
+def _same_file_content(src, dst):
+    """逐字节比较（先比大小）"""
+    if os.path.getsize(src) != os.path.getsize(dst):
+        return False
+    return filecmp.cmp(src, dst, shallow=False)
+
+
+def transfer(src, dst, mode, verify=False):
+    """
+    按整理方式把文件放到目标路径（目标已存在时覆盖）
+    :return: 是否只改了名（没有复制数据）
+    """
+    if mode == "move":
+        return move_file(src, dst, verify)
+    copy_file(src, dst)
+    return False
+
+
+def link_file(src, dst, how):
+    """
+    让dst和已有的src共享数据（目标已存在时覆盖）
+    :param how: "hardlink" 硬链接（同一个文件，不能跨磁盘）；"reflink" 共享数据块（之后各改各的，互不影响）
+    :return: 是否真的共享了数据；不支持时退回复制，返回False
+    """
+    temp = dst + TEMP_SUFFIX
+    try:
+        if how == "hardlink":
+            os.link(src, temp)
+            shared = True
+        else:
+            with open(src, 'rb') as fsrc, open(temp, 'wb') as fdst:
+                shared = try_reflink(fsrc.fileno(), fdst.fileno())
+            if shared:
+                shutil.copystat(src, temp)
+    except OSError:
+        shared = False
+    if not shared:
+        if os.path.exists(temp):
+            os.remove(temp)
+        copy_file(src, temp)
+    os.replace(temp, dst)
+    return shared
@@ -0,0 +1,43 @@
+"""
+目录遍历：用os.scandir一次拿到文件名和类型，不用对每个文件再stat；要跳过的目录直接不进入
+
+扫描本身在和t2共用的 common/dir_scanner.py 里，这里只是按t1的习惯包一层
+"""
+import os
+import sys
+
+# 共用模块在仓库根目录的common文件夹（打包时由main.spec的pathex找到）
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from dir_scanner import DEFAULT_WORKERS, scan_tree, scan_parallel  # noqa: E402
+
+
+def walk_files(root_dir, skip_dirs=(), on_error=None):
+    """
+    遍历目录下的所有文件（深度优先，同一目录下按scandir返回的顺序）
+    :param root_dir: 要遍历的目录
+    :param skip_dirs: 不进入的目录名称（任意层级，如分类文件夹和垃圾桶）
+    :param on_error: 打不开目录时的回调，参数为 (目录路径, 异常)；为None时忽略
+    :return: 生成 (文件路径, 文件名, DirEntry)，DirEntry.stat()在Windows上不用再访问磁盘
+    """
+    for _, entry in scan_tree(root_dir, skip_dirs, on_error=on_error or _ignore_error):
+        yield entry.path, entry.name, entry
+
+
+def list_files_parallel(dirs, need_stat=False, on_error=None, workers=DEFAULT_WORKERS):
+    """
+    多个线程同时列出多个目录里的文件（不进入子目录），如检查各个分类文件夹
+    :param dirs: {键: 目录路径}，不存在的目录跳过
+    :param need_stat: 在扫描线程里顺便读取stat，之后DirEntry.stat()不用再访问磁盘
+    :param on_error: 打不开目录时的回调，参数为 (目录路径, 异常)；为None时忽略
+    :return: 生成 (键, 文件路径, 文件名, DirEntry)，不同目录之间的顺序不固定
+    """
+    for key, _, entry in scan_parallel(dirs, workers, on_error=on_error or _ignore_error, max_depth=0,
+                                       need_stat=need_stat):
+        yield key, entry.path, entry.name, entry
+
+
+def _ignore_error(dirpath, error):
+    pass
@@ -1,26 +1,32 @@
 import os
-import shutil
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
-from tkinter import Toplevel, Label, Button
+import sys
+import argparse
+
+from classifier import load_classifier
+from conflict_policy import CONFLICT_POLICIES, resolve_collisions, same_content
+from dedupe import DEDUPE_MODES, DigestCache, find_duplicates
+from file_ops import TRANSFER_MODES, copy_file, move_file
+from file_walker import walk_files, list_files_parallel
+from organizer_state import OrganizerState
+from transfer_engine import DEFAULT_WORKERS, TransferEngine
+from watch_daemon import WatchDaemon
+
+# 文件分类器（程序目录下有 file_rules.json 时按其中的规则分类，否则用内置规则）
+classifier = load_classifier()
 
 # 文件分类规则
-file_types = {
-    "图片": [".jpg", ".jpeg", ".png", ".gif", ".bmp"],
-    "文档": [".pdf", ".docx", ".txt", ".md"],
-    "压缩包": [".zip", ".rar", ".7z"],
-    "音频": [".mp3", ".wav", ".flac", ".m4a"],
-    "视频": [".mp4", ".avi", ".mov"],
-    "代码": [".py", ".js", ".html"],
-    "应用程序": [".exe", ".msi", ".apk"],
-    "设计": [".psd", ".ai", ".fig"],
-    "电子书": [".epub", ".mobi"],
-    "配置": [".json", ".yaml", ".env"]
-}
+file_types = classifier.file_types
+
+# 工具自己的文件（摘要缓存等）以这个开头，整理时跳过
+TOOL_FILE_PREFIX = ".t1_"
 
 
 def select_target_folder():
     """弹出对话框让用户选择目标文件夹"""
+    # 用到界面时才导入tkinter，命令行模式启动更快，没有图形界面的服务器上也能运行
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # 隐藏主窗口
     folder = filedialog.askdirectory(
@@ -33,6 +39,9 @@ def select_target_folder():
 
 def ask_overwrite(filename):
     """自定义弹窗，按钮显示为：覆盖/跳过/重命名/终止"""
+    import tkinter as tk
+    from tkinter import Toplevel, Label, Button
+
     root = tk.Tk()
     root.withdraw()  # 隐藏主窗口
     root.attributes('-topmost', True)  # 置顶
@@ -68,11 +77,15 @@ def ask_overwrite(filename):
 def safe_move(src, dst):
     """安全备份文件（递归检测重命名冲突）"""
     if not os.path.exists(dst):  # 目标文件不存在，直接复制
-        shutil.copy2(src, dst)
+        copy_file(src, dst)
         print(f"[备份] {os.path.basename(src)} -> {os.path.dirname(dst)}")
         return True
 
     filename = os.path.basename(dst)
+    if same_content(src, dst):  # 内容完全相同，不用询问
+        print(f"[重复] {filename} 已存在且内容相同，跳过")
+        return False
+
     choice = ask_overwrite(filename)  # 调用弹窗函数
 
     if choice is None:  # 用户点击"终止"
@@ -81,10 +94,12 @@ def safe_move(src, dst):
         print(f"[跳过] 已保留原文件: {dst}")
         return False
     elif choice == "overwrite":  # 用户点击"覆盖"
-        shutil.copy2(src, dst)
+        copy_file(src, dst)
         print(f"[覆盖] 已更新文件: {dst}")
         return True
     elif choice == "rename":  # 用户点击"重命名"
+        from tkinter import simpledialog
+
         base, ext = os.path.splitext(filename)
         dirname = os.path.dirname(dst)
 
@@ -103,7 +118,7 @@ def safe_move(src, dst):
             new_dst = os.path.join(dirname, f"{new_name}{ext}")
 
             if not os.path.exists(new_dst):  # 新名称无冲突
-                shutil.copy2(src, new_dst)
+                copy_file(src, new_dst)
                 print(f"[重命名] 文件已备份为: {new_name}{ext}")
                 return True
             else:  # 新名称仍然冲突，继续循环
@@ -113,37 +128,100 @@ def safe_move(src, dst):
 
 def get_file_category(ext):
     """根据扩展名获取文件分类"""
-    ext = ext.lower()
-    for category, extensions in file_types.items():
-        if ext in extensions:
-            return category
-    return None
-
-
-def check_existing_folders(target_folder):
-    """检查已分类文件夹中的文件是否正确"""
-    for category in file_types.keys():
+    return classifier.category_for_ext(ext)
+
+
+def find_misplaced_files(target_folder, state=None, checked=None):
+    """
+    找出已分类文件夹中放错位置的文件
+    :param state: 整理记录（OrganizerState），修改时间和上次检查时相同的分类文件夹不再检查
+    :param checked: 传入字典时，记下这次检查的分类文件夹 -> 修改时间纳秒
+                    （里面放错的文件处理完之后，调用方再用_record_checked_dirs写进整理记录）
+    :return: 生成 (文件路径, 文件名, 所在分类, 正确分类)，正确分类为None表示应该放进垃圾桶
+    """
+    category_dirs = {}
+    for category in classifier.categories:
         category_dir = os.path.join(target_folder, category)
-        if os.path.exists(category_dir):
-            for filename in os.listdir(category_dir):
-                filepath = os.path.join(category_dir, filename)
-                if os.path.isfile(filepath):
-                    _, ext = os.path.splitext(filename)
-                    correct_category = get_file_category(ext)
-                    if correct_category != category:
-                        # 移动到正确的分类
-                        correct_dir = os.path.join(target_folder,
-                                                   correct_category) if correct_category else os.path.join(
-                            target_folder, "垃圾桶")
-                        os.makedirs(correct_dir, exist_ok=True)
-                        dst_path = os.path.join(correct_dir, filename)
-                        try:
-                            safe_move(filepath, dst_path)
-                        except InterruptedError:
-                            print("操作被用户取消")
-                            break  # 终止整个分类流程
-                        print(
-                            f"[纠正] {filename} 从 {category} 移动到 {correct_category if correct_category else '垃圾桶'}")
+        try:
+            mtime_ns = os.stat(category_dir).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        if state is not None and state.dir_unchanged(category, mtime_ns):
+            continue
+        if checked is not None:
+            checked[category] = mtime_ns
+        category_dirs[category] = category_dir
+
+    # 各分类文件夹同时扫描，结果按分类的顺序输出（每次整理的结果一致）
+    need_stat = classifier.needs_size or classifier.sniff
+    found = {category: [] for category in category_dirs}
+    for category, filepath, filename, entry in list_files_parallel(category_dirs, need_stat, _report_walk_error):
+        try:
+            stat = entry.stat() if need_stat else None
+        except OSError as e:
+            print(f"[错误] 无法读取 {filepath}: {str(e)}")
+            continue
+        correct_category = classifier.classify(filename, filepath, stat)
+        if correct_category != category:
+            found[category].append((filepath, filename, category, correct_category))
+    for category in category_dirs:
+        yield from found[category]
+
+
+def find_unsorted_files(target_folder, state=None):
+    """
+    找出还没有整理的文件（跳过已经分类的文件夹和垃圾桶）
+    :param state: 整理记录（OrganizerState），和上次整理时相比没变过的文件跳过
+    :return: 生成 (文件路径, 文件名, 分类, stat)，分类为None表示要放进垃圾桶；不需要stat时为None
+    """
+    skip_dirs = set(classifier.categories) | {"垃圾桶"}
+    # 有整理记录、大小规则或要识别文件头时才需要stat，直接用遍历时拿到的信息
+    need_stat = state is not None or classifier.needs_size or classifier.sniff
+    for filepath, filename, entry in walk_files(target_folder, skip_dirs, _report_walk_error):
+        if filename.startswith(TOOL_FILE_PREFIX):
+            continue
+        try:
+            stat = entry.stat() if need_stat else None
+        except OSError as e:
+            print(f"[错误] 无法读取 {filepath}: {str(e)}")
+            continue
+        if state is not None and state.unchanged(filepath, stat):
+            continue
+        # 获取文件分类（扩展名、特殊规则、文件头）
+        yield filepath, filename, classifier.classify(filename, filepath, stat), stat
+
+
+def _report_walk_error(dirpath, error):
+    print(f"[错误] 无法读取文件夹 {dirpath}: {str(error)}")
+
+
+def _record_checked_dirs(state, checked, unfinished=()):
+    """
+    把检查完的分类文件夹写进整理记录（下次修改时间没变就不再检查）
+    :param checked: find_misplaced_files记下的 分类文件夹 -> 修改时间纳秒
+    :param unfinished: 里面还有放错的文件没处理好的分类（不记录，下次重新检查）
+    """
+    for category, mtime_ns in checked.items():
+        if category not in unfinished:
+            state.record_dir(category, mtime_ns)
+
+
+def check_existing_folders(target_folder, state=None):
+    """检查已分类文件夹中的文件是否正确（有整理记录时跳过没变过的分类文件夹）"""
+    checked = {}
+    for filepath, filename, category, correct_category in list(find_misplaced_files(target_folder, state, checked)):
+        # 移动到正确的分类
+        correct_dir = os.path.join(target_folder, correct_category or "垃圾桶")
+        os.makedirs(correct_dir, exist_ok=True)
+        dst_path = os.path.join(correct_dir, filename)
+        try:
+            safe_move(filepath, dst_path)
+        except InterruptedError:
+            print("操作被用户取消")
+            return  # 终止整个分类流程（这次检查的分类文件夹都不记录，下次重新检查）
+        print(f"[纠正] {filename} 从 {category} 移动到 {correct_category if correct_category else '垃圾桶'}")
+    if state is not None:
+        _record_checked_dirs(state, checked)
 
 
 def organize_files():
@@ -156,55 +234,293 @@ def organize_files():
 
     # 检查文件夹是否存在
     if not os.path.exists(target_folder):
+        from tkinter import messagebox
         messagebox.showerror("错误", f"文件夹不存在: {target_folder}")
         return
 
     print(f"=== 开始整理: {target_folder} ===")
 
+    # 整理记录：上次整理过、之后没变过的文件和分类文件夹直接跳过
+    state = OrganizerState(target_folder, classifier.fingerprint())
+
     # 先检查已有分类文件夹中的文件是否正确
-    check_existing_folders(target_folder)
+    check_existing_folders(target_folder, state)
 
     # 创建垃圾桶文件夹
     trash_dir = os.path.join(target_folder, "垃圾桶")
     os.makedirs(trash_dir, exist_ok=True)
 
     # 递归处理所有文件和子文件夹
-    for root, dirs, files in os.walk(target_folder):
-        # 跳过已经分类的文件夹和垃圾桶
-        if os.path.basename(root) in file_types.keys() or os.path.basename(root) == "垃圾桶":
-            continue
+    for filepath, filename, category, stat in find_unsorted_files(target_folder, state):
+        if category:
+            # 创建分类文件夹
+            dest_dir = os.path.join(target_folder, category)
+            os.makedirs(dest_dir, exist_ok=True)
+
+            # 复制文件到分类文件夹
+            dst_path = os.path.join(dest_dir, filename)
+            try:
+                if safe_move(filepath, dst_path):  # 调用安全移动函数
+                    print(f"[备份] {filename} -> {category}")
+                    state.record(filepath, stat, category, dst_path, "new")
+                else:
+                    state.record(filepath, stat, category, None, "skip")
+            except InterruptedError:
+                print("操作被用户取消")
+                break
+            except Exception as e:
+                print(f"[错误] 无法备份 {filename}: {str(e)}")
+        else:
+            # 移动到垃圾桶
+            try:
+                move_file(filepath, os.path.join(trash_dir, filename))
+                print(f"[清理] {filename} -> 垃圾桶")
+            except Exception as e:
+                print(f"[错误] 无法移动 {filename} 到垃圾桶: {str(e)}")
+
+    state.save()
+    print("=== 整理完成 ===")
 
-        for filename in files:
-            filepath = os.path.join(root, filename)
-
-            # 获取文件扩展名
-            _, ext = os.path.splitext(filename)
-            category = get_file_category(ext)
-
-            if category:
-                # 创建分类文件夹
-                dest_dir = os.path.join(target_folder, category)
-                os.makedirs(dest_dir, exist_ok=True)
-
-                # 复制文件到分类文件夹
-                dst_path = os.path.join(dest_dir, filename)
-                try:
-                    if safe_move(filepath, dst_path):  # 调用安全移动函数
-                        print(f"[备份] {filename} -> {category}")
-                except Exception as e:
-                    print(f"[错误] 无法备份 {filename}: {str(e)}")
-            else:
-                # 移动到垃圾桶
-                try:
-                    shutil.move(filepath, os.path.join(trash_dir, filename))
-                    print(f"[清理] {filename} -> 垃圾桶")
-                except Exception as e:
-                    print(f"[错误] 无法移动 {filename} 到垃圾桶: {str(e)}")
 
-    print("=== 整理完成 ===")
+def organize_folder(target_folder, policy, mode="copy", verify=False, workers=DEFAULT_WORKERS, dedupe=None,
+                    incremental=True):
+    """
+    无界面整理：先收集所有要处理的文件，按同名文件处理策略一次算好每个文件的去向，再统一执行，全程不弹窗
+    :param target_folder: 要整理的文件夹
+    :param policy: 同名文件处理策略（skip/overwrite/auto-rename/keep-newer/dedupe）
+    :param mode: copy 复制到分类文件夹（原文件保留，相当于备份）；move 移动到分类文件夹（同一个磁盘内只改名）
+    :param verify: 跨磁盘移动时，删除原文件之前先核对复制结果
+    :param workers: 同时复制/移动文件的线程数
+    :param dedupe: 重复文件的处理方式（skip/hardlink/reflink），为None时不查重
+    :param incremental: 为True时按整理记录跳过上次整理过、之后没变过的文件；为False时全部重新整理
+    :return: (各动作的文件数, 复制/移动的统计TransferStats)
+    """
+    print(f"=== 开始整理: {target_folder} ===")
+    state = OrganizerState(target_folder, classifier.fingerprint(), reset=not incremental)
+
+    # 放错分类的文件放到正确的分类；未整理的文件放到分类文件夹，分不出类的移到垃圾桶
+    checked = {}
+    misplaced = list(find_misplaced_files(target_folder, state, checked))
+    entries = [(filepath, os.path.join(target_folder, correct_category or "垃圾桶"), filename, mode)
+               for filepath, filename, _, correct_category in misplaced]
+    sources = {}  # 未整理的文件 -> (stat, 分类)，整理完写进整理记录
+    for filepath, filename, category, stat in find_unsorted_files(target_folder, state):
+        sources[filepath] = (stat, category)
+        entries.append(_source_entry(target_folder, filepath, filename, category, mode))
+
+    counts, saved, stats = organize_entries(target_folder, entries, sources, state, policy, mode, verify, workers,
+                                            dedupe)
+    # 有文件处理失败时，里面有放错文件的分类文件夹下次还要再检查
+    _record_checked_dirs(state, checked, {item[2] for item in misplaced} if counts["error"] else ())
+    state.save()
+    if state.skipped or state.skipped_dirs:
+        print(f"[增量] 跳过上次整理后没变过的文件 {state.skipped} 个、分类文件夹 {state.skipped_dirs} 个")
+    print(f"=== 整理完成：新增 {counts['new']}，覆盖 {counts['overwrite']}，重命名 {counts['rename']}，"
+          f"跳过 {counts['skip']}，重复 {counts['duplicate']}，失败 {counts['error']} ===")
+    if dedupe is not None:
+        print(f"重复文件节省空间: {saved / 1024 / 1024:.2f} MB")
+    return counts, stats
+
+
+def organize_paths(target_folder, paths, state, policy, mode="copy", verify=False, workers=DEFAULT_WORKERS,
+                   dedupe=None):
+    """
+    只整理指定的文件（监听模式每攒够一批新文件调用一次），参数同organize_folder
+    :param paths: 文件路径列表（已经不存在的跳过）
+    :param state: 整理记录（OrganizerState）
+    :return: 各动作的文件数
+    """
+    state.start_batch()
+    entries = []
+    sources = {}
+    for filepath in paths:
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue  # 已经被删掉或改名
+        if not os.path.isfile(filepath) or state.unchanged(filepath, stat):
+            continue
+        filename = os.path.basename(filepath)
+        category = classifier.classify(filename, filepath, stat)
+        sources[filepath] = (stat, category)
+        entries.append(_source_entry(target_folder, filepath, filename, category, mode))
+
+    counts, _, _ = organize_entries(target_folder, entries, sources, state, policy, mode, verify, workers, dedupe)
+    state.save(prune=False)
+    return counts
+
+
+def watch_folder(target_folder, policy, mode="copy", verify=False, workers=DEFAULT_WORKERS, dedupe=None,
+                 force_polling=False):
+    """
+    监听模式：先整理一遍已有的文件，之后常驻运行，新文件写完后自动整理（不弹出任何窗口），按Ctrl+C停止
+    参数同organize_folder
+    :param force_polling: 不使用inotify，定时扫描
+    """
+    skip_dirs = set(classifier.categories) | {"垃圾桶"}
+    state = None
+
+    def handle_batch(paths):
+        organize_paths(target_folder, paths, state, policy, mode, verify, workers, dedupe)
+
+    # 先开始监听再整理已有的文件，整理期间新来的文件也不会漏掉
+    daemon = WatchDaemon(target_folder, handle_batch, skip_dirs, force_polling=force_polling)
+    organize_folder(target_folder, policy, mode, verify, workers, dedupe)
+    state = OrganizerState(target_folder, classifier.fingerprint())
+    print(f"=== 开始监听: {target_folder}（{daemon.mode}），按Ctrl+C停止 ===")
+    daemon.run()
+    print(f"=== 停止监听：共处理 {daemon.stats['files']} 个文件，{daemon.stats['batches']} 批，"
+          f"最长等待 {daemon.stats['max_latency']:.2f} 秒，队列最多 {daemon.stats['max_queue']} 个 ===")
+
+
+def _source_entry(target_folder, filepath, filename, category, mode):
+    """未整理的文件放到分类文件夹，分不出类的移到垃圾桶"""
+    if category:
+        return filepath, os.path.join(target_folder, category), filename, mode
+    return filepath, os.path.join(target_folder, "垃圾桶"), filename, "move"
+
+
+def organize_entries(target_folder, entries, sources, state, policy, mode, verify, workers, dedupe):
+    """
+    查重、算好每个文件的去向、并行复制/移动，处理结果写进整理记录（不保存）
+    :param entries: [(源文件路径, 目标目录, 文件名, 方式)]
+    :param sources: 未整理的文件 -> (stat, 分类)
+    :return: (各动作的文件数, 重复文件节省的字节数, 复制/移动的统计TransferStats)
+    """
+    duplicates = {}
+    skipped, saved = 0, 0
+    if dedupe is not None:
+        duplicates = find_entry_duplicates(target_folder, entries, workers)
+        kept = []
+        for entry in entries:
+            src, dest_dir, filename, entry_mode = entry
+            canonical = duplicates.get(src)
+            # 目标位置已经是内容相同的文件，或者选择了跳过重复文件
+            if canonical is not None and (dedupe == "skip" or os.path.normcase(canonical) == os.path.normcase(
+                    os.path.join(dest_dir, filename))):
+                print(f"[重复] {filename} 和 {os.path.relpath(canonical, target_folder)} 内容相同，跳过")
+                if src in sources:
+                    state.record(src, sources[src][0], sources[src][1], None, "duplicate")
+                skipped += 1
+                if entry_mode == "copy":
+                    saved += os.path.getsize(src)
+                continue
+            kept.append(entry)
+        entries = kept
+
+    plan = resolve_collisions(entries, policy)
+    links = _link_sources(plan, duplicates) if dedupe in ("hardlink", "reflink") else None
+
+    engine = TransferEngine(workers, verify)
+    counts = engine.run(plan, links, dedupe)
+    counts["duplicate"] += skipped
+
+    for action, src, dst, _ in plan:
+        if src not in sources:
+            continue
+        if src in engine.failed:
+            state.forget(src)
+        else:
+            stat, category = sources[src]
+            state.record(src, stat, category, dst if action in ("new", "overwrite", "rename") else None, action)
+    return counts, saved + engine.stats.bytes_saved, engine.stats
+
+
+def find_entry_duplicates(target_folder, entries, workers=DEFAULT_WORKERS):
+    """
+    找出要整理的文件中内容重复的（和目标文件夹里已有的文件比，也和同一批文件比）
+    :param entries: [(源文件路径, 目标目录, 文件名, 方式)]
+    :return: 重复的源文件路径 -> 内容相同的文件路径（目标文件夹中已有的优先，其次是同一批中排在前面的）
+    """
+    existing = []
+    for dest_dir in sorted({entry[1] for entry in entries}):
+        try:
+            with os.scandir(dest_dir) as it:
+                existing.extend(e.path for e in it if e.is_file() and not e.name.startswith(TOOL_FILE_PREFIX))
+        except FileNotFoundError:
+            pass
+
+    cache = DigestCache(target_folder)
+    duplicates = find_duplicates(existing + [entry[0] for entry in entries], cache, workers)
+    cache.save()
+    print(f"[查重] 重复文件 {len(duplicates)} 个（摘要缓存命中 {cache.hits} 次，"
+          f"读取 {cache.bytes_read / 1024 / 1024:.2f} MB）")
+    return duplicates
+
+
+def _link_sources(plan, duplicates):
+    """
+    重复文件要链接到哪个文件：计划序号 -> 文件路径
+    内容相同的文件本次也放进了分类文件夹就链接到放进去的那份，否则链接到它原来的位置
+    """
+    rows = {row[1]: row for row in plan}
+    # 本次会被覆盖的已有文件内容会变，不能作为链接的来源
+    replaced = {row[2] for row in plan if row[0] == "overwrite"}
+    links = {}
+    for i, (action, src, dst, mode) in enumerate(plan):
+        canonical = duplicates.get(src)
+        if canonical is None or action in ("skip", "duplicate"):
+            continue
+        row = rows.get(canonical)
+        if row is not None and row[0] in ("new", "overwrite", "rename"):
+            links[i] = row[2]
+        elif canonical not in replaced:
+            links[i] = canonical
+    return links
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="文件自动分类工具")
+    parser.add_argument("folder", nargs="?",
+                        help="要整理的文件夹；指定后不弹出任何窗口（不指定时弹窗选择）")
+    parser.add_argument("--policy", choices=CONFLICT_POLICIES,
+                        help="同名文件的处理方式：skip跳过、overwrite覆盖、auto-rename自动改名为 name (1).ext、"
+                             "keep-newer保留较新的、dedupe内容相同就跳过否则改名（指定文件夹时默认skip；"
+                             "不指定文件夹也不指定策略时逐个弹窗询问）")
+    parser.add_argument("--mode", choices=TRANSFER_MODES, default="copy",
+                        help="copy复制到分类文件夹，原文件保留（默认，相当于备份）；"
+                             "move移动到分类文件夹，同一个磁盘内只改名，不复制数据")
+    parser.add_argument("--verify", action="store_true",
+                        help="move模式跨磁盘移动时，先逐字节核对复制结果再删除原文件")
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES,
+                        help="查找内容完全相同的文件：skip只保留一份、hardlink硬链接到已有的那份、"
+                             "reflink共享数据块（文件系统不支持时复制）；不指定时不查重")
+    parser.add_argument("--full", action="store_true",
+                        help="不使用整理记录，所有文件和分类文件夹都重新检查、重新整理")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"同时复制/移动文件的线程数（默认{DEFAULT_WORKERS}，1为逐个处理）")
+    parser.add_argument("--rules", help="分类规则配置文件（默认读取程序目录下的 file_rules.json）")
+    parser.add_argument("--watch", action="store_true",
+                        help="整理完后继续监听文件夹，新文件写完后自动整理（需要指定文件夹，按Ctrl+C停止）")
+    parser.add_argument("--polling", action="store_true",
+                        help="监听模式不使用inotify，每2秒扫描一次（网络磁盘等收不到通知的文件夹）")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    print("=== 文件整理开始 ===")
-    organize_files()
-    print("=== 整理完成 ===")
\ No newline at end of file
+    args = parse_args()
+    if args.rules:
+        classifier = load_classifier(args.rules)
+        file_types = classifier.file_types
+
+    if args.watch and args.folder is None:
+        print("[错误] 监听模式需要指定文件夹")
+        sys.exit(2)
+    if args.folder is None and args.policy is None:
+        print("=== 文件整理开始 ===")
+        organize_files()
+        print("=== 整理完成 ===")
+    else:
+        folder = args.folder or select_target_folder()
+        if not folder:
+            print("[取消] 未选择文件夹")
+        elif not os.path.isdir(folder):
+            print(f"[错误] 文件夹不存在: {folder}")
+            sys.exit(1)
+        elif args.watch:
+            watch_folder(folder, args.policy or "skip", args.mode, args.verify, args.workers, args.dedupe,
+                         args.polling)
+        else:
+            organize_folder(folder, args.policy or "skip", args.mode, args.verify, args.workers, args.dedupe,
+                            incremental=not args.full)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+整理记录：记下每个文件整理时的 (大小, 修改时间) 和放到了哪里，再次整理时没变过的文件直接跳过
+
+记录保存在目标文件夹的 .t1_state.sqlite 里：
+    files   源文件（相对路径） -> 大小、修改时间、分类、放到了哪里、当时的处理结果
+    dirs    分类文件夹 -> 上次检查时的修改时间（文件夹里增删文件时修改时间会变，没变就不用再检查）
+    meta    分类规则的指纹（规则改了，之前的分类结果都不作数，全部重新整理）
+"""
+import os
+import time
+import sqlite3
+
+# 记录文件放在目标文件夹下（文件名以.t1_开头，整理时不会被当成要分类的文件）
+STATE_FILE_NAME = ".t1_state.sqlite"
+
+# 修改时间离本次运行太近的文件不记录：同一时间精度内可能还会被改写，大小和时间都不变
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+class OrganizerState:
+    """整理记录（整理开始时全部读进内存，结束时一次写回）"""
+
+    def __init__(self, target_folder, rules_fingerprint, reset=False):
+        """
+        :param target_folder: 目标文件夹（记录文件保存在这里）
+        :param rules_fingerprint: 分类规则的指纹，和上次不一样时忽略之前的记录
+        :param reset: 为True时忽略之前的记录，全部重新整理
+        """
+        self.target_folder = target_folder
+        self.state_path = os.path.join(target_folder, STATE_FILE_NAME)
+        self.rules_fingerprint = rules_fingerprint
+        self.files = {}  # 相对路径 -> (大小, 修改时间纳秒, 分类, 目标相对路径, 处理结果)
+        self.dirs = {}  # 分类文件夹名称 -> 修改时间纳秒
+        self.seen = set()  # 本次遍历时还在的源文件（保存时其余的记录淘汰）
+        self._dirty = set()  # 上次保存之后改过的记录（只保存变化时用）
+        self.skipped = 0  # 没变过、直接跳过的文件数
+        self.skipped_dirs = 0  # 没变过、不用检查的分类文件夹数
+        self._racy_after = 0  # 修改时间不早于这个时刻的文件不记录
+        self.start_batch()
+
+        if not reset:
+            self._load()
+
+    def _load(self):
+        """读取上次的记录（文件损坏或规则变了就当没有记录）"""
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            conn = sqlite3.connect(self.state_path)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+                if row is None or row[0] != self.rules_fingerprint:
+                    return
+                files = conn.execute("SELECT path, size, mtime_ns, category, dest, action FROM files").fetchall()
+                dirs = conn.execute("SELECT path, mtime_ns FROM dirs").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return
+        self.files = {path: tuple(rest) for path, *rest in files}
+        self.dirs = dict(dirs)
+
+    def start_batch(self):
+        """开始处理一批文件（监听模式常驻运行，"刚修改过"要以这一批开始的时间为准，不能一直用启动时间）"""
+        self._racy_after = time.time_ns() - RACY_WINDOW_NS
+
+    def _key(self, file_path):
+        return os.path.relpath(file_path, self.target_folder)
+
+    def unchanged(self, file_path, stat):
+        """源文件和上次整理时相比没有变过（大小、修改时间都相同）"""
+        key = self._key(file_path)
+        self.seen.add(key)
+        entry = self.files.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self.skipped += 1
+            return True
+        return False
+
+    def record(self, file_path, stat, category, dest_path, action):
+        """记录一个已经处理过的源文件"""
+        key = self._key(file_path)
+        self.seen.add(key)
+        self._dirty.add(key)
+        if stat.st_mtime_ns >= self._racy_after:
+            self.files.pop(key, None)  # 刚修改过的文件下次还要再看
+            return
+        dest = self._key(dest_path) if dest_path else None
+        self.files[key] = (stat.st_size, stat.st_mtime_ns, category, dest, action)
+
+    def forget(self, file_path):
+        """处理失败的文件不记录，下次重新处理"""
+        key = self._key(file_path)
+        self._dirty.add(key)
+        self.files.pop(key, None)
+
+    def dir_unchanged(self, category, mtime_ns):
+        """分类文件夹的修改时间和上次检查时相同（期间没有增删文件）"""
+        if self.dirs.get(category) == mtime_ns:
+            self.skipped_dirs += 1
+            return True
+        return False
+
+    def record_dir(self, category, mtime_ns):
+        """记录检查时分类文件夹的修改时间（之后本次整理再往里放文件，下次会再检查一遍）"""
+        if mtime_ns < self._racy_after:
+            self.dirs[category] = mtime_ns
+        else:
+            self.dirs.pop(category, None)
+
+    def save(self, prune=True):
+        """
+        保存记录
+        :param prune: 为True时整个重写，本次遍历时已经不在的源文件一并淘汰（完整整理一遍之后）；
+                      为False时只写入上次保存之后变化的记录（监听模式每处理一批保存一次）
+        """
+        conn = sqlite3.connect(self.state_path)
+        try:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                             "mtime_ns INTEGER, category TEXT, dest TEXT, action TEXT)")
+                conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER)")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('rules', ?)", (self.rules_fingerprint,))
+                if prune:
+                    conn.execute("DELETE FROM files")
+                    conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                     ((key,) + entry for key, entry in self.files.items() if key in self.seen))
+                else:
+                    conn.executemany("DELETE FROM files WHERE path = ?",
+                                     ((key,) for key in self._dirty if key not in self.files))
+                    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                     ((key,) + self.files[key] for key in self._dirty if key in self.files))
+                conn.execute("DELETE FROM dirs")
+                conn.executemany("INSERT INTO dirs VALUES (?, ?)", self.dirs.items())
+            self._dirty = set()
+        finally:
+            conn.close()
@@ -0,0 +1,181 @@
+"""
+并行执行整理计划：复制/移动交给线程池（同时在执行的文件数有上限），主线程定时打印进度和速度
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from file_ops import transfer, link_file
+
+# 默认线程数（复制主要在等磁盘，线程可以比CPU核数多）
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# 每个线程最多排队这么多个文件，计划再大也不会一次把所有任务塞进线程池
+QUEUE_PER_WORKER = 4
+
+# 打印进度的间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+
+class TransferStats:
+    """整理进度：已处理的文件数、复制的字节数、改名移动的文件数、链接重复文件节省的字节数、出错数、速度"""
+
+    def __init__(self, files_total=0):
+        self.files_total = files_total
+        self.files_done = 0
+        self.bytes_copied = 0  # 实际复制的字节数（同一磁盘内改名移动不算）
+        self.renamed = 0  # 只改名、没有复制数据的文件数
+        self.bytes_saved = 0  # 重复文件改成链接（不再复制）节省的字节数
+        self.errors = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, copied_bytes=0, renamed=False, error=False, saved_bytes=0):
+        with self._lock:
+            self.files_done += 1
+            self.bytes_copied += copied_bytes
+            self.renamed += renamed
+            self.bytes_saved += saved_bytes
+            self.errors += error
+
+    def snapshot(self):
+        """当前进度（字典），速度按开始到现在的平均值计算"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "bytes_copied": self.bytes_copied,
+                "renamed": self.renamed,
+                "bytes_saved": self.bytes_saved,
+                "errors": self.errors,
+                "elapsed": round(elapsed, 3),
+                "files_per_sec": round(self.files_done / elapsed, 1) if elapsed > 0 else 0.0,
+                "mb_per_sec": round(self.bytes_copied / elapsed / 1024 / 1024, 2) if elapsed > 0 else 0.0,
+            }
+
+    def format(self):
+        s = self.snapshot()
+        return (f"{s['files_done']}/{s['files_total']} 个文件，复制 {s['bytes_copied'] / 1024 / 1024:.1f} MB，"
+                f"{s['files_per_sec']} 个/秒，{s['mb_per_sec']} MB/秒，出错 {s['errors']}")
+
+
+class TransferEngine:
+    """按计划（resolve_collisions的结果）并行复制/移动文件"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, verify=False, show_progress=True):
+        """
+        :param workers: 线程数（1为在主线程中逐个处理）
+        :param verify: 跨磁盘移动时，删除原文件之前先核对复制结果
+        :param show_progress: 是否定时打印进度
+        """
+        self.workers = max(1, workers)
+        self.verify = verify
+        self.show_progress = show_progress
+        self.stats = TransferStats()
+        self.counts = dict.fromkeys(("new", "overwrite", "rename", "skip", "duplicate", "error"), 0)
+        self.failed = set()  # 处理失败的源文件
+        self._lock = threading.Lock()
+        self._print_lock = threading.Lock()
+        self._last_progress = 0.0
+
+    def run(self, plan, links=None, link_mode="hardlink"):
+        """
+        执行计划
+        :param links: 重复文件：计划序号 -> 内容相同的文件路径，这些文件链接到它而不是复制
+                      （在其他文件都处理完之后再执行，要链接的文件可能是本次才放进去的）
+        :param link_mode: 链接方式，"hardlink"或"reflink"
+        :return: 各动作的文件数
+        """
+        links = links or {}
+        jobs = []
+        linked_jobs = []
+        for i, (action, src, dst, mode) in enumerate(plan):
+            if action in ("skip", "duplicate"):
+                self.counts[action] += 1
+            elif i in links:
+                linked_jobs.append((action, src, dst, mode, (links[i], link_mode)))
+            else:
+                jobs.append((action, src, dst, mode, None))
+        self.stats = TransferStats(len(jobs) + len(linked_jobs))
+        self._last_progress = time.perf_counter()
+
+        # 目标目录先在主线程里建好，线程里只管复制/移动
+        for dest_dir in {os.path.dirname(job[2]) for job in jobs + linked_jobs}:
+            try:
+                os.makedirs(dest_dir, exist_ok=True)
+            except OSError as e:
+                print(f"[错误] 无法创建文件夹 {dest_dir}: {str(e)}")
+
+        for batch in (jobs, linked_jobs):
+            self._run_batch(batch)
+
+        if self.show_progress and (jobs or linked_jobs):
+            self._print(f"[进度] {self.stats.format()}")
+        return self.counts
+
+    def _run_batch(self, jobs):
+        """执行一批任务，全部完成后才返回"""
+        if self.workers == 1:
+            for job in jobs:
+                self._run_job(job)
+            return
+        slots = threading.BoundedSemaphore(self.workers * QUEUE_PER_WORKER)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="t1-transfer") as pool:
+            for job in jobs:
+                slots.acquire()
+                future = pool.submit(self._run_job, job)
+                future.add_done_callback(lambda _: slots.release())
+
+    def _run_job(self, job):
+        """线程池中执行：处理一个文件，出错只记录，不影响其他文件"""
+        action, src, dst, mode, link = job
+        try:
+            size = os.stat(src).st_size
+            if link is None:
+                renamed = transfer(src, dst, mode, self.verify)
+                saved = 0
+            else:
+                # 重复文件：链接到内容相同的那份，移动模式下再删掉原文件
+                renamed = False
+                saved = size if link_file(link[0], dst, link[1]) else 0
+                if mode == "move":
+                    os.remove(src)
+        except Exception as e:
+            self.stats.add(error=True)
+            with self._lock:
+                self.counts["error"] += 1
+                self.failed.add(src)
+            self._print(f"[错误] 无法处理 {src}: {str(e)}")
+            return
+        self.stats.add(0 if renamed or saved else size, renamed, saved_bytes=saved)
+        with self._lock:
+            self.counts[action] += 1
+
+        dest_dir = os.path.dirname(dst)
+        if action != "new":
+            tag = {"overwrite": "覆盖", "rename": "重命名"}[action]
+        elif link is not None:
+            tag = "链接" if saved else "备份"
+        elif mode == "copy":
+            tag = "备份"
+        else:
+            tag = "清理" if os.path.basename(dest_dir) == "垃圾桶" else "移动"
+        self._print(f"[{tag}] {os.path.basename(src)} -> {os.path.relpath(dst, os.path.dirname(dest_dir))}")
+        self._maybe_print_progress()
+
+    def _maybe_print_progress(self):
+        if not self.show_progress:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+        self._print(f"[进度] {self.stats.format()}")
+
+    def _print(self, message):
+        """多个线程同时打印时一行一行输出，不会互相穿插"""
+        with self._print_lock:
+            print(message)
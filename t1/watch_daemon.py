@@ -0,0 +1,309 @@
+"""
+监听模式：常驻运行，目标文件夹里出现新文件时自动整理
+
+Linux 下用 inotify 接收文件变化通知，其他系统（或 inotify 不可用时）退回定时扫描对比。
+文件写完才处理：收到写完关闭（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）事件后再安静一小段时间；
+没有这类事件时（定时扫描，或者文件一直开着没关），大小和修改时间连续一段时间不变才算写完。
+"""
+import os
+import time
+import threading
+
+from file_walker import walk_files  # 同时把common文件夹加入sys.path
+from inotify import (Inotify, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE,
+                     IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR)
+
+# 事件种类：READY 已经写完（写完关闭、移入），CHANGED 还可能在写，GONE 被删除或移走，RESCAN 事件溢出需要重新扫描
+READY = "ready"
+CHANGED = "changed"
+GONE = "gone"
+RESCAN = "rescan"
+
+# 不处理的文件：整理工具自己的文件、办公软件的锁文件
+IGNORED_PREFIXES = (".t1_", "~$", ".~lock.")
+# 不处理的文件：浏览器/下载工具还没下载完的临时文件、跨盘移动时的临时文件（下载完改名后再处理）
+IGNORED_SUFFIXES = (".part", ".crdownload", ".download", ".tmp", ".t1part")
+
+
+def is_ignored(filename):
+    """临时文件、锁文件等不需要整理的文件"""
+    lower_name = filename.lower()
+    return lower_name.startswith(IGNORED_PREFIXES) or lower_name.endswith(IGNORED_SUFFIXES)
+
+
+class InotifyWatcher:
+    """用 inotify 监听目录树（递归为每个子目录添加监听，跳过分类文件夹和垃圾桶）"""
+
+    def __init__(self, root, skip_dirs=()):
+        """
+        :param root: 要监听的目录
+        :param skip_dirs: 不监听的目录名称（任意层级）
+        :raises OSError: 当前系统不支持inotify或监听数量超过系统限制
+        """
+        self.root = root
+        self.skip_dirs = set(skip_dirs)
+        self._inotify = Inotify()
+        self._watches = {}  # 监听编号 -> 绝对目录
+        try:
+            self._add_tree(root)
+        except OSError:
+            self._inotify.close()
+            raise
+
+    def _add_tree(self, abs_dir, kind=None):
+        """
+        为目录及其所有子目录添加监听
+        :param kind: 不为None时，目录里已有的文件也作为这种事件返回（新建或移入的目录）
+        :return: [(事件种类, 文件路径), ...]
+        """
+        events = []
+        stack = [abs_dir]
+        while stack:
+            abs_dir = stack.pop()
+            wd = self._inotify.add_watch(abs_dir)
+            if wd is None:
+                continue  # 目录刚被删掉
+            self._watches[wd] = abs_dir
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.skip_dirs:
+                                stack.append(entry.path)
+                        elif kind is not None:
+                            events.append((kind, entry.path))
+            except OSError:
+                pass
+        return events
+
+    def _remove_tree(self, abs_dir):
+        """目录被移走后，取消它和子目录的监听（inotify会跟着目录走，路径已经不对了）"""
+        prefix = abs_dir + os.sep
+        for wd, path in list(self._watches.items()):
+            if path == abs_dir or path.startswith(prefix):
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def read_events(self, timeout):
+        """
+        等待并读取事件
+        :param timeout: 最长等待秒数
+        :return: [(事件种类, 文件路径), ...]；事件溢出时返回 [(RESCAN, None)]
+        """
+        events = []
+        for wd, mask, filename in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                return [(RESCAN, None)]
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not filename:
+                continue
+
+            path = os.path.join(self._watches[wd], filename)
+            if mask & IN_ISDIR:
+                if filename in self.skip_dirs:
+                    continue
+                # 新建或移入的子目录也要监听，里面已有的文件一并处理
+                if mask & IN_MOVED_TO:
+                    events.extend(self._add_tree(path, READY))
+                elif mask & IN_CREATE:
+                    events.extend(self._add_tree(path, CHANGED))
+                elif mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._remove_tree(path)
+                    events.append((GONE, path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                events.append((READY, path))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append((GONE, path))
+            else:
+                events.append((CHANGED, path))
+        return events
+
+    def close(self):
+        self._inotify.close()
+
+
+class PollingWatcher:
+    """定时重新扫描目录树，对比 (大小, 修改时间) 找出变化的文件（inotify不可用时使用）"""
+
+    def __init__(self, root, interval=2.0, skip_dirs=()):
+        """
+        :param root: 要监听的目录
+        :param interval: 扫描间隔（秒）
+        :param skip_dirs: 不扫描的目录名称（任意层级）
+        """
+        self.root = root
+        self.interval = interval
+        self.skip_dirs = set(skip_dirs)
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        """文件路径 -> (大小, 修改时间纳秒)"""
+        snapshot = {}
+        for path, _, entry in walk_files(self.root, self.skip_dirs):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def read_events(self, timeout):
+        """到了扫描时间就重新扫描，返回有变化的文件；还没到时间就等待（最多timeout秒）"""
+        wait = self._next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(timeout, wait))
+            if time.monotonic() < self._next_scan:
+                return []
+        self._next_scan = time.monotonic() + self.interval
+
+        old, new = self._snapshot, self._scan()
+        self._snapshot = new
+        # 扫描看不出文件有没有写完，都当作可能还在写，等大小稳定
+        events = [(CHANGED, path) for path, sig in new.items() if old.get(path) != sig]
+        events.extend((GONE, path) for path in old if path not in new)
+        return events
+
+    def close(self):
+        pass
+
+
+class WatchDaemon:
+    """常驻整理：收集新文件，等写完后攒成一批交给回调整理"""
+
+    def __init__(self, target_folder, handle_batch, skip_dirs=(), debounce=1.0, stable_time=3.0, open_time=30.0,
+                 max_delay=10.0, max_batch=1000, poll_interval=2.0, force_polling=False):
+        """
+        :param target_folder: 要监听的文件夹
+        :param handle_batch: 整理一批文件的回调，参数为文件路径列表
+        :param skip_dirs: 不监听的目录名称（分类文件夹、垃圾桶）
+        :param debounce: 文件写完（或最后一个事件）之后再等多久（秒）才处理，同时到达的文件合成一批
+        :param stable_time: 定时扫描模式下，大小和修改时间连续这么久（秒）不变才算写完
+        :param open_time: inotify模式下还没关闭（没收到写完事件）的文件，大小和修改时间连续这么久（秒）不变也算写完
+        :param max_delay: 文件持续不断地到达时，写完的文件最多等这么久（秒）也要处理一批
+        :param max_batch: 每批最多处理的文件数
+        :param poll_interval: 定时扫描模式的扫描间隔（秒）
+        :param force_polling: 不使用inotify，直接定时扫描
+        """
+        self.target_folder = target_folder
+        self.handle_batch = handle_batch
+        self.skip_dirs = set(skip_dirs)
+        self.debounce = debounce
+        self.stable_time = stable_time
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+
+        # 文件路径 -> [第一次发现的时间, 最后一个事件的时间, 是否已写完, (大小, 修改时间), 大小不变开始的时间]
+        self.pending = {}
+        self.stats = {"batches": 0, "files": 0, "max_latency": 0.0, "max_queue": 0}
+        self._stopped = threading.Event()
+
+        self.watcher = None
+        if not force_polling:
+            try:
+                self.watcher = InotifyWatcher(target_folder, self.skip_dirs)
+            except OSError as e:
+                print(f"inotify不可用（{e}），改为每{poll_interval}秒扫描一次")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(target_folder, poll_interval, self.skip_dirs)
+        self.mode = "inotify" if isinstance(self.watcher, InotifyWatcher) else "polling"
+        self._stable_time = open_time if self.mode == "inotify" else stable_time
+
+    def _on_events(self, events, now):
+        """把事件合并进待处理队列（同一个文件的多次事件只保留一条）"""
+        for kind, path in events:
+            if kind == RESCAN:
+                # 事件太多被丢弃了，所有文件都重新看一遍（没变过的会被整理记录跳过）
+                for file_path, _, _ in walk_files(self.target_folder, self.skip_dirs):
+                    self._on_events([(CHANGED, file_path)], now)
+                continue
+            if kind == GONE:
+                prefix = path + os.sep
+                for file_path in [p for p in self.pending if p == path or p.startswith(prefix)]:
+                    del self.pending[file_path]
+                continue
+            if is_ignored(os.path.basename(path)):
+                continue
+            item = self.pending.get(path)
+            if item is None:
+                self.pending[path] = [now, now, kind == READY, None, now]
+            else:
+                item[1] = now
+                item[2] = kind == READY  # 写完之后又被改了，重新等
+                if item[2]:
+                    item[3] = None  # 写完时的大小从这里重新算起
+        self.stats["max_queue"] = max(self.stats["max_queue"], len(self.pending))
+
+    def _take_due(self, now):
+        """
+        取出已经写完、可以整理的文件
+        :return: [(文件路径, 第一次发现的时间), ...]
+        """
+        due = []
+        for path, item in list(self.pending.items()):
+            first_seen, last_event, ready, signature, stable_since = item
+            if now - last_event < self.debounce:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]  # 已经被删掉或改名
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != signature:
+                # 大小或修改时间变了（或者第一次检查），重新开始计时
+                item[3] = current
+                item[4] = stable_since = now
+                if signature is not None:
+                    item[2] = ready = False
+            if ready or now - stable_since >= self._stable_time:
+                due.append((path, first_seen))
+        due.sort(key=lambda x: x[1])
+        due = due[:self.max_batch]
+        for path, _ in due:
+            del self.pending[path]
+        return due
+
+    def _process(self, due):
+        """整理一批文件，打印本批的数量、耗时、等待时间和队列里剩下的文件数"""
+        start = time.perf_counter()
+        try:
+            self.handle_batch([path for path, _ in due])
+        except Exception as e:
+            print(f"[错误] 本批文件整理失败: {str(e)}")
+        elapsed = time.perf_counter() - start
+        latency = time.monotonic() - min(first_seen for _, first_seen in due)
+        self.stats["batches"] += 1
+        self.stats["files"] += len(due)
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        print(f"[批次] {len(due)} 个文件，处理 {elapsed:.2f} 秒，等待最久 {latency:.2f} 秒，"
+              f"队列中还有 {len(self.pending)} 个")
+
+    def run(self):
+        """持续监听，直到调用stop()或按Ctrl+C"""
+        tick = min(0.5, self.debounce) or 0.1
+        try:
+            while not self._stopped.is_set():
+                events = self.watcher.read_events(tick)
+                now = time.monotonic()
+                if events:
+                    self._on_events(events, now)
+                if not self.pending:
+                    continue
+                # 文件还在不断到达时先攒着，安静下来、等太久或攒够一批再处理
+                oldest = min(item[0] for item in self.pending.values())
+                if events and now - oldest < self.max_delay and len(self.pending) < self.max_batch:
+                    continue
+                due = self._take_due(now)
+                if due:
+                    self._process(due)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
+
+    def stop(self):
+        """停止监听（可以从其他线程调用）"""
+        self._stopped.set()
@@ -0,0 +1,243 @@
+"""
+合并流程性能测试：生成模拟的 master/分支 目录树，分别统计三个阶段的耗时、吞吐量和内存峰值
+
+用法示例：
+    python benchmark.py --files 20000 --branches 3 --change-ratio 0.1 --output result.json
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import tracemalloc
+import contextlib
+
+from detect_changes import ChangeDetector
+from conflict_detector import ConflictDetector
+from master_merge import MasterMerger
+from dir_scanner import scan_tree  # common文件夹已由tree_snapshot加入sys.path
+
+WORDS = ["apple", "banana", "config", "value", "return", "import", "print", "data", "merge", "branch",
+         "master", "file", "line", "index", "cache", "total", "result", "count", "name", "path"]
+
+
+def _random_line(rng):
+    """生成一行随机文本"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) + "\n"
+
+
+def _random_lines(rng, size):
+    """生成总长度约为size字节的行列表"""
+    lines = []
+    total = 0
+    while total < size:
+        line = _random_line(rng)
+        lines.append(line)
+        total += len(line)
+    return lines
+
+
+def _pick_size(rng, args):
+    """按指定分布生成文件大小"""
+    if args.size_dist == "lognormal":
+        # 大部分文件很小，少数文件很大（接近真实项目）
+        size = int(rng.lognormvariate(0, 1.2) * args.min_size)
+    else:
+        size = rng.randint(args.min_size, args.max_size)
+    return max(1, min(size, args.max_size))
+
+
+def _random_rel_path(rng, depth, i):
+    """生成随机深度的相对路径"""
+    parts = [f"dir{rng.randrange(10)}" for _ in range(rng.randint(0, depth))]
+    return os.path.join(*parts, f"file{i}.txt")
+
+
+def _modify(rng, lines, pattern, tag):
+    """按插入方式修改文件内容"""
+    lines = list(lines)
+    new_lines = [f"{tag} {_random_line(rng)}" for _ in range(rng.randint(1, 5))]
+    if pattern == "random":
+        pattern = rng.choice(["top", "middle", "bottom", "replace"])
+    if pattern == "top":
+        lines[0:0] = new_lines
+    elif pattern == "bottom":
+        lines.extend(new_lines)
+    elif pattern == "middle":
+        pos = len(lines) // 2
+        lines[pos:pos] = new_lines
+    else:
+        pos = rng.randrange(len(lines))
+        lines[pos:pos + 1] = new_lines
+    return lines
+
+
+def _write(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+def generate_tree(base, args):
+    """
+    生成模拟目录树
+    :return: 目录树统计信息
+    """
+    rng = random.Random(args.seed)
+    branches = [f"branch_{chr(ord('a') + i)}" for i in range(args.branches)]
+    stats = {"files": 0, "bytes": 0, "modified": 0, "conflict_files": 0, "new_files": 0}
+
+    for i in range(args.files):
+        rel_path = _random_rel_path(rng, args.depth, i)
+        lines = _random_lines(rng, _pick_size(rng, args))
+        _write(os.path.join(base, "master", rel_path), lines)
+        stats["files"] += 1
+        stats["bytes"] += sum(len(line) for line in lines)
+
+        changed = rng.random() < args.change_ratio
+        conflict = changed and rng.random() < args.conflict_ratio
+        if changed:
+            stats["modified"] += 1
+        if conflict:
+            stats["conflict_files"] += 1
+        # 冲突文件：所有分支都改同一行；普通修改：随机挑一个分支修改
+        editor = rng.choice(branches)
+        pos = rng.randrange(len(lines))
+        for branch in branches:
+            branch_lines = lines
+            if conflict:
+                branch_lines = list(lines)
+                branch_lines[pos] = f"{branch} {_random_line(rng)}"
+            elif changed and branch == editor:
+                branch_lines = _modify(rng, lines, args.insert_pattern, branch)
+            _write(os.path.join(base, branch, rel_path), branch_lines)
+
+    # 每个分支的新增文件
+    for branch in branches:
+        for i in range(int(args.files * args.new_ratio)):
+            lines = _random_lines(rng, _pick_size(rng, args))
+            _write(os.path.join(base, branch, "new", f"{branch}_{i}.txt"), lines)
+            stats["new_files"] += 1
+
+    return branches, stats
+
+
+def _tree_bytes(root):
+    """统计目录下所有文件的总大小"""
+    return sum(entry.stat().st_size for _, entry in scan_tree(root))
+
+
+def _run_stage(name, func, files, nbytes, trace_memory):
+    """执行一个阶段，返回 (结果, 统计信息)"""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # 合并过程中的提示信息不打印，避免影响计时
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "files": files,
+        "bytes": nbytes,
+        "files_per_sec": round(files / seconds, 1) if seconds else None,
+        "mb_per_sec": round(nbytes / seconds / 1024 / 1024, 2) if seconds else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2) if peak is not None else None,
+    }
+
+
+def run_benchmark(base, args):
+    """在已生成的目录树上依次执行三个阶段"""
+    branches = [f"branch_{chr(ord('a') + i)}" for i in range(args.branches)]
+    tree_files = args.files * (1 + args.branches)
+    tree_bytes = sum(_tree_bytes(os.path.join(base, name)) for name in ["master"] + branches)
+
+    detector = ChangeDetector(base, use_cache=not args.no_cache, workers=args.workers, branches=branches)
+    changes, detect_stats = _run_stage("detect", detector.send_changes, tree_files, tree_bytes, args.trace_memory)
+
+    # 冲突检测和合并只处理有变化的文件
+    changed = set()
+    for branch_changes in changes.values():
+        changed.update(branch_changes["new"])
+        changed.update(branch_changes["modified"])
+    changed_bytes = sum(
+        os.path.getsize(os.path.join(base, branch, f))
+        for branch in branches
+        for f in changes[branch]["new"] + changes[branch]["modified"]
+    )
+
+    co_detector = ConflictDetector(base, changes, streaming=args.streaming)
+    _, conflict_stats = _run_stage("conflict", co_detector.detect_all_conflicts, len(changed), changed_bytes,
+                                   args.trace_memory)
+
+    merger = MasterMerger(base, co_detector.conflicts, co_detector.merge_data)
+    result, merge_stats = _run_stage("merge", merger.merge, len(changed), changed_bytes, args.trace_memory)
+
+    return [detect_stats, conflict_stats, merge_stats], {
+        "new_files": len(result["success_new"]),
+        "modified_files": len(result["success_modified"]),
+        "conflict_files": len(result["conflict_files"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并流程性能测试")
+    parser.add_argument("--files", type=int, default=2000, help="master中的文件数")
+    parser.add_argument("--branches", type=int, default=2, help="分支数量")
+    parser.add_argument("--depth", type=int, default=3, help="最大目录深度")
+    parser.add_argument("--size-dist", choices=["uniform", "lognormal"], default="lognormal", help="文件大小分布")
+    parser.add_argument("--min-size", type=int, default=2048, help="最小文件大小（lognormal分布下为典型大小）")
+    parser.add_argument("--max-size", type=int, default=1024 * 1024, help="最大文件大小")
+    parser.add_argument("--change-ratio", type=float, default=0.1, help="被修改文件的比例")
+    parser.add_argument("--conflict-ratio", type=float, default=0.1, help="被修改文件中产生冲突的比例")
+    parser.add_argument("--new-ratio", type=float, default=0.02, help="每个分支新增文件数占master文件数的比例")
+    parser.add_argument("--insert-pattern", choices=["top", "middle", "bottom", "replace", "random"],
+                        default="random", help="修改方式")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（相同参数生成相同的目录树）")
+    parser.add_argument("--workers", type=int, default=4, help="比较文件的线程数")
+    parser.add_argument("--no-cache", action="store_true", help="不使用摘要缓存")
+    parser.add_argument("--streaming", action="store_true", help="使用流式合并")
+    parser.add_argument("--no-memory", dest="trace_memory", action="store_false",
+                        help="不统计内存峰值（tracemalloc会让耗时变长）")
+    parser.add_argument("--dir", default=None, help="生成目录树的位置（默认系统临时目录，结束后删除）")
+    parser.add_argument("--output", default=None, help="结果JSON文件（默认打印到屏幕）")
+    args = parser.parse_args()
+
+    base = args.dir or tempfile.mkdtemp(prefix="t2_bench_")
+    try:
+        start = time.perf_counter()
+        _, tree_stats = generate_tree(base, args)
+        generate_seconds = time.perf_counter() - start
+
+        stages, result = run_benchmark(base, args)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(base, ignore_errors=True)
+
+    report = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("dir", "output")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "tree": dict(tree_stats, generate_seconds=round(generate_seconds, 2)),
+        "stages": stages,
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 4),
+        "result": result,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
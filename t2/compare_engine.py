@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 默认线程数：比较文件主要耗在磁盘/网络IO上，线程比CPU核数多一些也没关系
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+
+class CompareEngine:
+    """并行比较引擎：线程池 + 有界任务队列，返回结果的顺序和输入顺序一致"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=None):
+        """
+        :param workers: 工作线程数（1表示在当前线程串行比较）
+        :param queue_size: 最多同时排队的任务数（默认线程数的4倍），避免一次提交几十万个任务
+        """
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or self.workers * 4
+
+    def map(self, func, items, sizes):
+        """
+        对每个元素执行func，返回结果列表（顺序和items一致）
+        :param func: 比较函数，参数为items中的一个元素
+        :param items: 要比较的元素列表
+        :param sizes: 每个元素对应的文件大小（大文件先提交，减少最后等一个大文件的情况）
+        :return: 结果列表
+        """
+        order = sorted(range(len(items)), key=lambda i: sizes[i], reverse=True)
+        results = [None] * len(items)
+
+        # 串行路径
+        if self.workers == 1 or len(items) <= 1:
+            for i in order:
+                results[i] = func(items[i])
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}  # future -> 元素下标
+            for i in order:
+                # 队列满了先等一部分完成，再继续提交
+                if len(pending) >= self.queue_size:
+                    self._collect(pending, results)
+                pending[pool.submit(func, items[i])] = i
+            while pending:
+                self._collect(pending, results)
+        return results
+
+    @staticmethod
+    def _collect(pending, results):
+        """等待至少一个任务完成，把结果放回对应位置"""
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()  # 比较出错时在这里抛出异常
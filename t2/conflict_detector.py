@@ -1,146 +1,389 @@
 import os
+import io
+import filecmp
+
+from file_io import SNIFF_SIZE, is_binary_file, is_utf8_stream, looks_binary, streams_equal
+from diff3 import merge_lines, iter_merge_lines
+from tree_source import ArchiveTrees
+
+
+class StreamedMerge:
+    """流式模式下的待合并文件：写入master时才读取内容并合并，写完即释放"""
+
+    def __init__(self, detector, file, branches):
+        """
+        :param detector: 所属的ConflictDetector
+        :param file: 文件相对路径
+        :param branches: 修改了该文件的分支名称列表
+        """
+        self.detector = detector
+        self.file = file
+        self.branches = branches
+
+    def __iter__(self):
+        return self.detector._iter_merged_lines(self.file, self.branches)
+
+    def fingerprint(self):
+        """输入文件的 (路径, 大小, 修改时间)：事务合并中断后再运行时，用来判断暂存的结果还能不能用"""
+        return self.detector._input_fingerprint(self.file, self.branches)
+
+    def sources(self):
+        """合并时要读取的 [(分支名称, 分支中的相对路径)]（有tar包分支时用来排读取顺序）"""
+        return self.detector._branch_sources(self.file, self.branches)
 
 
 class ConflictDetector:
     """检测冲突"""
 
-    def __init__(self, base_path, changes):
+    def __init__(self, base_path, changes, streaming=False, metrics=None, ignore_rules=None, archives=None):
         """
         初始化冲突检测器
-        :param base_path: 根目录路径（包含master、branch_a、branch_b）
-        :param changes: 第一步检测到的变化结果（来自ChangeDetector）
+        :param base_path: 根目录路径（包含master和各分支文件夹）
+        :param changes: 第一步检测到的变化结果（来自ChangeDetector，分支数量不限）
+        :param streaming: 流式模式，修改文件不提前读进内存，写入master时逐个合并
+                          （多个分支都修改的文件要等合并时才知道是否冲突）
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的文件不参与冲突检测
+        :param archives: 压缩包分支（ChangeDetector.archives，传入可以避免重新打开），默认用到时自己打开
         """
         self.base_path = base_path
         self.master_path = os.path.join(base_path, "master")
-        self.branch_a_path = os.path.join(base_path, "branch_a")
-        self.branch_b_path = os.path.join(base_path, "branch_b")
-        self.changes = changes  # 包含两个分支的新增和修改文件信息
+        self.changes = changes  # 包含各分支的新增和修改文件信息
+        self.branches = list(changes.keys())
+        self.branch_paths = {name: os.path.join(base_path, name) for name in self.branches}
+        self.streaming = streaming
+        # 合并时读取master基准文件，重命名的文件是否已经移动到新路径
+        # （流式模式下写入master时已经移动；事务合并的移动要到提交时才执行，调用方需设为False）
+        self.renames_applied = streaming
+        self.metrics = metrics
+        self.ignore_rules = ignore_rules
+        self.archives = archives if archives is not None else ArchiveTrees(base_path, ignore_rules)
+        self.new_file_branches = {}  # 新增文件 -> 新增了它的分支列表
+        self.rename_targets = {}  # 被重命名的master文件 -> {分支: (新路径, 相似度)}
+        self.rename_bases = {}  # 可以直接移动的文件：新路径 -> master中的原路径
+        self.rename_sources = {}  # 新路径 -> {分支: 该分支中的相对路径}（在原路径修改了文件的分支）
 
         # 存储冲突信息
         self.conflicts = {
-            "new_files_conflict": [],  # 新增同名文件冲突
-            "modified_files_conflict": []  # 修改内容冲突
+            "new_files_conflict": [],  # 新增同名文件冲突（多个分支新增了同名文件）
+            "modified_files_conflict": [],  # 修改内容冲突
+            "binary_files_conflict": [],  # 二进制文件修改冲突（无法插入冲突标记）
+            "rename_conflict": []  # 重命名冲突（同一文件被改成不同名称，或新名称和其他文件重名）
         }
 
         # 存储可合并内容
         self.merge_data = {
             "new_files": [],  # 可直接合并的新增文件
-            "modified_files": {}  # 可直接合并的修改文件（路径: 内容）
+            "modified_files": {},  # 可直接合并的修改文件（路径: 内容；流式模式下为StreamedMerge）
+            "binary_files": [],  # 整个复制的二进制修改文件（(文件路径, 来源分支)）
+            "renamed_files": []  # 在master中直接移动的文件（(原路径, 新路径)），在其他文件之前执行
         }
 
-    @staticmethod
-    def _read_file_lines(file_path):
+    def _read_file_lines(self, file_path):
         """读取文件内容为行列表（不存在则返回空列表）"""
         if not os.path.exists(file_path):
             return []
         with open(file_path, 'r', encoding='utf-8') as f:
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", os.fstat(f.fileno()).st_size)
             return f.readlines()
 
-    def _check_new_files_conflict(self):
-        """检查新增文件是否有冲突（ab新增同名文件）"""
-        a_new = set(self.changes["branch_a"]["new"])
-        b_new = set(self.changes["branch_b"]["new"])
-
-        # 找出ab都新增的同名文件（冲突）
-        new_conflict_files = a_new & b_new  # 集合交集
-        self.conflicts["new_files_conflict"] = list(new_conflict_files)
+    def _changed_files(self, branch_name, kind):
+        """
+        某个分支某一类变化的文件（去掉被忽略的）
+        :param kind: "new"、"modified" 或 "renamed"（重命名的原路径或新路径被忽略都去掉）
+        """
+        files = self.changes[branch_name].get(kind, [])
+        if self.ignore_rules is None:
+            return files
+        if kind == "renamed":
+            return [item for item in files
+                    if not self.ignore_rules.is_ignored(item[0]) and not self.ignore_rules.is_ignored(item[1])]
+        return [file for file in files if not self.ignore_rules.is_ignored(file)]
+
+    def _branch_path(self, branch_name):
+        """分支名称转分支目录"""
+        return self.branch_paths[branch_name]
+
+    def _master_file(self, file):
+        """
+        master中作为合并基准的文件：重命名的文件用原路径
+        （流式模式下合并时master中的文件已经移动到新路径）
+        """
+        base = file if self.renames_applied else self.rename_bases.get(file, file)
+        return os.path.join(self.master_path, base)
+
+    def _branch_rel(self, branch_name, file):
+        """分支中该文件的相对路径（文件被其他分支重命名时，这个分支里的修改还在原路径）"""
+        return self.rename_sources.get(file, {}).get(branch_name, file)
+
+    def _branch_file(self, branch_name, file):
+        """分支中该文件的路径"""
+        return os.path.join(self._branch_path(branch_name), self._branch_rel(branch_name, file))
+
+    def _open_branch_file(self, branch_name, file):
+        """以二进制方式打开分支中的文件（压缩包分支边解压边读）"""
+        archive = self.archives[branch_name]
+        if archive is not None:
+            return archive.open(self._branch_rel(branch_name, file))
+        return open(self._branch_file(branch_name, file), 'rb')
+
+    def _branch_size(self, branch_name, file, f):
+        """分支文件的大小（统计读取字节数用）"""
+        archive = self.archives[branch_name]
+        if archive is not None:
+            return archive.stat(self._branch_rel(branch_name, file))[0]
+        return os.fstat(f.fileno()).st_size
+
+    def _input_fingerprint(self, file, branches):
+        """合并单个文件要读取的master文件和各分支文件的 [路径, 大小, 修改时间]"""
+        items = []
+        master_file = self._master_file(file)
+        st = os.stat(master_file)
+        items.append([os.path.relpath(master_file, self.base_path), st.st_size, st.st_mtime_ns])
+        for b in branches:
+            archive = self.archives[b]
+            rel_path = self._branch_rel(b, file)
+            if archive is not None:
+                size, mtime_ns, ident = archive.stat(rel_path)
+                items.append([os.path.join(b, rel_path), size, mtime_ns, ident])
+            else:
+                st = os.stat(self._branch_file(b, file))
+                items.append([os.path.join(b, rel_path), st.st_size, st.st_mtime_ns])
+        return items
+
+    def _read_branch_lines(self, branch_name, file):
+        """读取分支文件内容为行列表（不存在则返回空列表）"""
+        archive = self.archives[branch_name]
+        if archive is None:
+            return self._read_file_lines(self._branch_file(branch_name, file))
+        if self._branch_rel(branch_name, file) not in archive:
+            return []
+        with self._open_branch_file(branch_name, file) as f:
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", self._branch_size(branch_name, file, f))
+            return io.TextIOWrapper(f, encoding='utf-8').readlines()
 
-        # 找出ab新增的不同名文件（可直接合并）
-        a_unique_new = a_new - new_conflict_files
-        b_unique_new = b_new - new_conflict_files
+    def _iter_merged_lines(self, file, branches):
+        """
+        流式模式：读取并合并单个文件，逐行返回合并结果
+        :param file: 文件相对路径
+        :param branches: 修改了该文件的分支名称列表
+        """
+        # 只有一个分支修改：直接逐行读取分支文件，内存占用和文件大小无关
+        if len(branches) == 1:
+            with self._open_branch_file(branches[0], file) as f:
+                if self.metrics is not None:
+                    self.metrics.add("bytes_read", self._branch_size(branches[0], file, f))
+                yield from io.TextIOWrapper(f, encoding='utf-8')
+            return
+
+        # 多个分支都修改：多方合并需要完整的行列表，内存只和当前这一个文件有关
+        master_lines = self._read_file_lines(self._master_file(file))
+        side_lines = [self._read_branch_lines(b, file) for b in branches]
+        has_conflict, merged = iter_merge_lines(master_lines, side_lines, branches)
+        if has_conflict:
+            self.conflicts["modified_files_conflict"].append(file)
+        yield from merged
 
-        # 记录可合并的新增文件（(文件路径, 来源分支)）
-        for file in a_unique_new:
-            self.merge_data["new_files"].append((file, "branch_a"))
-        for file in b_unique_new:
-            self.merge_data["new_files"].append((file, "branch_b"))
+    def _check_new_files_conflict(self):
+        """检查新增文件是否有冲突（多个分支新增同名文件）"""
+        # 统计每个新增文件是哪些分支新增的
+        self.new_file_branches = {}
+        for branch_name in self.branches:
+            for file in self._changed_files(branch_name, "new"):
+                self.new_file_branches.setdefault(file, []).append(branch_name)
+
+        # 按路径排序处理，每次运行的报告顺序都一样
+        for file in sorted(self.new_file_branches):
+            branches = self.new_file_branches[file]
+            if len(branches) > 1:
+                # 多个分支都新增的同名文件（冲突）
+                self.conflicts["new_files_conflict"].append(file)
+            else:
+                # 只有一个分支新增（可直接合并），记录 (文件路径, 来源分支)
+                self.merge_data["new_files"].append((file, branches[0]))
+
+    def _modified_branches(self):
+        """统计每个修改文件是哪些分支修改的"""
+        modified_branches = {}
+        for branch_name in self.branches:
+            for file in self._changed_files(branch_name, "modified"):
+                modified_branches.setdefault(file, []).append(branch_name)
+        return modified_branches
+
+    def _check_renames(self):
+        """
+        检查重命名：同一文件被改成不同名称、新名称和其他文件重名算冲突（master中保留原文件）；
+        其余的在master中直接移动，改名时又改了内容、或其他分支在原路径修改了的，再按修改文件合并到新路径
+        """
+        self.rename_targets = {}
+        for branch_name in self.branches:
+            for old, new, score in self._changed_files(branch_name, "renamed"):
+                self.rename_targets.setdefault(old, {})[branch_name] = (new, score)
+
+        # 新路径 -> 被重命名到这里的原文件（多个文件改成同一个名称也是冲突）
+        target_sources = {}
+        for old, targets in self.rename_targets.items():
+            for new, _ in targets.values():
+                target_sources.setdefault(new, set()).add(old)
+        new_paths = {file for branch_name in self.branches for file in self._changed_files(branch_name, "new")}
+        modified_branches = self._modified_branches()
+
+        for old in sorted(self.rename_targets):
+            targets = self.rename_targets[old]
+            new = next(iter(targets.values()))[0]
+            if len({target for target, _ in targets.values()}) > 1 or len(target_sources[new]) > 1 or new in new_paths:
+                self.conflicts["rename_conflict"].append(old)
+                continue
+
+            # 在原路径修改了文件的分支，修改要跟着搬到新路径；二进制文件没法这样合并，算冲突
+            editors = [b for b in modified_branches.get(old, []) if b not in targets]
+            if editors and (is_binary_file(os.path.join(self.master_path, old)) or self._is_binary(old, editors)):
+                self.conflicts["rename_conflict"].append(old)
+                continue
+
+            self.merge_data["renamed_files"].append((old, new))
+            self.rename_bases[new] = old
+            if editors:
+                self.rename_sources[new] = {b: old for b in editors}
 
     def _check_modified_files_conflict(self):
         """检查修改文件是否有冲突（同一文件同一位置修改内容不同）"""
-        # 找出ab都修改过的文件
-        a_modified = set(self.changes["branch_a"]["modified"])
-        b_modified = set(self.changes["branch_b"]["modified"])
-        common_modified = a_modified & b_modified  # 双方都修改的文件
-
-        # 处理只被一个分支修改的文件（可直接合并）
-        a_unique_modified = a_modified - common_modified
-        b_unique_modified = b_modified - common_modified
-
-        for file in a_unique_modified:
-            file_path = os.path.join(self.branch_a_path, file)
-            self.merge_data["modified_files"][file] = self._read_file_lines(file_path)
-
-        for file in b_unique_modified:
-            file_path = os.path.join(self.branch_b_path, file)
-            self.merge_data["modified_files"][file] = self._read_file_lines(file_path)
-
-        # 检查双方都修改的文件是否有内容冲突
-        for file in common_modified:
-            # 读取三个版本的文件内容
-            master_lines = self._read_file_lines(os.path.join(self.master_path, file))
-            a_lines = self._read_file_lines(os.path.join(self.branch_a_path, file))
-            b_lines = self._read_file_lines(os.path.join(self.branch_b_path, file))
-
-            # 检测行级冲突
-            has_conflict, merged_lines = self._detect_line_conflict(master_lines, a_lines, b_lines)
-
-            if has_conflict:
-                # 有冲突，记录冲突文件和内容
-                self.conflicts["modified_files_conflict"].append(file)
-                # 存储带有冲突标记的内容，后续写入master
-                self.merge_data["modified_files"][file] = merged_lines
+        modified_branches = self._modified_branches()
+
+        # 重命名的文件：原路径上的修改和改名时的修改一起合并到新路径
+        for new, old in self.rename_bases.items():
+            editors = modified_branches.pop(old, [])
+            targets = self.rename_targets[old]
+            branches = [b for b in self.branches if b in editors or (b in targets and targets[b][1] < 100)]
+            if branches:
+                modified_branches[new] = branches
+
+        # 只被一个分支修改的文件直接合并，多个分支都修改的文件做多方合并，每个文件只合并、写入一次
+        merge_file = self._merge_modified_file
+        if self.metrics is not None:
+            merge_file = self.metrics.timed("conflict", merge_file)
+        files = sorted(modified_branches)
+        # 有tar包分支时按成员在包里的顺序读取，结果再按路径排好（每次运行的报告顺序都一样）
+        for file in self.archives.read_order(files, lambda f: self._branch_sources(f, modified_branches[f])):
+            merge_file(file, modified_branches[file])
+        self._sort_results()
+
+    def _branch_sources(self, file, branches):
+        """合并这个文件要读取的 [(分支名称, 分支中的相对路径)]"""
+        return [(b, self._branch_rel(b, file)) for b in branches]
+
+    def _sort_results(self):
+        """修改文件的合并结果和冲突按路径排序"""
+        self.conflicts["modified_files_conflict"].sort()
+        self.conflicts["binary_files_conflict"].sort()
+        self.merge_data["binary_files"].sort()
+        self.merge_data["modified_files"] = dict(sorted(self.merge_data["modified_files"].items()))
+
+    def _merge_modified_file(self, file, branches):
+        """
+        合并单个修改文件，结果记入merge_data/conflicts
+        :param file: 文件相对路径
+        :param branches: 修改了该文件的分支名称列表
+        """
+        # 二进制文件只看开头一小块就能识别，不按行读取，整个文件处理
+        if self._is_binary(file, branches):
+            self._merge_binary_file(file, branches)
+            return
+
+        # 流式模式：只登记要合并的文件，内容留到写入master时再读
+        # （写入时才发现不是UTF-8就来不及改成整体复制了，所以先逐块检查一遍编码）
+        if self.streaming:
+            if not self._is_utf8(file, branches):
+                self._merge_binary_file(file, branches)
+                return
+            self.merge_data["modified_files"][file] = StreamedMerge(self, file, branches)
+            return
+
+        try:
+            if len(branches) == 1:
+                # 只有一个分支修改，直接使用该分支的内容
+                merged_lines = self._read_branch_lines(branches[0], file)
             else:
-                # 无冲突，直接使用合并后的内容
-                self.merge_data["modified_files"][file] = merged_lines
+                # 读取master和各分支版本的文件内容
+                master_lines = self._read_file_lines(self._master_file(file))
+                side_lines = [self._read_branch_lines(b, file) for b in branches]
+
+                # 检测行级冲突
+                has_conflict, merged_lines = self._detect_line_conflict(master_lines, side_lines, branches)
+                if has_conflict:
+                    # 有冲突，记录冲突文件（内容中带有冲突标记，后续写入master）
+                    self.conflicts["modified_files_conflict"].append(file)
+        except UnicodeDecodeError:
+            # 不是UTF-8文本，当作二进制文件整体处理
+            self._merge_binary_file(file, branches)
+            return
+
+        self.merge_data["modified_files"][file] = merged_lines
+
+    def _is_binary(self, file, branches):
+        """任一分支中的版本是二进制文件就按二进制处理"""
+        for b in branches:
+            if self.archives[b] is None:
+                if is_binary_file(self._branch_file(b, file)):
+                    return True
+                continue
+            with self._open_branch_file(b, file) as f:
+                if looks_binary(f.read(SNIFF_SIZE)):
+                    return True
+        return False
+
+    def _is_utf8(self, file, branches):
+        """要读取的各分支版本（多个分支修改时还有master基准文件）是否都能按UTF-8解码"""
+        if len(branches) > 1:
+            # 判冲突时重命名还没有执行，基准文件还在原路径
+            master_file = os.path.join(self.master_path, self.rename_bases.get(file, file))
+            if os.path.exists(master_file):
+                with open(master_file, 'rb') as f:
+                    if not is_utf8_stream(f):
+                        return False
+        for b in branches:
+            with self._open_branch_file(b, file) as f:
+                if not is_utf8_stream(f):
+                    return False
+        return True
+
+    def _same_content(self, first, other, file):
+        """两个分支中的版本内容是否相同（都是文件夹时用filecmp，有压缩包时逐块比较解压后的内容）"""
+        if self.archives[first] is None and self.archives[other] is None:
+            return filecmp.cmp(self._branch_file(first, file), self._branch_file(other, file), shallow=False)
+        with self._open_branch_file(first, file) as f1, self._open_branch_file(other, file) as f2:
+            return streams_equal(f1, f2)
+
+    def _merge_binary_file(self, file, branches):
+        """
+        二进制文件整体合并：只有一个分支修改就整个复制过去；
+        多个分支都修改且内容不同则记为冲突，master中的文件保持不变
+        """
+        if len(branches) > 1:
+            for branch in branches[1:]:
+                if not self._same_content(branches[0], branch, file):
+                    self.conflicts["binary_files_conflict"].append(file)
+                    return
+        self.merge_data["binary_files"].append((file, branches[0]))
 
     @staticmethod
-    def _detect_line_conflict(master_lines, a_lines, b_lines):
+    def _detect_line_conflict(master_lines, side_lines, branches):
         """
-        检测同一文件的行级冲突
+        检测同一文件的行级冲突（多方合并：按修改块对齐，不再按行号逐行比较）
         :param master_lines: master中的文件内容（行列表）
-        :param a_lines: branch_a中的文件内容（行列表）
-        :param b_lines: branch_b中的文件内容（行列表）
+        :param side_lines: 各分支中的文件内容（行列表的列表）
+        :param branches: 各分支名称（用于冲突标记）
         :return: (是否有冲突, 合并后的行列表)
         """
-        max_length = max(len(master_lines), len(a_lines), len(b_lines))
-        merged = []
-        has_conflict = False
-
-        for i in range(max_length):
-            # 获取当前行（处理索引超出范围的情况）
-            master_line = master_lines[i].rstrip('\n') if i < len(master_lines) else None
-            a_line = a_lines[i].rstrip('\n') if i < len(a_lines) else None
-            b_line = b_lines[i].rstrip('\n') if i < len(b_lines) else None
-
-            # 情况1: 都和master相同，直接用master内容
-            if a_line == master_line and b_line == master_line:
-                merged.append(master_line + '\n' if master_line is not None else '')
-
-            # 情况2: a修改，b未修改，用a的内容
-            elif a_line != master_line and b_line == master_line:
-                merged.append(a_line + '\n' if a_line is not None else '')
-
-            # 情况3: b修改，a未修改，用b的内容
-            elif a_line == master_line and b_line != master_line:
-                merged.append(b_line + '\n' if b_line is not None else '')
-
-            # 情况4: 两者都修改但内容相同，用修改后的内容
-            elif a_line == b_line and a_line != master_line:
-                merged.append(a_line + '\n' if a_line is not None else '')
-
-            # 情况5: 两者都修改且内容不同，标记冲突
-            else:
-                has_conflict = True
-                merged.append("<<<<<<< branch_a\n")
-                merged.append(a_line + '\n' if a_line is not None else '')
-                merged.append("=======\n")
-                merged.append(b_line + '\n' if b_line is not None else '')
-                merged.append(">>>>>>> branch_b\n")
-
-        return has_conflict, merged
+        # 只有修改块真正重叠时才标记冲突，一边插入几行不会影响后面的行
+        return merge_lines(master_lines, side_lines, branches)
 
     def detect_all_conflicts(self):
         """检测所有类型的冲突"""
+        # 检查重命名（要在修改文件之前，原路径上的修改需要跟着搬到新路径）
+        self._check_renames()
         # 检查新增文件冲突
         self._check_new_files_conflict()
         # 检查修改文件冲突
@@ -156,7 +399,7 @@ class ConflictDetector:
         if self.conflicts["new_files_conflict"]:
             print(f"\n新增文件冲突 ({len(self.conflicts['new_files_conflict'])}个):")
             for file in self.conflicts["new_files_conflict"]:
-                print(f"  - {file}: branch_a和branch_b都新增了同名文件")
+                print(f"  - {file}: {'、'.join(self.new_file_branches[file])}都新增了同名文件")
 
         # 修改文件冲突
         if self.conflicts["modified_files_conflict"]:
@@ -164,6 +407,19 @@ class ConflictDetector:
             for file in self.conflicts["modified_files_conflict"]:
                 print(f"  - {file}: 同一位置修改内容不同")
 
+        # 二进制文件冲突
+        if self.conflicts["binary_files_conflict"]:
+            print(f"\n二进制文件冲突 ({len(self.conflicts['binary_files_conflict'])}个):")
+            for file in self.conflicts["binary_files_conflict"]:
+                print(f"  - {file}: 多个分支都修改了二进制文件且内容不同")
+
+        # 重命名冲突
+        if self.conflicts["rename_conflict"]:
+            print(f"\n重命名冲突 ({len(self.conflicts['rename_conflict'])}个):")
+            for file in self.conflicts["rename_conflict"]:
+                targets = "、".join(f"{b}改为{new}" for b, (new, _) in self.rename_targets[file].items())
+                print(f"  - {file}: {targets}，和其他分支的改名、新增或二进制修改冲突")
+
         # 无冲突情况
         if not any(self.conflicts.values()):
             print("\n未检测到任何冲突，可以安全合并")
@@ -172,3 +428,5 @@ class ConflictDetector:
         print(f"\n可合并内容:")
         print(f"  新增文件: {len(self.merge_data['new_files'])}个")
         print(f"  修改文件: {len(self.merge_data['modified_files'])}个")
+        print(f"  二进制文件: {len(self.merge_data['binary_files'])}个")
+        print(f"  重命名文件: {len(self.merge_data['renamed_files'])}个")
@@ -1,117 +1,308 @@
 import os
+import stat
 import filecmp
 
+from tree_snapshot import TreeSnapshot
+from hash_cache import HashCache, stream_digest, stream_crc32
+from compare_engine import CompareEngine, DEFAULT_WORKERS
+from rename_detector import RenameDetector
+from tree_source import ArchiveTrees, ARCHIVE_SUFFIXES
+from file_io import streams_equal
+
+# 默认参与合并的分支目录
+DEFAULT_BRANCHES = ["branch_a", "branch_b"]
+
 
 class ChangeDetector:
     """检测修改"""
-    def __init__(self, base_path):
-        # 初始化路径（三个文件夹的绝对路径）
+    def __init__(self, base_path, use_cache=True, rebuild_cache=False, workers=DEFAULT_WORKERS, branches=None,
+                 metrics=None, detect_renames=False, ignore_rules=None):
+        """
+        :param base_path: 根目录路径（包含master和各分支文件夹）
+        :param use_cache: 是否使用摘要缓存（False时逐字节比较文件）
+        :param rebuild_cache: 是否丢弃已有缓存重新计算
+        :param workers: 并行比较文件内容的线程数（1为串行）
+        :param branches: 分支文件夹名称列表，可以有任意多个（默认branch_a、branch_b）；
+                         分支文件夹不存在时读取同名的压缩包（如branch_a.zip、branch_a.tar.gz），不用先解压
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        :param detect_renames: 是否检测重命名/移动（要求分支是master的完整副本，master有、分支没有的文件视为被移走）
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的目录扫描时直接跳过
+        """
+        # 初始化路径（master和各分支文件夹的绝对路径）
         self.base_path = base_path
         self.master_path = os.path.join(base_path, "master")
-        self.branch_a_path = os.path.join(base_path, "branch_a")
-        self.branch_b_path = os.path.join(base_path, "branch_b")
+        self.branches = list(branches or DEFAULT_BRANCHES)
+        self.branch_paths = {name: os.path.join(base_path, name) for name in self.branches}
+        self._master_snapshot = None  # master快照（首次使用时扫描）
+        self._branch_snapshots = {}  # 分支名称 -> 最近一次扫描的快照（检测重命名时复用）
+        self.ignore_rules = ignore_rules
+        # 压缩包分支（判冲突、合并时也要读取，打开一次各阶段共用）
+        self.archives = ArchiveTrees(base_path, ignore_rules)
 
         # 验证路径是否存在
         self._validate_paths()
 
+        # 摘要缓存（stat没变的文件直接比较摘要，不用打开）
+        self.hash_cache = HashCache(base_path, rebuild=rebuild_cache) if use_cache else None
+        # 文件内容比较引擎（线程池）
+        self.compare_engine = CompareEngine(workers)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.workers = self.compare_engine.workers
+        # 重命名检测（先按摘要找原样重命名，再在大小相近的文件中比较相似度）
+        self.rename_detector = RenameDetector(self._file_digest, metrics=metrics) if detect_renames else None
+
     def _validate_paths(self):
-        """验证三个文件夹是否存在"""
-        for path in [self.master_path, self.branch_a_path, self.branch_b_path]:
-            if not os.path.exists(path) or not os.path.isdir(path):
-                raise FileNotFoundError(f"文件夹不存在: {path}")
+        """验证master文件夹和各分支（文件夹或压缩包）是否存在"""
+        if not os.path.isdir(self.master_path):
+            raise FileNotFoundError(f"文件夹不存在: {self.master_path}（master是合并结果的写入目标，不能是压缩包）")
+        for branch_name, path in self.branch_paths.items():
+            if not os.path.isdir(path) and self.archives[branch_name] is None:
+                raise FileNotFoundError(f"文件夹不存在: {path}（也没有找到{'、'.join(ARCHIVE_SUFFIXES)}压缩包）")
 
     @staticmethod
-    def _get_all_files(root_dir):
-        """获取指定目录下所有文件的相对路径列表"""
-        file_list = []
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                # 计算相对路径（相对于root_dir）
-                # 显式转换为str，确保类型匹配
-                file_path: str = str(os.path.join(dirpath, filename))
-                rel_path = os.path.relpath(file_path, root_dir)  # 此时两个参数都是str，类型匹配
-                file_list.append(rel_path)
-        return file_list
+    def _get_all_files(root_dir, ignore_rules=None):
+        """一次遍历获取指定目录的快照（相对路径、大小、修改时间、inode），跳过被忽略的目录和文件"""
+        return TreeSnapshot(root_dir, ignore_rules)
 
-    @staticmethod
-    def _is_file_modified(master_file, branch_file):
+    def _get_master_snapshot(self):
+        """master只扫描一次，所有分支共用"""
+        if self._master_snapshot is None:
+            self._master_snapshot = ChangeDetector._get_all_files(self.master_path, self.ignore_rules)
+            if self.metrics is not None:
+                self.metrics.add("files_scanned", len(self._master_snapshot))
+        return self._master_snapshot
+
+    def _get_branch_snapshot(self, branch_name):
+        """扫描分支文件夹；压缩包分支直接用打开时读到的目录信息"""
+        archive = self.archives[branch_name]
+        if archive is not None:
+            return archive
+        return ChangeDetector._get_all_files(self.branch_paths[branch_name], self.ignore_rules)
+
+    def _is_file_modified(self, file, branch_name, master_snapshot, branch_snapshot):
         """判断分支文件相对于master文件是否被修改"""
+        if branch_snapshot.is_archive:
+            return self._compare_member(file, branch_name, master_snapshot.abs_path(file),
+                                        master_snapshot.stat(file), branch_snapshot)
+        return self._compare_file(file, branch_name,
+                                  master_snapshot.abs_path(file), master_snapshot.stat(file),
+                                  branch_snapshot.abs_path(file), branch_snapshot.stat(file))
+
+    def _compare_file(self, file, branch_name, master_file, master_stat, branch_file, branch_stat):
+        """
+        根据两边的stat信息和内容判断文件是否被修改
+        :param master_stat: master中文件的 (大小, 修改时间纳秒, inode)，不存在为None
+        :param branch_stat: 分支中文件的 (大小, 修改时间纳秒, inode)，不存在为None
+        """
         # 检查文件是否存在
-        if not os.path.exists(master_file):
+        if master_stat is None:
             return True  # master中不存在，属于新增文件
-        if not os.path.exists(branch_file):
+        if branch_stat is None:
             return False  # 分支中不存在该文件
 
-        # 比较文件内容
-        return not filecmp.cmp(master_file, branch_file, shallow=False)
+        # 不用缓存时逐字节比较文件内容
+        if self.hash_cache is None:
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", master_stat[0] + branch_stat[0])
+            return not filecmp.cmp(master_file, branch_file, shallow=False)
+
+        # 大小不同肯定被修改，否则比较内容摘要（stat没变的文件直接用缓存）
+        if master_stat[0] != branch_stat[0]:
+            return True
+        master_digest = self.hash_cache.digest(os.path.join("master", file), master_file, master_stat)
+        branch_digest = self.hash_cache.digest(os.path.join(branch_name, file), branch_file, branch_stat)
+        return master_digest != branch_digest
+
+    def _compare_member(self, file, branch_name, master_file, master_stat, archive):
+        """
+        判断压缩包中的成员相对于master文件是否被修改
+        zip记录了每个成员的CRC32：开启缓存时先和master文件的CRC32比较，不同说明肯定被修改，不用解压成员；
+        CRC32相同不能说明内容相同（不同内容也可能算出相同的CRC32），还要比较内容摘要确认。tar没有校验值，直接比较内容摘要
+        """
+        if master_stat is None:
+            return True
+        branch_stat = archive.stat(file)
+        if branch_stat is None:
+            return False
+        if master_stat[0] != branch_stat[0]:
+            return True
+
+        if self.hash_cache is None:
+            # 不用缓存时逐字节比较，先算CRC32反而要多读一遍master文件
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", master_stat[0] + branch_stat[0])
+            with open(master_file, 'rb') as f1, archive.open(file) as f2:
+                return not streams_equal(f1, f2)
+        crc = archive.checksum(file)
+        if crc is not None and self._master_crc32(file, master_file, master_stat) != crc:
+            return True
+        master_digest = self.hash_cache.digest(os.path.join("master", file), master_file, master_stat)
+        # 成员的stat里用CRC32/数据偏移代替inode，压缩包换了内容缓存就失效
+        branch_digest = self.hash_cache.digest(os.path.join(branch_name, file), None, branch_stat,
+                                               opener=lambda: archive.open(file))
+        return master_digest != branch_digest
+
+    def _master_crc32(self, file, master_file, master_stat):
+        """master文件的CRC32（和摘要一样按stat缓存）"""
+        crc = self.hash_cache.digest(os.path.join("master", file) + ":crc32", master_file, master_stat,
+                                     hasher=stream_crc32)
+        return int.from_bytes(crc, "big")
+
+    def _file_digest(self, tree_name, file, snapshot):
+        """计算文件内容摘要（开启缓存时stat没变的文件不用读；snapshot可以是文件夹或压缩包的目录树）"""
+        file_stat = snapshot.stat(file)
+        if self.hash_cache is not None:
+            return self.hash_cache.digest(os.path.join(tree_name, file), None, file_stat,
+                                          opener=lambda: snapshot.open(file))
+        if self.metrics is not None:
+            self.metrics.add("bytes_read", file_stat[0])
+        with snapshot.open(file) as f:
+            return stream_digest(f)
+
+    @staticmethod
+    def _stat_file(file_path):
+        """获取单个文件的 (大小, 修改时间纳秒, inode)，不存在或不是文件返回None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def file_status(self, file, branch_name):
+        """
+        不扫描整棵树，只检查单个文件在分支中的状态
+        :return: "new"（新增）、"modified"（修改）或 None（没有变化/分支中没有/被忽略）
+        """
+        if self.ignore_rules is not None and self.ignore_rules.is_ignored(file):
+            return None
+        master_file = os.path.join(self.master_path, file)
+        archive = self.archives[branch_name]
+        if archive is not None:
+            if file not in archive:
+                return None
+            master_stat = self._stat_file(master_file)
+            if master_stat is None:
+                return "new"
+            return "modified" if self._compare_member(file, branch_name, master_file, master_stat, archive) else None
+
+        branch_file = os.path.join(self.branch_paths[branch_name], file)
+        branch_stat = self._stat_file(branch_file)
+        if branch_stat is None:
+            return None
+        master_stat = self._stat_file(master_file)
+        if master_stat is None:
+            return "new"
+        if self._compare_file(file, branch_name, master_file, master_stat, branch_file, branch_stat):
+            return "modified"
+        return None
 
     def detect_changes(self, branch_name):
         """
         检测指定分支相对于master的变化
-        branch_name: 分支名称，"branch_a" 或 "branch_b"
+        branch_name: 分支名称，如 "branch_a"
         返回: (新增文件列表, 修改文件列表)
         """
-        # 确定分支路径
-        branch_path = self.branch_a_path if branch_name == "branch_a" else self.branch_b_path
+        # 获取master和分支的快照（master已缓存，不会重复扫描；压缩包分支不用扫描）
+        master_snapshot = self._get_master_snapshot()
+        branch_snapshot = self._get_branch_snapshot(branch_name)
+        self._branch_snapshots[branch_name] = branch_snapshot
+        master_index = master_snapshot.index
+        if self.metrics is not None:
+            self.metrics.add("files_scanned", len(branch_snapshot))
 
-        # 获取master和分支中的所有文件
-        master_files = ChangeDetector._get_all_files(self.master_path)
-        branch_files = ChangeDetector._get_all_files(branch_path)
-
-        # 新增文件：分支有，master没有
-        new_files = [f for f in branch_files if f not in master_files]
+        # 新增文件：分支有，master没有（哈希索引查找，O(1)）
+        new_files = [f for f in branch_snapshot.paths if f not in master_index]
 
         # 修改文件：两边都有，但内容不同
-        modified_files = []
-        for file in branch_files:
-            if file in master_files:
-                master_file = os.path.join(self.master_path, file)
-                branch_file = os.path.join(branch_path, file)
-                if self._is_file_modified(master_file, branch_file):
-                    modified_files.append(file)
+        # 大小不同的直接判定为修改（不读任何内容），大小相同的交给比较引擎并行比较
+        modified_flags = {}
+        to_compare = []
+        for file in branch_snapshot.paths:
+            if file in master_index:
+                if master_snapshot.stat(file)[0] != branch_snapshot.stat(file)[0]:
+                    modified_flags[file] = True
+                else:
+                    to_compare.append(file)
+
+        def compare(f):
+            return self._is_file_modified(f, branch_name, master_snapshot, branch_snapshot)
+
+        if self.metrics is not None:
+            compare = self.metrics.timed("detect", compare)
+        if branch_snapshot.sequential:
+            # tar包只有一个读取位置，多线程也只能排队；按成员在包里的顺序比较，解压时不用往回跳
+            for f in sorted(to_compare, key=branch_snapshot.offset):
+                modified_flags[f] = compare(f)
+        else:
+            results = self.compare_engine.map(
+                compare,
+                to_compare,
+                [branch_snapshot.stat(f)[0] for f in to_compare]
+            )
+            modified_flags.update(zip(to_compare, results))
+
+        # 按分支中的文件顺序输出，和串行比较结果完全一致
+        modified_files = [f for f in branch_snapshot.paths if modified_flags.get(f)]
 
         return new_files, modified_files
 
+    def detect_renames(self, branch_name, new_files):
+        """
+        在新增文件中找出从master中的文件重命名/移动过来的（需要先调用detect_changes）
+        :param new_files: detect_changes得到的新增文件列表
+        :return: (重命名列表 [(原路径, 新路径, 相似度百分比)], 剩下的新增文件列表)
+        """
+        return self.rename_detector.detect(branch_name, self._get_master_snapshot(),
+                                           self._branch_snapshots[branch_name], new_files)
+
     def send_changes(self):
         """返回change检测结果以供后续使用"""
-        # 检测branch_a的变化
-        a_new, a_modified = self.detect_changes("branch_a")
-        # 检测branch_b的变化
-        b_new, b_modified = self.detect_changes("branch_b")
-        return {
-            "branch_a": {"new": a_new, "modified": a_modified},
-            "branch_b": {"new": b_new, "modified": b_modified}
-        }
-
-    def print_changes(self):
-        """仅负责打印结果：调用send_changes获取字典，再解析字典打印"""
-        # 关键步骤：调用self.send_changes()获取返回的字典
-        changes_dict = self.send_changes()  # changes_dict就是send_changes返回的那套字典
-
-        # 从字典中提取branch_a的新增/修改文件（按字典的键逐层获取）
-        a_new = changes_dict["branch_a"]["new"]
-        a_modified = changes_dict["branch_a"]["modified"]
-
-        # 从字典中提取branch_b的新增/修改文件
-        b_new = changes_dict["branch_b"]["new"]
-        b_modified = changes_dict["branch_b"]["modified"]
-
-        # 后续打印逻辑和之前完全一样，只是数据来源从“重复调用detect_changes”变成了“解析字典”
+        # 依次检测每个分支的变化（master只扫描一次）
+        changes = {}
+        for branch_name in self.branches:
+            new_files, modified_files = self.detect_changes(branch_name)
+            changes[branch_name] = {"new": new_files, "modified": modified_files}
+            if self.rename_detector is not None:
+                renamed, changes[branch_name]["new"] = self.detect_renames(branch_name, new_files)
+                changes[branch_name]["renamed"] = renamed
+
+        self.save_cache()
+        return changes
+
+    def save_cache(self):
+        """保存摘要缓存（顺便淘汰本次没用到的旧条目），并记录缓存命中情况"""
+        if self.hash_cache is not None:
+            self.hash_cache.save()
+            if self.metrics is not None:
+                self.metrics.add("cache_hits", self.hash_cache.hits)
+                self.metrics.add("cache_misses", self.hash_cache.misses)
+                self.metrics.add("bytes_read", self.hash_cache.bytes_read)
+
+    def print_changes(self, changes_dict=None):
+        """
+        仅负责打印结果：解析send_changes返回的字典并打印
+        :param changes_dict: send_changes的结果，不传则重新检测一次
+        """
+        # 已经检测过就直接用，避免再把整棵树扫描比较一遍
+        if changes_dict is None:
+            changes_dict = self.send_changes()  # changes_dict就是send_changes返回的那套字典
+
         print(f"=== 分支差异检测结果 ===")
         print(f"基准目录: {self.base_path}")
 
-        print("\n[branch_a 相对于 master 的变化]")
-        print(f"  新增文件: {len(a_new)}个")
-        for file in a_new:
-            print(f"    - {file}")
-        print(f"  修改文件: {len(a_modified)}个")
-        for file in a_modified:
-            print(f"    - {file}")
-
-        print("\n[branch_b 相对于 master 的变化]")
-        print(f"  新增文件: {len(b_new)}个")
-        for file in b_new:
-            print(f"    - {file}")
-        print(f"  修改文件: {len(b_modified)}个")
-        for file in b_modified:
-            print(f"    - {file}")
+        # 按分支逐个打印新增/修改文件（按字典的键逐层获取）
+        for branch_name, branch_changes in changes_dict.items():
+            print(f"\n[{branch_name} 相对于 master 的变化]")
+            print(f"  新增文件: {len(branch_changes['new'])}个")
+            for file in branch_changes["new"]:
+                print(f"    - {file}")
+            print(f"  修改文件: {len(branch_changes['modified'])}个")
+            for file in branch_changes["modified"]:
+                print(f"    - {file}")
+            if "renamed" in branch_changes:
+                print(f"  重命名文件: {len(branch_changes['renamed'])}个")
+                for old, new, score in branch_changes["renamed"]:
+                    print(f"    - {old} -> {new} (相似度{score}%)")
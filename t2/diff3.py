@@ -0,0 +1,284 @@
+"""
+行级三方合并（diff3）
+
+1. 先把每一行映射成整数编号（相同内容的行编号相同），后面比较整数，不再反复比较长字符串
+2. 用 Myers O(ND) 差异算法（线性空间的"中间蛇"版本）找出 master 和每个分支之间的修改块
+3. 把各分支的修改块按 master 中的位置排序，只有真正重叠的修改块才算冲突，其余的直接合并
+"""
+
+
+def intern_lines(*line_lists):
+    """
+    把若干个行列表中的每一行映射为整数编号
+    :return: 与输入一一对应的编号列表
+    """
+    table = {}
+    return [[table.setdefault(line, len(table)) for line in lines] for lines in line_lists]
+
+
+def _middle_snake(a, a0, a1, b, b0, b1):
+    """
+    在 a[a0:a1] 和 b[b0:b1] 中找"中间蛇"（正向和反向搜索相遇的那段对角线）
+    :return: (x起点, y起点, x终点, y终点)，均为绝对下标
+    """
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    vf = [0] * (2 * max_d + 3)  # 正向：每条对角线上走到的最远x
+    vb = [0] * (2 * max_d + 3)  # 反向：每条对角线上从末尾往回走的最远距离
+
+    for d in range(max_d + 1):
+        # 正向搜索
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+                x = vf[offset + k + 1]
+            else:
+                x = vf[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[offset + k] = x
+            # 正向和反向路径重叠：找到中间蛇
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + vb[offset + delta - k] >= n:
+                return a0 + x_start, b0 + y_start, a0 + x, b0 + y
+
+        # 反向搜索（在倒序序列上做同样的事）
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+                x = vb[offset + k + 1]
+            else:
+                x = vb[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + vf[offset + delta - k] >= n:
+                return a1 - x, b1 - y, a1 - x_start, b1 - y_start
+
+    raise AssertionError("中间蛇搜索失败")  # 理论上不会走到这里
+
+
+def matching_blocks(a, b):
+    """
+    求 a、b 两个序列的最长公共子序列，返回匹配块列表
+    :return: [(a下标, b下标, 长度), ...]，按下标升序
+    """
+    # 只在一边出现的行不可能匹配，先剔除再比较（整段重写的文件差异很大，这一步能省掉绝大部分搜索）
+    in_a = set(a)
+    in_b = set(b)
+    keep_a = [i for i, x in enumerate(a) if x in in_b]
+    keep_b = [j for j, x in enumerate(b) if x in in_a]
+    if len(keep_a) == len(a) and len(keep_b) == len(b):
+        return _matching_blocks(a, b)
+
+    # 剔除后的匹配结果映射回原下标，原下标不连续的地方拆成多个块
+    blocks = []
+    for i, j, size in _matching_blocks([a[i] for i in keep_a], [b[j] for j in keep_b]):
+        for t in range(size):
+            ai, bj = keep_a[i + t], keep_b[j + t]
+            if blocks and blocks[-1][0] + blocks[-1][2] == ai and blocks[-1][1] + blocks[-1][2] == bj:
+                blocks[-1][2] += 1
+            else:
+                blocks.append([ai, bj, 1])
+    return [tuple(block) for block in blocks]
+
+
+def _matching_blocks(a, b):
+    """Myers 线性空间算法：不断找中间蛇，把问题一分为二"""
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+
+        # 去掉公共前缀和后缀，大部分文件只改了中间一小段，这一步就能省掉绝大部分计算
+        start = 0
+        while a0 + start < a1 and b0 + start < b1 and a[a0 + start] == b[b0 + start]:
+            start += 1
+        if start:
+            blocks.append((a0, b0, start))
+            a0 += start
+            b0 += start
+        end = 0
+        while a1 - end > a0 and b1 - end > b0 and a[a1 - end - 1] == b[b1 - end - 1]:
+            end += 1
+        if end:
+            blocks.append((a1 - end, b1 - end, end))
+            a1 -= end
+            b1 -= end
+
+        # 有一边为空，剩下的全是新增或删除
+        if a0 == a1 or b0 == b1:
+            continue
+
+        x0, y0, x1, y1 = _middle_snake(a, a0, a1, b, b0, b1)
+        if x1 > x0:
+            blocks.append((x0, y0, x1 - x0))
+        stack.append((x1, a1, y1, b1))
+        stack.append((a0, x0, b0, y0))
+
+    blocks.sort()
+    return blocks
+
+
+def diff_hunks(a, b):
+    """
+    求从 a 到 b 的修改块
+    :return: [(a起点, a终点, b起点, b终点), ...]，表示 a[a起点:a终点] 被替换成 b[b起点:b终点]
+    """
+    hunks = []
+    i = j = 0
+    for ai, bj, size in matching_blocks(a, b) + [(len(a), len(b), 0)]:
+        if ai > i or bj > j:
+            hunks.append((i, ai, j, bj))
+        i = ai + size
+        j = bj + size
+    return hunks
+
+
+def _overlaps(start1, end1, start2, end2):
+    """两个区间是否真正重叠（只是首尾相接不算；两个插入点相同算重叠）"""
+    if start1 == end1 == start2 == end2:
+        return True
+    return start1 < end2 and start2 < end1
+
+
+def merge_regions(base, sides):
+    """
+    多方合并，只计算区域不生成内容
+    :param base: master的行编号列表
+    :param sides: 各分支的行编号列表
+    :return: 区域列表，每个区域是以下之一：
+        ("base", 起点, 终点)：保留 master 中的行
+        ("side", 分支序号, 起点, 终点)：使用某个分支中的行
+        ("conflict", [(分支序号列表, 起点, 终点), ...])：冲突，每个元素是一个不同的版本
+    """
+    # 收集所有分支的修改块：(master起点, master终点, 分支序号, 分支起点, 分支终点)
+    all_hunks = []
+    for k, side in enumerate(sides):
+        for o0, o1, x0, x1 in diff_hunks(base, side):
+            all_hunks.append((o0, o1, k, x0, x1))
+    all_hunks.sort()
+
+    # 按master中的位置分组：互相重叠的修改块放进同一组
+    groups = []
+    for hunk in all_hunks:
+        if groups and _overlaps(hunk[0], hunk[1], groups[-1][0], groups[-1][1]):
+            group = groups[-1]
+            group[0] = min(group[0], hunk[0])
+            group[1] = max(group[1], hunk[1])
+            group[2].append(hunk)
+        else:
+            groups.append([hunk[0], hunk[1], [hunk]])
+
+    regions = []
+    pos = 0
+    for start, end, hunks in groups:
+        if start > pos:
+            regions.append(("base", pos, start))
+        pos = end
+
+        # 每个分支在这一组里的版本：从该分支第一个修改块的起点到最后一个修改块的终点
+        versions = {}  # 分支序号 -> (起点, 终点)
+        for o0, o1, k, x0, x1 in hunks:
+            if k in versions:
+                versions[k] = (versions[k][0], x1 + (end - o1))
+            else:
+                versions[k] = (x0 - (o0 - start), x1 + (end - o1))
+
+        # 内容相同的版本合并（比如两个分支做了同样的修改）
+        distinct = []  # [(分支序号列表, 起点, 终点, 内容)]
+        for k in sorted(versions):
+            x0, x1 = versions[k]
+            content = sides[k][x0:x1]
+            for item in distinct:
+                if item[3] == content:
+                    item[0].append(k)
+                    break
+            else:
+                distinct.append(([k], x0, x1, content))
+
+        if len(distinct) == 1:
+            regions.append(("side", distinct[0][0][0], distinct[0][1], distinct[0][2]))
+        else:
+            regions.append(("conflict", [(ks, x0, x1) for ks, x0, x1, _ in distinct]))
+
+    if pos < len(base):
+        regions.append(("base", pos, len(base)))
+    return regions
+
+
+def _with_newline(lines):
+    """冲突标记前的最后一行如果没有换行符，补上换行，避免标记和内容挤在同一行"""
+    if lines and not lines[-1].endswith('\n'):
+        return lines[:-1] + [lines[-1] + '\n']
+    return lines
+
+
+def render_regions(regions, base_lines, side_lines, names):
+    """
+    根据区域列表生成合并后的行，冲突处加上冲突标记
+    :param regions: merge_regions的结果
+    :param base_lines: master的行列表
+    :param side_lines: 各分支的行列表
+    :param names: 各分支的名称（用于冲突标记）
+    :return: 合并后的行（生成器）
+    """
+    for region in regions:
+        if region[0] == "base":
+            yield from base_lines[region[1]:region[2]]
+        elif region[0] == "side":
+            yield from side_lines[region[1]][region[2]:region[3]]
+        else:
+            versions = region[1]
+            last = len(versions) - 1
+            for i, (ks, x0, x1) in enumerate(versions):
+                label = ", ".join(names[k] for k in ks)
+                if i == 0:
+                    yield f"<<<<<<< {label}\n"
+                elif i < last:
+                    yield f"======= {label}\n"
+                else:
+                    yield "=======\n"
+                yield from _with_newline(side_lines[ks[0]][x0:x1])
+                if i == last:
+                    yield f">>>>>>> {label}\n"
+
+
+def iter_merge_lines(base_lines, side_lines, names):
+    """
+    多方合并文本行（合并结果按需生成，不一次性放进内存）
+    :param base_lines: master的行列表
+    :param side_lines: 各分支的行列表
+    :param names: 各分支的名称
+    :return: (是否有冲突, 合并后的行（迭代器）)
+    """
+    # 常见情况：只有一个分支改了，或者大家改得一模一样
+    changed = [lines for lines in side_lines if lines != base_lines]
+    if not changed:
+        return False, iter(base_lines)
+    if all(lines == changed[0] for lines in changed):
+        return False, iter(changed[0])
+
+    ids = intern_lines(base_lines, *side_lines)
+    regions = merge_regions(ids[0], ids[1:])
+    has_conflict = any(region[0] == "conflict" for region in regions)
+    return has_conflict, render_regions(regions, base_lines, side_lines, names)
+
+
+def merge_lines(base_lines, side_lines, names):
+    """
+    多方合并文本行
+    :param base_lines: master的行列表
+    :param side_lines: 各分支的行列表
+    :param names: 各分支的名称
+    :return: (是否有冲突, 合并后的行列表)
+    """
+    has_conflict, merged = iter_merge_lines(base_lines, side_lines, names)
+    return has_conflict, list(merged)
@@ -0,0 +1,56 @@
+"""文件读写底层工具：零拷贝复制（在和t1共用的 common/fast_copy.py 里）、二进制文件识别"""
+import os
+import sys
+import codecs
+
+# 共用模块在仓库根目录的common文件夹
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from fast_copy import copy_file  # noqa: E402,F401
+
+# 二进制识别只看文件开头这么多字节
+SNIFF_SIZE = 8192
+
+# 常见二进制格式的文件头（图片、压缩包、PDF、可执行文件等）
+BINARY_MAGICS = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"%PDF", b"PK\x03\x04",
+    b"\x1f\x8b", b"7z\xbc\xaf\x27\x1c", b"Rar!", b"\x7fELF", b"OggS", b"fLaC",
+)
+
+
+def looks_binary(head):
+    """根据文件开头的内容判断是否为二进制文件（含NUL字节或是常见二进制格式）"""
+    return b"\x00" in head[:SNIFF_SIZE] or head.startswith(BINARY_MAGICS)
+
+
+def is_binary_file(file_path):
+    """只读取文件开头一小块，判断是否为二进制文件"""
+    with open(file_path, 'rb') as f:
+        return looks_binary(f.read(SNIFF_SIZE))
+
+
+def is_utf8_stream(f, chunk_size=1024 * 1024):
+    """逐块检查二进制流能否按UTF-8解码（内存只和块大小有关）"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                decoder.decode(b"", final=True)
+                return True
+            decoder.decode(chunk)
+    except UnicodeDecodeError:
+        return False
+
+
+def streams_equal(f1, f2, chunk_size=1024 * 1024):
+    """逐块比较两个二进制流的内容（压缩包成员没有路径，不能用filecmp）"""
+    while True:
+        chunk1 = f1.read(chunk_size)
+        chunk2 = f2.read(chunk_size)
+        if chunk1 != chunk2:
+            return False
+        if not chunk1:
+            return True
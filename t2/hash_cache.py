@@ -0,0 +1,123 @@
+import os
+import time
+import sqlite3
+import threading
+import hashlib
+import zlib
+
+# 缓存文件放在根目录下（和master、branch_a、branch_b同级，不会被当成分支文件扫描）
+CACHE_FILE_NAME = ".t2_hash_cache.sqlite"
+
+# 修改时间离本次运行太近的文件不写入缓存：同一时间精度内可能还会被改写，大小和时间都不变
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+def stream_digest(f):
+    """计算二进制流的内容摘要（BLAKE2b，按块读取）"""
+    return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=32)).digest()
+
+
+def stream_crc32(f):
+    """计算二进制流的CRC32（和zip中记录的校验值相同），返回4字节"""
+    crc = 0
+    while True:
+        chunk = f.read(1024 * 1024)
+        if not chunk:
+            break
+        crc = zlib.crc32(chunk, crc)
+    return crc.to_bytes(4, "big")
+
+
+def _to_sqlite_int(value):
+    """SQLite只支持有符号64位整数，超出范围的inode折算成负数保存"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class HashCache:
+    """文件摘要缓存：按 (路径, 大小, 修改时间, inode) 记录内容摘要，下次运行没变的文件不用再读"""
+
+    def __init__(self, base_path, rebuild=False):
+        """
+        初始化缓存
+        :param base_path: 根目录路径（缓存文件保存在这里）
+        :param rebuild: 为True时忽略已有缓存，本次运行重新计算所有摘要
+        """
+        self.cache_path = os.path.join(base_path, CACHE_FILE_NAME)
+        self.entries = {}  # 上次运行保存的条目：键 -> (大小, 修改时间, inode, 摘要)
+        self.used = {}  # 本次运行用到的条目（保存时只保留这些，其余视为过期淘汰）
+        self.hits = 0  # 命中次数（不用读文件）
+        self.misses = 0  # 未命中次数（需要读文件计算摘要）
+        self.bytes_read = 0  # 计算摘要读取的字节数
+        self._racy_after = 0  # 修改时间不早于这个时刻的文件不写入缓存
+        self.start_batch()
+        self._lock = threading.Lock()  # 多线程比较时保护计数和条目
+
+        if not rebuild:
+            self._load()
+
+    def start_batch(self):
+        """开始比较一批文件（监听模式常驻运行，"刚修改过"要以这一批开始的时间为准，不能一直用启动时间）"""
+        self._racy_after = time.time_ns() - RACY_WINDOW_NS
+
+    def _load(self):
+        """从SQLite文件读取上次保存的缓存（文件损坏就当没有缓存）"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            conn = sqlite3.connect(self.cache_path)
+            try:
+                rows = conn.execute("SELECT path, size, mtime_ns, inode, digest FROM digests").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return
+        for key, size, mtime_ns, inode, digest in rows:
+            self.entries[key] = (size, mtime_ns, inode, digest)
+
+    def digest(self, key, file_path, stat, opener=None, hasher=stream_digest):
+        """
+        获取文件内容摘要，stat没变时直接用缓存
+        :param key: 缓存键（相对根目录的路径，如 master/a.txt）
+        :param file_path: 文件绝对路径
+        :param stat: (大小, 修改时间纳秒, inode)
+        :param opener: 打开文件的函数（压缩包成员这类没有路径的文件），默认按file_path打开
+        :param hasher: 计算摘要的函数（参数为二进制流），默认BLAKE2b
+        :return: 摘要（bytes）
+        """
+        size, mtime_ns, inode = stat
+        inode = _to_sqlite_int(inode)
+
+        with self._lock:
+            entry = self.used.get(key) or self.entries.get(key)
+            if entry is not None and entry[:3] == (size, mtime_ns, inode):
+                self.hits += 1
+                self.used[key] = entry
+                return entry[3]
+            self.misses += 1
+            self.bytes_read += size
+
+        # 读文件计算摘要时不持有锁，其他线程可以同时计算
+        with (opener() if opener is not None else open(file_path, 'rb')) as f:
+            digest = hasher(f)
+        # 刚修改过的文件只在本次运行中使用，不写入缓存
+        if mtime_ns < self._racy_after:
+            with self._lock:
+                self.used[key] = (size, mtime_ns, inode, digest)
+        return digest
+
+    def save(self):
+        """保存本次用到的条目，没用到的旧条目一并淘汰"""
+        conn = sqlite3.connect(self.cache_path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS digests ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest BLOB)"
+                )
+                conn.execute("DELETE FROM digests")
+                conn.executemany(
+                    "INSERT INTO digests VALUES (?, ?, ?, ?, ?)",
+                    ((key,) + entry for key, entry in self.used.items())
+                )
+        finally:
+            conn.close()
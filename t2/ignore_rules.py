@@ -0,0 +1,175 @@
+"""
+忽略规则：写法和 .gitignore 相同
+
+    # 注释                    空行和#开头的行不起作用
+    node_modules/            以/结尾只匹配目录（任意层级）
+    *.pyc                    不含/的规则匹配任意层级的文件名或目录名
+    /build                   含/的规则从根目录开始匹配
+    docs/**/*.tmp            ** 匹配任意多层目录
+    !keep.pyc                !开头表示重新包含（后面的规则优先）
+
+目录被忽略时遍历直接跳过整个目录（和git一样，目录里的文件不能再用!重新包含）
+"""
+import os
+import re
+
+# 根目录下的忽略规则文件（和master、各分支文件夹同级）
+IGNORE_FILE_NAME = ".t2ignore"
+
+_GLOB_CHARS = re.compile(r"[*?\[\\]")
+
+
+def _translate(pattern):
+    """把一条通配符规则翻译成正则表达式（* ? 不匹配/，** 匹配任意多层目录）"""
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 1
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """编译好的忽略规则：不带通配符的文件名放进集合直接查，其余规则合并成一个正则"""
+
+    def __init__(self, patterns=()):
+        """
+        :param patterns: 规则列表（每一条的写法同 .gitignore 中的一行）
+        """
+        self.rules = []  # [(是否重新包含, 是否只匹配目录, 是否从根目录匹配, 正则)]
+        for line in patterns:
+            self._add(line)
+        self._compile()
+        self._dir_cache = {}  # 相对目录 -> 是否被忽略（判断单个文件时要检查它的每一级目录）
+
+    @classmethod
+    def load(cls, base_path, extra_patterns=None):
+        """
+        读取根目录下的 .t2ignore，再加上额外的规则（额外规则在后，优先级更高）
+        :return: IgnoreRules；没有任何规则时返回None
+        """
+        patterns = []
+        ignore_file = os.path.join(base_path, IGNORE_FILE_NAME)
+        if os.path.isfile(ignore_file):
+            with open(ignore_file, 'r', encoding='utf-8') as f:
+                patterns.extend(f.read().splitlines())
+        patterns.extend(extra_patterns or [])
+        rules = cls(patterns)
+        return rules if rules.rules else None
+
+    def _add(self, line):
+        """解析一行规则"""
+        line = line.rstrip("\n")
+        # 行尾空格不算（除非用\转义）
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        if not line or line.startswith("#"):
+            return
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]  # \# \! 开头表示字面字符
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return
+        # 开头或中间有/的规则从根目录开始匹配，否则匹配任意层级的名称
+        anchored = "/" in line
+        line = line.lstrip("/")
+        self.rules.append((negate, dir_only, anchored, line))
+
+    def _compile(self):
+        """编译规则；没有!规则时可以合并匹配，不用逐条检查"""
+        self._has_negation = any(rule[0] for rule in self.rules)
+        compiled = []
+        for negate, dir_only, anchored, pattern in self.rules:
+            compiled.append((negate, dir_only, anchored, re.compile(_translate(pattern) + r"\Z", re.S)))
+        self._compiled = compiled
+
+        # 快速路径：字面文件名（如 .git、node_modules）用集合，其余每种情况合并成一个正则
+        self._names = {False: set(), True: set()}  # 是否目录 -> 字面名称集合
+        groups = {(False, False): [], (False, True): [], (True, False): [], (True, True): []}
+        for negate, dir_only, anchored, pattern in self.rules:
+            if not anchored and not _GLOB_CHARS.search(pattern):
+                self._names[True].add(pattern)
+                if not dir_only:
+                    self._names[False].add(pattern)
+                continue
+            regex = _translate(pattern)
+            groups[(True, anchored)].append(regex)
+            if not dir_only:
+                groups[(False, anchored)].append(regex)
+        self._combined = {
+            key: re.compile("(?:" + "|".join(regexes) + r")\Z", re.S) if regexes else None
+            for key, regexes in groups.items()
+        }
+
+    def match(self, rel_path, is_dir=False):
+        """
+        判断单个条目本身是否被忽略（不检查上级目录，遍历时上级目录已经检查过了）
+        :param rel_path: 相对路径
+        :param is_dir: 是否是目录
+        """
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        name = rel_path.rsplit("/", 1)[-1]
+
+        if not self._has_negation:
+            if name in self._names[is_dir]:
+                return True
+            by_name = self._combined[(is_dir, False)]
+            if by_name is not None and by_name.match(name):
+                return True
+            by_path = self._combined[(is_dir, True)]
+            return by_path is not None and by_path.match(rel_path) is not None
+
+        # 有!规则时按顺序检查，最后一条匹配的规则说了算
+        for negate, dir_only, anchored, regex in reversed(self._compiled):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path if anchored else name):
+                return not negate
+        return False
+
+    def is_ignored(self, rel_path, is_dir=False):
+        """判断路径是否被忽略（它的任意一级上级目录被忽略也算）"""
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        parts = rel_path.split("/")
+        for i in range(1, len(parts)):
+            parent = "/".join(parts[:i])
+            ignored = self._dir_cache.get(parent)
+            if ignored is None:
+                ignored = self._dir_cache[parent] = self.match(parent, True)
+            if ignored:
+                return True
+        return self.match(rel_path, is_dir)
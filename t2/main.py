@@ -1,27 +1,175 @@
+import argparse
 
 if __name__ == "__main__":
     """导入三个类"""
     from detect_changes import ChangeDetector
     from conflict_detector import ConflictDetector
     from master_merge import MasterMerger
+    from compare_engine import DEFAULT_WORKERS
+    from metrics import PIPELINE_STAGE, RunMetrics, stage_timer
+    from ignore_rules import IgnoreRules
+    from transaction import MergeTransaction
+
+    # 命令行参数（都可以不填，直接运行就用下面的默认路径）
+    parser = argparse.ArgumentParser(description="多分支文件合并工具")
     # 你的文件夹路径
-    base_directory = r"C:\Users\花小譜\Desktop\test\t2"
+    parser.add_argument("base_directory", nargs="?", default=r"C:\Users\花小譜\Desktop\test\t2",
+                        help="根目录路径（包含master和各分支文件夹）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用摘要缓存，逐字节比较文件")
+    parser.add_argument("--rebuild-cache", action="store_true", help="丢弃已有摘要缓存，重新计算")
+    parser.add_argument("--workers", type=int, default=None, help="并行比较文件的线程数（1为串行）")
+    parser.add_argument("--branches", nargs="+", default=None,
+                        help="参与合并的分支文件夹名称，可以写任意多个（默认branch_a branch_b）；"
+                             "文件夹不存在时直接读取同名的.zip/.tar/.tar.gz压缩包")
+    parser.add_argument("--streaming", action="store_true",
+                        help="流式合并：修改文件逐个读取合并并立即写入master，内存只和最大的单个文件有关")
+    parser.add_argument("--metrics", default=None,
+                        help="运行指标输出文件（.jsonl每次运行追加一行，其他后缀写成JSON）")
+    parser.add_argument("--ignore", nargs="+", default=None, metavar="PATTERN",
+                        help="忽略规则（写法同.gitignore，如 .git/ node_modules/ *.pyc），和根目录下的.t2ignore一起生效")
+    parser.add_argument("--detect-renames", action="store_true",
+                        help="检测重命名/移动的文件，在master中直接移动，不再当成新增文件")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="流水线模式：找差异、判冲突、合并同时进行，每个文件比较完就立即判冲突并写入master")
+    parser.add_argument("--plan", default=None,
+                        help="只生成合并计划写入该文件（.gz结尾时压缩），打印要做的操作和预计读写量，不修改master")
+    parser.add_argument("--apply-plan", default=None,
+                        help="按之前保存的合并计划执行，不重新比较文件、不重新计算差异")
+    parser.add_argument("--transaction", action="store_true",
+                        help="事务合并：结果先并行写进影子目录并刷盘，全部写好再原子改名提交到master；"
+                             "中断后再次加这个参数运行会继续提交（或复用已经暂存好的文件）")
+    parser.add_argument("--rollback", action="store_true",
+                        help="撤销上次中断的事务合并，master恢复到合并之前")
+    parser.add_argument("--watch", action="store_true",
+                        help="监听模式：常驻运行，文件变化后只重新比较改动的文件（不执行合并，按Ctrl+C退出）")
+    args = parser.parse_args()
+    if args.pipeline and args.detect_renames:
+        parser.error("--pipeline 暂不支持 --detect-renames（重命名检测需要先比较完所有文件）")
+    if args.pipeline and (args.plan or args.apply_plan):
+        parser.error("--pipeline 不能和 --plan、--apply-plan 一起使用")
+    if args.plan and args.apply_plan:
+        parser.error("--plan 和 --apply-plan 不能同时使用")
+    if args.transaction and (args.pipeline or args.plan or args.apply_plan or args.watch):
+        parser.error("--transaction 不能和 --pipeline、--plan、--apply-plan、--watch 一起使用")
+    base_directory = args.base_directory
+    # 不指定--metrics时不统计任何指标
+    metrics = RunMetrics() if args.metrics else None
+    # 忽略规则（根目录下的.t2ignore加上--ignore），找差异、判冲突、合并都用同一套
+    ignore_rules = IgnoreRules.load(base_directory, args.ignore)
+
+    if args.rollback:
+        undone = MergeTransaction(base_directory).rollback()
+        print(f"已撤销上次中断的事务合并（恢复了{undone}个操作）" if undone else "没有需要撤销的事务合并")
+        raise SystemExit
+
+    if args.watch:
+        from watch_mode import WatchSession
+
+        session = WatchSession(base_directory, branches=args.branches, use_cache=not args.no_cache,
+                               ignore_rules=ignore_rules)
+
+        def print_state(count, seconds):
+            conflicts, merge_data = session.current_state()
+            conflict_count = sum(len(files) for files in conflicts.values())
+            merge_count = (len(merge_data["new_files"]) + len(merge_data["modified_files"]) +
+                           len(merge_data["binary_files"]))
+            print(f"[监听] 重新检测 {count} 个文件，用时 {seconds:.2f} 秒；"
+                  f"当前冲突 {conflict_count} 个，可合并 {merge_count} 个")
+
+        print(f"=== 监听模式（{session.mode}）: {base_directory}，按Ctrl+C退出 ===")
+        print_state(len(session.statuses), 0)
+        session.run(on_update=print_state)
+        raise SystemExit
 
     try:
-        """第一阶段===检测修改"""
-        ch_detector = ChangeDetector(base_directory)
-        # 执行检测并获取结果（结果可用于后续步骤）
-        changes_data = ch_detector.send_changes()
-        ch_detector.print_changes()
-
-        """第二阶段===检测冲突"""
-        co_detector = ConflictDetector(base_directory, changes_data)
-        co_detector.detect_all_conflicts()
-        co_detector.print_conflict_report()
-
-        """第三阶段===执行合并"""
-        merge = MasterMerger(base_directory, co_detector.conflicts, co_detector.merge_data)
-        merge.merge()
-        merge.print_merge_report()
+        transaction = None
+        if args.transaction:
+            transaction = MergeTransaction(base_directory, workers=args.workers or DEFAULT_WORKERS)
+            if transaction.pending() == "prepared":
+                # 上次提交到一半中断的，把剩下的提交完就结束（master不是各分支的共同祖先了，不能再合并一次）
+                applied = transaction.recover()
+                print(f"上次中断的事务合并已继续提交完成（{applied}个操作），master已是合并后的状态")
+                raise SystemExit
+        elif MergeTransaction(base_directory).pending() == "prepared":
+            raise RuntimeError("上次的事务合并没有提交完，请用 --transaction 继续提交，或用 --rollback 撤销")
+
+        if args.apply_plan:
+            """按保存的合并计划执行（不重新检测）"""
+            from merge_plan import load_plan
+
+            plan = load_plan(args.apply_plan)
+            merge = MasterMerger(base_directory, plan["conflicts"], None, metrics=metrics, ignore_rules=ignore_rules)
+            with stage_timer(metrics, "merge"):
+                merge.execute_plan(plan)
+            merge.print_merge_report()
+            branches = plan["branches"]
+        elif args.pipeline:
+            """三个阶段流水线执行"""
+            from pipeline import PipelineExecutor
+
+            executor = PipelineExecutor(base_directory, use_cache=not args.no_cache,
+                                        rebuild_cache=args.rebuild_cache,
+                                        workers=args.workers or DEFAULT_WORKERS,
+                                        branches=args.branches, streaming=args.streaming, metrics=metrics,
+                                        ignore_rules=ignore_rules)
+            with stage_timer(metrics, PIPELINE_STAGE):
+                changes_data = executor.run()
+            ch_detector, co_detector, merge = executor.detector, executor.co_detector, executor.merger
+            # 三个阶段同时进行，全部完成后再按顺序打印报告（内容和分阶段执行相同）
+            ch_detector.print_changes(changes_data)
+            co_detector.print_conflict_report()
+            merge.print_merge_report()
+            branches = ch_detector.branches
+        else:
+            """第一阶段===检测修改"""
+            ch_detector = ChangeDetector(base_directory, use_cache=not args.no_cache,
+                                         rebuild_cache=args.rebuild_cache,
+                                         workers=args.workers or DEFAULT_WORKERS,
+                                         branches=args.branches, metrics=metrics,
+                                         detect_renames=args.detect_renames, ignore_rules=ignore_rules)
+            # 执行检测并获取结果（结果可用于后续步骤）
+            with stage_timer(metrics, "detect"):
+                changes_data = ch_detector.send_changes()
+            ch_detector.print_changes(changes_data)
+            branches = ch_detector.branches
+
+            if args.plan:
+                """只生成合并计划，不修改master"""
+                from merge_plan import MergePlanner, save_plan, print_plan_summary
+
+                planner = MergePlanner(base_directory, changes_data, metrics=metrics, ignore_rules=ignore_rules,
+                                       archives=ch_detector.archives)
+                with stage_timer(metrics, "plan"):
+                    plan = planner.build()
+                save_plan(plan, args.plan)
+                planner.co_detector.print_conflict_report()
+                print_plan_summary(plan)
+                print(f"\n合并计划已写入: {args.plan}（用 --apply-plan 执行）")
+            else:
+                """第二阶段===检测冲突"""
+                co_detector = ConflictDetector(base_directory, changes_data, streaming=args.streaming, metrics=metrics,
+                                               ignore_rules=ignore_rules, archives=ch_detector.archives)
+                if transaction is not None:
+                    co_detector.renames_applied = False  # 事务合并的移动在提交时才执行
+                with stage_timer(metrics, "conflict"):
+                    co_detector.detect_all_conflicts()
+                # 流式模式下双方都修改的文件要合并时才知道有没有冲突，报告放到合并之后打印
+                if not args.streaming:
+                    co_detector.print_conflict_report()
+
+                """第三阶段===执行合并"""
+                merge = MasterMerger(base_directory, co_detector.conflicts, co_detector.merge_data, metrics=metrics,
+                                     ignore_rules=ignore_rules, archives=ch_detector.archives,
+                                     transaction=transaction)
+                with stage_timer(metrics, "merge"):
+                    merge.merge()
+                if args.streaming:
+                    co_detector.print_conflict_report()
+                merge.print_merge_report()
+
+        # 输出运行指标
+        if metrics is not None:
+            metrics.write(args.metrics, base_path=base_directory, branches=branches)
+            print(f"\n运行指标已写入: {args.metrics}")
     except Exception as e:
         print(f"错误: {str(e)}")
@@ -1,85 +1,401 @@
 import os
+import io
+import json
 import shutil
+import hashlib
+
+from file_io import copy_file
+from diff3 import render_regions
+from tree_source import ArchiveTrees
 
 
 class MasterMerger:
-    def __init__(self, base_path, conflicts, merge_data):
+    def __init__(self, base_path, conflicts, merge_data, metrics=None, ignore_rules=None, archives=None,
+                 transaction=None):
         """
         初始化合并器
         :param base_path: 根目录路径
         :param conflicts: 第二阶段检测到的冲突信息
         :param merge_data: 第二阶段准备的可合并数据
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的文件不写入master
+        :param archives: 压缩包分支（ChangeDetector.archives），默认用到时自己打开
+        :param transaction: 事务（MergeTransaction）：merge时先把结果并行暂存，全部写好再一次性提交到master；
+                            流式模式下要把ConflictDetector.renames_applied设为False（移动要到提交时才执行）
         """
         self.base_path = base_path
         self.master_path = os.path.join(base_path, "master")
-        self.branch_a_path = os.path.join(base_path, "branch_a")
-        self.branch_b_path = os.path.join(base_path, "branch_b")
         self.conflicts = conflicts
         self.merge_data = merge_data
+        self.metrics = metrics
+        self.ignore_rules = ignore_rules
+        self.archives = archives if archives is not None else ArchiveTrees(base_path, ignore_rules)
+        self.transaction = transaction
 
         # 记录合并结果
         self.merge_result = {
             "success_new": [],  # 成功合并的新增文件
             "success_modified": [],  # 成功合并的修改文件
+            "success_renamed": [],  # 成功移动的文件（(原路径, 新路径)）
             "conflict_files": []  # 存在冲突的文件（需手动处理）
         }
 
-    def _copy_new_file(self, file_path, source_branch):
-        """复制新增文件到master"""
-        # 确定源文件路径
-        if source_branch == "branch_a":
-            source_path = os.path.join(self.branch_a_path, file_path)
-        else:
-            source_path = os.path.join(self.branch_b_path, file_path)
+        # 复制/写入单个文件（开启指标统计时记录每个文件的耗时）
+        self._copy_file = self._copy_new_file
+        self._write_file = self._write_modified_file
+        self._stage_copy = self._produce_copy
+        self._stage_lines = self._produce_lines
+        if metrics is not None:
+            self._copy_file = metrics.timed("merge", self._copy_file)
+            self._write_file = metrics.timed("merge", self._write_file)
+            self._stage_copy = metrics.timed("merge", self._stage_copy)
+            self._stage_lines = metrics.timed("merge", self._stage_lines)
 
+    def _copy_new_file(self, file_path, source_branch, source_file=None):
+        """
+        复制新增文件到master（二进制修改文件也整个复制，同样走这里）
+        :param source_file: 文件在分支中的相对路径（默认与file_path相同）
+        """
         # 确定目标文件路径
         target_path = os.path.join(self.master_path, file_path)
 
         # 创建目标目录（如果不存在）
         os.makedirs(os.path.dirname(target_path), exist_ok=True)
 
-        # 复制文件
-        shutil.copy2(source_path, target_path)
+        self._produce_copy(file_path, target_path, source_branch, source_file)
+        return target_path
+
+    def _produce_copy(self, file_path, target_path, source_branch, source_file=None):
+        """把分支中的文件写到target_path（master或事务的暂存文件）"""
+        archive = self.archives[source_branch]
+        if archive is not None:
+            # 压缩包分支：边解压边写入
+            archive.extract(source_file or file_path, target_path)
+        else:
+            # 确定源文件路径（分支文件夹和master同级），优先reflink/copy_file_range等零拷贝方式复制
+            copy_file(os.path.join(self.base_path, source_branch, source_file or file_path), target_path)
+        self._count_written(target_path)
+
+    def _produce_lines(self, file_path, target_path, content_lines):
+        """把合并后的内容写到target_path"""
+        with open(target_path, 'w', encoding='utf-8') as f:
+            f.writelines(content_lines)
+        self._count_written(target_path)
+
+    def _rename_file(self, old_path, new_path):
+        """在master中移动重命名的文件（同一文件系统内只改目录项，不复制数据）"""
+        source_path = os.path.join(self.master_path, old_path)
+        target_path = os.path.join(self.master_path, new_path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(source_path, target_path)
         return target_path
 
     def _write_modified_file(self, file_path, content_lines):
-        """将修改后的内容写入master文件"""
+        """将修改后的内容写入master文件（content_lines可以是行列表，也可以是边读边合并的迭代器）"""
         target_path = os.path.join(self.master_path, file_path)
 
         # 创建目标目录（如果不存在）
         os.makedirs(os.path.dirname(target_path), exist_ok=True)
 
-        # 写入内容
-        with open(target_path, 'w', encoding='utf-8') as f:
-            f.writelines(content_lines)
+        # 先写临时文件再替换：流式合并时还要读取master中的原文件，不能提前清空它
+        temp_path = target_path + ".t2tmp"
+        try:
+            self._produce_lines(file_path, temp_path, content_lines)
+            if os.path.exists(target_path):
+                shutil.copymode(target_path, temp_path)  # 保留原文件的权限（如可执行位）
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
         return target_path
 
+    def _count_written(self, target_path):
+        """统计写入的字节数（没有开启指标统计时什么都不做）"""
+        if self.metrics is not None:
+            self.metrics.add("bytes_written", os.path.getsize(target_path))
+
+    def _skip_ignored(self, *file_paths):
+        """被忽略的文件不写入master（比如按忽略规则生效之前生成的合并计划执行时）"""
+        if self.ignore_rules is None:
+            return False
+        for file_path in file_paths:
+            if self.ignore_rules.is_ignored(file_path):
+                print(f"跳过被忽略的文件: {file_path}")
+                return True
+        return False
+
+    def merge_new_file(self, file_path, source_branch):
+        """合并单个新增文件，返回是否成功"""
+        if self._skip_ignored(file_path):
+            return False
+        try:
+            self._copy_file(file_path, source_branch)
+            return True
+        except Exception as e:
+            print(f"警告：新增文件 {file_path} 合并失败 - {str(e)}")
+            return False
+
+    def merge_modified_file(self, file_path, content_lines):
+        """合并单个修改文件，返回是否成功"""
+        if self._skip_ignored(file_path):
+            return False
+        try:
+            self._write_file(file_path, content_lines)
+            return True
+        except Exception as e:
+            print(f"警告：修改文件 {file_path} 合并失败 - {str(e)}")
+            return False
+
+    def merge_renamed_file(self, old_path, new_path):
+        """在master中移动单个重命名的文件，返回是否成功"""
+        if self._skip_ignored(old_path, new_path):
+            return False
+        try:
+            self._rename_file(old_path, new_path)
+            return True
+        except Exception as e:
+            print(f"警告：重命名 {old_path} -> {new_path} 失败 - {str(e)}")
+            return False
+
+    def merge_binary_file(self, file_path, source_branch):
+        """合并单个二进制修改文件（整个复制，不按行写入），返回是否成功"""
+        if self._skip_ignored(file_path):
+            return False
+        try:
+            self._copy_file(file_path, source_branch)
+            return True
+        except Exception as e:
+            print(f"警告：二进制文件 {file_path} 合并失败 - {str(e)}")
+            return False
+
+    def collect_conflicts(self):
+        """收集所有冲突文件"""
+        self.merge_result["conflict_files"] = (
+                self.conflicts["new_files_conflict"] +
+                self.conflicts["modified_files_conflict"] +
+                self.conflicts["binary_files_conflict"] +
+                self.conflicts["rename_conflict"]
+        )
+
     def merge(self):
         """执行合并操作"""
+        if self.transaction is not None:
+            return self._merge_in_transaction()
+
+        # 0. 先移动重命名的文件（改名后又有修改的，后面按修改文件覆盖新路径的内容）
+        for old_path, new_path in self.merge_data["renamed_files"]:
+            if self.merge_renamed_file(old_path, new_path):
+                self.merge_result["success_renamed"].append((old_path, new_path))
+
         # 1. 处理新增文件
-        for file_path, source_branch in self.merge_data["new_files"]:
-            try:
-                self._copy_new_file(file_path, source_branch)
-                self.merge_result["success_new"].append(file_path)
-            except Exception as e:
-                print(f"警告：新增文件 {file_path} 合并失败 - {str(e)}")
+        self.merge_result["success_new"].extend(
+            self._merge_in_read_order(self.merge_data["new_files"], self.merge_new_file))
 
         # 2. 处理修改文件
+        self.merge_result["success_modified"].extend(
+            self._merge_in_read_order(list(self.merge_data["modified_files"].items()), self.merge_modified_file))
+
+        # 3. 处理二进制修改文件
+        self.merge_result["success_modified"].extend(
+            self._merge_in_read_order(self.merge_data["binary_files"], self.merge_binary_file))
+
+        # 4. 收集所有冲突文件（流式合并的冲突是写入时按读取顺序发现的，按路径排序）
+        self.conflicts["modified_files_conflict"].sort()
+        self.collect_conflicts()
+
+        return self.merge_result
+
+    def _merge_in_read_order(self, items, merge_one):
+        """
+        逐个合并，有tar包分支时按成员在包里的顺序读取（压缩的tar包往回跳要从头解压）
+        :param items: [(文件路径, 来源分支或合并内容)]
+        :param merge_one: 合并单个文件的函数，参数同items中的条目，返回是否成功
+        :return: 合并成功的文件路径（按items原来的顺序）
+        """
+        done = set()
+        for item in self.archives.read_order(items, self._item_sources):
+            if merge_one(*item):
+                done.add(item[0])
+        return [item[0] for item in items if item[0] in done]
+
+    @staticmethod
+    def _item_sources(item):
+        """合并条目要读取的 [(分支名称, 分支中的相对路径)]"""
+        file_path, source = item
+        if isinstance(source, str):
+            return [(source, file_path)]  # 整个复制的文件：来源分支
+        if isinstance(source, list):
+            return []  # 已经读进内存的合并结果
+        if isinstance(source, dict):
+            # 合并计划中的修改操作
+            return [(b, source.get("sources", {}).get(b, file_path)) for b in source["branches"]]
+        return source.sources()  # StreamedMerge
+
+    def _copy_key(self, source_branch, file_path):
+        """整个复制的文件的输入指纹（分支文件的路径、大小、修改时间）"""
+        archive = self.archives[source_branch]
+        if archive is not None:
+            return json.dumps(["copy", source_branch, file_path] + list(archive.stat(file_path)))
+        st = os.stat(os.path.join(self.base_path, source_branch, file_path))
+        return json.dumps(["copy", source_branch, file_path, st.st_size, st.st_mtime_ns])
+
+    @staticmethod
+    def _content_key(content_lines):
+        """修改文件的输入指纹：已经在内存里的内容直接算摘要，流式合并的用输入文件的stat"""
+        if isinstance(content_lines, list):
+            h = hashlib.blake2b(digest_size=16)
+            for line in content_lines:
+                h.update(line.encode('utf-8'))
+            return json.dumps(["lines", h.hexdigest()])
+        return json.dumps(["merge", content_lines.fingerprint()])
+
+    def _merge_in_transaction(self):
+        """
+        事务合并：所有结果先并行暂存到影子目录，全部写好、刷盘之后再按顺序原子改名到master
+        暂存失败的文件不提交，和逐个写入时一样打印警告
+        """
+        txn = self.transaction
+        txn.begin()
+        staged = []  # (说明, 结果列表名称, 文件路径, 来源分支或合并内容)，按报告顺序
+
+        for old_path, new_path in self.merge_data["renamed_files"]:
+            if not self._skip_ignored(old_path, new_path):
+                txn.stage_move(old_path, new_path)
+
+        for file_path, source_branch in self.merge_data["new_files"]:
+            if not self._skip_ignored(file_path):
+                staged.append(("新增文件", "success_new", file_path, source_branch))
         for file_path, content_lines in self.merge_data["modified_files"].items():
+            if not self._skip_ignored(file_path):
+                staged.append(("修改文件", "success_modified", file_path, content_lines))
+        for file_path, source_branch in self.merge_data["binary_files"]:
+            if not self._skip_ignored(file_path):
+                staged.append(("二进制文件", "success_modified", file_path, source_branch))
+
+        # 修改文件沿用master中原文件的权限（重命名的文件提交时才移动，暂存时还在原路径）
+        rename_bases = {new_path: old_path for old_path, new_path in self.merge_data["renamed_files"]}
+        # 有tar包分支时按成员在包里的顺序提交给暂存线程
+        for _, _, file_path, source in self.archives.read_order(staged, lambda job: self._item_sources(job[2:])):
+            if isinstance(source, str):
+                txn.stage_write(file_path, self._copy_key(source, file_path),
+                                lambda target, f=file_path, b=source: self._stage_copy(f, target, b))
+            else:
+                txn.stage_write(file_path, self._content_key(source),
+                                lambda target, f=file_path, c=source: self._stage_merged(f, target, c),
+                                on_reuse=lambda meta, f=file_path: self._restore_conflict(f, meta),
+                                mode_from=rename_bases.get(file_path, file_path))
+
+        errors = txn.prepare()
+        txn.commit()
+
+        self.merge_result["success_renamed"].extend(op[1:] for op in txn.ops if op[0] == "move")
+        for label, result_key, file_path, _ in staged:
+            if file_path in errors:
+                print(f"警告：{label} {file_path} 合并失败 - {str(errors[file_path])}")
+            else:
+                self.merge_result[result_key].append(file_path)
+        # 流式合并时冲突是在各线程里发现的，按路径排序（和逐个写入时的顺序相同）
+        self.conflicts["modified_files_conflict"].sort()
+        self.collect_conflicts()
+        return self.merge_result
+
+    def _stage_merged(self, file_path, target_path, content_lines):
+        """
+        暂存修改文件
+        :return: 随日志保存的信息：是否有冲突（流式合并边写边发现冲突，中断后复用暂存结果时要靠它恢复）
+        """
+        self._stage_lines(file_path, target_path, content_lines)
+        return {"conflict": file_path in self.conflicts["modified_files_conflict"]}
+
+    def _restore_conflict(self, file_path, meta):
+        """复用暂存结果时，恢复当时发现的冲突（非流式模式下冲突已经在判冲突阶段记录过了）"""
+        conflicts = self.conflicts["modified_files_conflict"]
+        if meta and meta.get("conflict") and file_path not in conflicts:
+            conflicts.append(file_path)
+
+    def _stale_sources(self, sources):
+        """找出生成计划之后被修改过的源文件（大小或修改时间变了，或者文件不存在了）"""
+        stale = []
+        for key, (size, mtime_ns) in sources.items():
             try:
-                self._write_modified_file(file_path, content_lines)
-                self.merge_result["success_modified"].append(file_path)
-            except Exception as e:
-                print(f"警告：修改文件 {file_path} 合并失败 - {str(e)}")
+                st = os.stat(os.path.join(self.base_path, key))
+            except OSError:
+                stale.append(key)
+                continue
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                stale.append(key)
+        return stale
 
-        # 3. 收集所有冲突文件
-        self.merge_result["conflict_files"] = (
-                self.conflicts["new_files_conflict"] +
-                self.conflicts["modified_files_conflict"]
-        )
+    def _read_lines(self, file_path):
+        """读取文件内容为行列表（不存在则返回空列表）"""
+        if not os.path.exists(file_path):
+            return []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", os.fstat(f.fileno()).st_size)
+            return f.readlines()
+
+    def _read_branch_lines(self, branch_name, rel_path):
+        """读取分支文件内容为行列表（压缩包分支边解压边读）"""
+        archive = self.archives[branch_name]
+        if archive is None:
+            return self._read_lines(os.path.join(self.base_path, branch_name, rel_path))
+        if rel_path not in archive:
+            return []
+        with archive.open(rel_path) as f:
+            if self.metrics is not None:
+                self.metrics.add("bytes_read", archive.stat(rel_path)[0])
+            return io.TextIOWrapper(f, encoding='utf-8').readlines()
 
+    def _iter_plan_lines(self, op):
+        """按计划中保存的合并区域拼接文件内容（要读文件，但不重新计算差异）"""
+        file_path = op["path"]
+        sources = op.get("sources", {})
+        # 移动已经先执行过，master中的原文件已经在新路径上
+        base_lines = self._read_lines(os.path.join(self.master_path, file_path))
+        side_lines = [self._read_branch_lines(b, sources.get(b, file_path)) for b in op["branches"]]
+        yield from render_regions(op["regions"], base_lines, side_lines, op["branches"])
+
+    def execute_plan(self, plan):
+        """
+        按合并计划执行：不重新比较文件，也不重新计算差异
+        （创建合并器时conflicts传入plan["conflicts"]，报告中才能标出冲突文件）
+        :param plan: merge_plan.load_plan读取的计划
+        """
+        # 计划依赖的文件有任何变化，合并区域就可能对不上，整个计划作废
+        stale = self._stale_sources(plan["sources"])
+        if stale:
+            raise RuntimeError(f"合并计划已过期：{len(stale)}个文件在生成计划后被修改（如 {stale[0]}），请重新生成计划")
+
+        operations = plan["operations"]
+        for old_path, new_path in operations["move"]:
+            if self.merge_renamed_file(old_path, new_path):
+                self.merge_result["success_renamed"].append((old_path, new_path))
+
+        self.merge_result["success_new"].extend(self._merge_in_read_order(operations["new"], self.merge_new_file))
+        self.merge_result["success_modified"].extend(self._merge_in_read_order(
+            [(op["path"], op) for op in operations["modified"]], self._apply_modified_op))
+        self.merge_result["success_modified"].extend(
+            self._merge_in_read_order(operations["binary"], self.merge_binary_file))
+
+        self.collect_conflicts()
         return self.merge_result
 
+    def _apply_modified_op(self, file_path, op):
+        """执行计划中的一个修改操作，返回是否成功"""
+        if "regions" in op:
+            return self.merge_modified_file(file_path, self._iter_plan_lines(op))
+        if self._skip_ignored(file_path):
+            return False
+        # 只有一个分支修改：整个复制
+        branch = op["branches"][0]
+        try:
+            self._copy_file(file_path, branch, op.get("sources", {}).get(branch))
+            return True
+        except Exception as e:
+            print(f"警告：修改文件 {file_path} 合并失败 - {str(e)}")
+            return False
+
     def print_merge_report(self):
         """打印合并报告"""
         print("\n=== 合并到master结果报告 ===")
@@ -89,6 +405,12 @@ class MasterMerger:
         for file in self.merge_result["success_new"]:
             print(f"  + {file}")
 
+        # 成功移动的重命名文件
+        if self.merge_result["success_renamed"]:
+            print(f"\n成功移动重命名文件: {len(self.merge_result['success_renamed'])}个")
+            for old_path, new_path in self.merge_result["success_renamed"]:
+                print(f"  > {old_path} -> {new_path}")
+
         # 成功合并的修改文件
         print(f"\n成功合并修改文件: {len(self.merge_result['success_modified'])}个")
         for file in self.merge_result["success_modified"]:
@@ -102,7 +424,11 @@ class MasterMerger:
             print(f"\n需手动处理的冲突文件: {len(self.merge_result['conflict_files'])}个")
             for file in self.merge_result["conflict_files"]:
                 if file in self.conflicts["new_files_conflict"]:
-                    print(f"  ! {file}: 两个分支都新增了同名文件，请手动选择保留哪个版本")
+                    print(f"  ! {file}: 多个分支都新增了同名文件，请手动选择保留哪个版本")
+                elif file in self.conflicts["rename_conflict"]:
+                    print(f"  ! {file}: 多个分支的改名互相冲突，master中保留原文件，请手动决定新名称")
+                elif file in self.conflicts["binary_files_conflict"]:
+                    print(f"  ! {file}: 二进制文件无法标记冲突，master中保留原文件，请手动选择保留哪个版本")
                 else:
                     print(f"  ! {file}: 存在内容冲突，请打开master中的文件解决冲突标记")
 
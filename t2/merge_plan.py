@@ -0,0 +1,201 @@
+"""
+合并计划：先不动master，算出合并要做什么、要读写多少字节，保存成文件，之后再按计划执行
+
+计划里记录每个文件的操作（移动/复制/按区域合并）、多个分支都修改的文件的合并区域（含冲突块），
+以及计划依赖的每个源文件的 (大小, 修改时间)。执行时只检查这些文件没有变过，不重新比较，也不重新计算差异。
+"""
+import os
+import gzip
+import json
+import time
+
+from conflict_detector import ConflictDetector
+from diff3 import intern_lines, merge_regions, render_regions
+
+PLAN_VERSION = 1
+
+
+class MergePlanner:
+    """生成合并计划：只有多个分支都修改的文本文件需要读内容，其余只看stat"""
+
+    def __init__(self, base_path, changes, metrics=None, ignore_rules=None, archives=None):
+        """
+        :param base_path: 根目录路径（包含master和各分支文件夹）
+        :param changes: ChangeDetector.send_changes的结果
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的文件不进入计划
+        :param archives: 压缩包分支（ChangeDetector.archives），默认用到时自己打开
+        """
+        self.base_path = base_path
+        self.branches = list(changes.keys())
+        # 流式模式的冲突检测不读文件内容，只登记要合并的文件
+        self.co_detector = ConflictDetector(base_path, changes, streaming=True, metrics=metrics,
+                                            ignore_rules=ignore_rules, archives=archives)
+        self.sources = {}  # 计划依赖的源文件（相对根目录，压缩包分支记录压缩包本身）-> [大小, 修改时间纳秒]
+        self.estimate = {
+            "read_bytes": 0,  # 执行时要读取的字节数
+            "write_bytes": 0,  # 执行时要写入的字节数
+            "copy_bytes": 0,  # 其中整个复制的字节数（支持reflink/copy_file_range时几乎不花时间）
+            "plan_read_bytes": 0,  # 生成计划时读取的字节数
+        }
+
+    def _add_source(self, tree_name, rel_path):
+        """记录计划依赖的源文件，返回文件大小"""
+        archive = self.co_detector.archives[tree_name] if tree_name != "master" else None
+        if archive is not None:
+            # 压缩包里的成员不能单独检查，压缩包本身没变成员就没变
+            key = os.path.relpath(archive.root_dir, self.base_path)
+            if key not in self.sources:
+                st = os.stat(archive.root_dir)
+                self.sources[key] = [st.st_size, st.st_mtime_ns]
+            return archive.stat(rel_path)[0]
+        key = os.path.join(tree_name, rel_path)
+        if key not in self.sources:
+            st = os.stat(os.path.join(self.base_path, key))
+            self.sources[key] = [st.st_size, st.st_mtime_ns]
+        return self.sources[key][0]
+
+    def _add_copy(self, tree_name, rel_path):
+        """整个复制的文件：读写各一遍"""
+        size = self._add_source(tree_name, rel_path)
+        self.estimate["read_bytes"] += size
+        self.estimate["write_bytes"] += size
+        self.estimate["copy_bytes"] += size
+
+    def _plan_merge(self, file, branches):
+        """
+        多个分支都修改的文件：现在就计算合并区域，执行时按区域拼接
+        :return: 计划中的操作；不是UTF-8文本时返回None（改为二进制处理）
+        """
+        co_detector = self.co_detector
+        base_file = co_detector.rename_bases.get(file, file)
+        sources = {b: self._source(file, b) for b in branches}
+        try:
+            base_lines = co_detector._read_file_lines(os.path.join(co_detector.master_path, base_file))
+            side_lines = [co_detector._read_branch_lines(b, file) for b in branches]
+        except UnicodeDecodeError:
+            return None
+
+        ids = intern_lines(base_lines, *side_lines)
+        regions = merge_regions(ids[0], ids[1:])
+        conflict_hunks = sum(1 for region in regions if region[0] == "conflict")
+        merged_bytes = sum(len(line.encode('utf-8')) for line in render_regions(regions, base_lines, side_lines,
+                                                                                 branches))
+        read_bytes = self._add_source("master", base_file)
+        for b in branches:
+            read_bytes += self._add_source(b, sources[b])
+        self.estimate["plan_read_bytes"] += read_bytes
+        self.estimate["read_bytes"] += read_bytes
+        self.estimate["write_bytes"] += merged_bytes
+
+        op = {"path": file, "branches": branches, "regions": regions, "conflict_hunks": conflict_hunks}
+        renamed = {b: rel for b, rel in sources.items() if rel != file}
+        if renamed:
+            op["sources"] = renamed
+        return op
+
+    def _source(self, file, branch_name):
+        """分支中该文件的相对路径（被其他分支重命名的文件，这个分支里还在原路径）"""
+        return self.co_detector.rename_sources.get(file, {}).get(branch_name, file)
+
+    def build(self):
+        """
+        生成合并计划
+        :return: 计划（可以直接写成JSON的字典）
+        """
+        co_detector = self.co_detector
+        co_detector.detect_all_conflicts()
+        merge_data = co_detector.merge_data
+        operations = {"move": [], "new": [], "modified": [], "binary": []}
+
+        for old_path, new_path in merge_data["renamed_files"]:
+            self._add_source("master", old_path)
+            operations["move"].append([old_path, new_path])
+
+        for file, branch in merge_data["new_files"]:
+            self._add_copy(branch, file)
+            operations["new"].append([file, branch])
+
+        # 有tar包分支时按成员在包里的顺序读取，计划里的操作最后再按路径排好
+        for file, item in co_detector.archives.read_order(list(merge_data["modified_files"].items()),
+                                                          lambda entry: entry[1].sources()):
+            branches = item.branches
+            if len(branches) == 1:
+                # 只有一个分支修改：整个复制该分支的版本，不用读内容
+                source = self._source(file, branches[0])
+                self._add_copy(branches[0], source)
+                op = {"path": file, "branches": branches}
+                if source != file:
+                    op["sources"] = {branches[0]: source}
+                operations["modified"].append(op)
+                continue
+            op = self._plan_merge(file, branches)
+            if op is None:
+                # 不是UTF-8文本，当作二进制文件整体处理
+                del merge_data["modified_files"][file]
+                co_detector._merge_binary_file(file, branches)
+                continue
+            if op["conflict_hunks"]:
+                co_detector.conflicts["modified_files_conflict"].append(file)
+            operations["modified"].append(op)
+
+        operations["modified"].sort(key=lambda op: op["path"])
+        co_detector.conflicts["modified_files_conflict"].sort()
+        # 生成计划时才发现的二进制文件也按路径排序
+        merge_data["binary_files"].sort()
+        co_detector.conflicts["binary_files_conflict"].sort()
+        for file, branch in merge_data["binary_files"]:
+            self._add_copy(branch, file)
+            operations["binary"].append([file, branch])
+
+        return {
+            "version": PLAN_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "base_path": self.base_path,
+            "branches": self.branches,
+            "operations": operations,
+            "conflicts": co_detector.conflicts,
+            "sources": self.sources,
+            "estimate": self.estimate,
+        }
+
+
+def save_plan(plan, path):
+    """保存合并计划（紧凑JSON，文件名以.gz结尾时压缩）"""
+    data = json.dumps(plan, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'wb') as f:
+        f.write(data)
+
+
+def load_plan(path):
+    """读取合并计划"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        plan = json.loads(f.read().decode('utf-8'))
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支持的合并计划版本: {plan.get('version')}")
+    return plan
+
+
+def print_plan_summary(plan):
+    """打印合并计划摘要"""
+    operations = plan["operations"]
+    estimate = plan["estimate"]
+    print("\n=== 合并计划 ===")
+    print(f"  移动文件: {len(operations['move'])}个")
+    print(f"  新增文件: {len(operations['new'])}个")
+    print(f"  修改文件: {len(operations['modified'])}个"
+          f"（其中需要多方合并 {sum(1 for op in operations['modified'] if 'regions' in op)}个）")
+    print(f"  二进制文件: {len(operations['binary'])}个")
+
+    conflict_count = sum(len(files) for files in plan["conflicts"].values())
+    print(f"  冲突文件: {conflict_count}个")
+    for op in operations["modified"]:
+        if op.get("conflict_hunks"):
+            print(f"    - {op['path']}: {op['conflict_hunks']}处冲突（{'、'.join(op['branches'])}）")
+
+    mb = 1024 * 1024
+    print(f"\n预计读取: {estimate['read_bytes'] / mb:.2f} MB，预计写入: {estimate['write_bytes'] / mb:.2f} MB"
+          f"（其中整个复制 {estimate['copy_bytes'] / mb:.2f} MB）")
+    print(f"生成计划时读取: {estimate['plan_read_bytes'] / mb:.2f} MB")
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import heapq
+import threading
+from contextlib import contextmanager, nullcontext
+
+# 流水线模式下找差异、判冲突、合并同时进行，只统计这一个总阶段的耗时
+PIPELINE_STAGE = "pipeline"
+
+
+class RunMetrics:
+    """运行指标：各阶段耗时、扫描文件数、读写字节数、缓存命中、最慢的文件、线程利用率"""
+
+    def __init__(self, slowest_n=10):
+        """
+        :param slowest_n: 记录最慢的多少个文件
+        """
+        self.slowest_n = slowest_n
+        self.stages = {}  # 阶段名 -> 耗时（秒）
+        self.counters = {
+            "files_scanned": 0,  # 扫描到的文件数
+            "bytes_read": 0,  # 读取的字节数
+            "bytes_written": 0,  # 写入的字节数
+            "cache_hits": 0,  # 摘要缓存命中
+            "cache_misses": 0,  # 摘要缓存未命中
+        }
+        self.workers = 1  # 比较文件的线程数
+        self._slowest = []  # 小顶堆：(耗时, 阶段, 文件)
+        self._busy = {}  # (阶段, 线程) -> 累计工作时间
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """统计一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def add(self, counter, value):
+        """累加计数"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def timed(self, stage, func):
+        """
+        包装处理单个文件的函数：记录每个文件的耗时和所在线程的工作时间
+        被包装函数的第一个参数必须是文件相对路径
+        """
+        def wrapper(file, *args):
+            start = time.perf_counter()
+            try:
+                return func(file, *args)
+            finally:
+                self._record_file(stage, file, time.perf_counter() - start)
+        return wrapper
+
+    def _record_file(self, stage, file, seconds):
+        """记录单个文件的耗时（只保留最慢的N个）"""
+        key = (stage, threading.current_thread().name)
+        with self._lock:
+            self._busy[key] = self._busy.get(key, 0) + seconds
+            item = (seconds, stage, file)
+            if len(self._slowest) < self.slowest_n:
+                heapq.heappush(self._slowest, item)
+            elif item > self._slowest[0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def worker_utilization(self, stage="detect"):
+        """
+        线程利用率：各线程工作时间之和 / (线程数 × 阶段耗时)
+        流水线模式下各阶段没有单独的耗时，按整个流水线的耗时算
+        """
+        busy = {thread: seconds for (s, thread), seconds in self._busy.items() if s == stage}
+        wall_stage = stage if stage in self.stages else PIPELINE_STAGE
+        wall = self.stages.get(wall_stage)
+        total = sum(busy.values())
+        return {
+            "stage": stage,
+            "wall_stage": wall_stage,
+            "workers": self.workers,
+            "busy_seconds": round(total, 4),
+            "utilization": round(total / (self.workers * wall), 3) if wall else None,
+            "per_thread": {thread: round(seconds, 4) for thread, seconds in sorted(busy.items())},
+        }
+
+    def to_dict(self, **extra):
+        """转换为可以直接写成JSON的字典"""
+        return dict(
+            extra,
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            stages={name: round(seconds, 4) for name, seconds in self.stages.items()},
+            total_seconds=round(sum(self.stages.values()), 4),
+            counters=dict(self.counters),
+            slowest_files=[
+                {"stage": stage, "file": file, "seconds": round(seconds, 4)}
+                for seconds, stage, file in sorted(self._slowest, reverse=True)
+            ],
+            workers=self.worker_utilization(),
+        )
+
+    def write(self, path, **extra):
+        """
+        写出指标：.jsonl 文件每次运行追加一行（方便长期画图），其他后缀写成一个JSON文件
+        :param extra: 额外记录的字段（如根目录、分支列表）
+        """
+        record = self.to_dict(**extra)
+        if os.path.splitext(path)[1].lower() == ".jsonl":
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+
+
+def stage_timer(metrics, name):
+    """没有开启指标统计时返回空的上下文，不产生任何开销"""
+    return metrics.stage(name) if metrics is not None else nullcontext()
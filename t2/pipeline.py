@@ -0,0 +1,241 @@
+"""
+流水线模式：找差异、判冲突、合并三个阶段同时进行
+
+每个文件依次经过三个阶段，阶段之间用有界队列连接：
+    比较线程池（并行比较文件） -> 冲突检测线程 -> 写入线程（主线程）
+前面的文件已经在写入master时，后面的文件还在比较，总耗时接近最慢的那个阶段，而不是三个阶段相加。
+文件按路径顺序进入流水线、按顺序离开每个阶段，所以最后的三份报告和分阶段执行完全一致。
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from detect_changes import ChangeDetector
+from conflict_detector import ConflictDetector
+from master_merge import MasterMerger
+from compare_engine import DEFAULT_WORKERS
+
+# 阶段之间的队列最多放多少个文件（队列满了前面的阶段就等一等，内存占用有上限）
+DEFAULT_QUEUE_SIZE = 256
+
+# 每个比较任务包含的文件数（一个文件一个任务时，线程切换的开销比比较本身还大）
+BATCH_SIZE = 64
+
+# 队列结束标记
+_DONE = object()
+
+
+class PipelineExecutor:
+    """流水线执行器：每个文件比较完立即判冲突，判完立即写入master"""
+
+    def __init__(self, base_path, use_cache=True, rebuild_cache=False, workers=DEFAULT_WORKERS, branches=None,
+                 streaming=False, metrics=None, queue_size=DEFAULT_QUEUE_SIZE, ignore_rules=None):
+        """
+        :param base_path: 根目录路径（包含master和各分支文件夹）
+        :param use_cache: 是否使用摘要缓存
+        :param rebuild_cache: 是否丢弃已有缓存重新计算
+        :param workers: 并行比较文件内容的线程数
+        :param branches: 分支文件夹名称列表（默认branch_a、branch_b）
+        :param streaming: 修改文件写入master时才读取合并（同ConflictDetector的流式模式）
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        :param queue_size: 阶段之间的队列长度
+        :param ignore_rules: 忽略规则（IgnoreRules），三个阶段使用同一套规则
+        """
+        self.detector = ChangeDetector(base_path, use_cache=use_cache, rebuild_cache=rebuild_cache,
+                                       workers=workers, branches=branches, metrics=metrics,
+                                       ignore_rules=ignore_rules)
+        self.branches = self.detector.branches
+        self.metrics = metrics
+        self.queue_size = queue_size
+
+        # 冲突检测器和合并器各自只在一个线程里使用，结果的格式和分阶段执行相同
+        empty_changes = {branch_name: {"new": [], "modified": []} for branch_name in self.branches}
+        self.co_detector = ConflictDetector(base_path, empty_changes, streaming=streaming, metrics=metrics,
+                                            ignore_rules=ignore_rules, archives=self.detector.archives)
+        self.merger = MasterMerger(base_path, self.co_detector.conflicts, self.co_detector.merge_data,
+                                   metrics=metrics, ignore_rules=ignore_rules, archives=self.detector.archives)
+
+        self._statuses = {}  # 有变化的文件 -> {分支名称: "new"/"modified"}
+        self._binary_merged = []  # 合并成功的二进制文件（最后再放进报告，顺序和分阶段执行一致）
+        self._error = None  # 后台线程的异常（在主线程重新抛出）
+        self._abort = threading.Event()
+
+    def _file_status(self, file, master_snapshot, branch_snapshots):
+        """比较单个文件：返回 {分支名称: "new"/"modified"}（没有变化的分支不记录）"""
+        statuses = {}
+        for branch_name in self.branches:
+            branch_snapshot = branch_snapshots[branch_name]
+            if file not in branch_snapshot.index:
+                continue
+            master_stat = master_snapshot.stat(file)
+            if master_stat is None:
+                statuses[branch_name] = "new"
+            elif master_stat[0] != branch_snapshot.stat(file)[0]:
+                statuses[branch_name] = "modified"  # 大小不同，不用读内容
+            elif self.detector._is_file_modified(file, branch_name, master_snapshot, branch_snapshot):
+                statuses[branch_name] = "modified"
+        return statuses
+
+    def _put(self, q, item):
+        """放进队列（队列满时等待；其他阶段出错时放弃）"""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """从队列取出（其他阶段出错时返回结束标记）"""
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error):
+        """记录后台线程的异常，通知其他阶段停止"""
+        if self._error is None:
+            self._error = error
+        self._abort.set()
+
+    def _detect_stage(self, files, master_snapshot, branch_snapshots, pool, out_queue):
+        """第一阶段：按路径顺序分批提交比较任务，把future按顺序放进队列（冲突检测线程按顺序等待结果）"""
+        compare = self._file_status
+        if self.metrics is not None:
+            compare = self.metrics.timed("detect", compare)
+
+        def compare_batch(batch):
+            return [compare(file, master_snapshot, branch_snapshots) for file in batch]
+
+        try:
+            for i in range(0, len(files), BATCH_SIZE):
+                batch = files[i:i + BATCH_SIZE]
+                if not self._put(out_queue, (batch, pool.submit(compare_batch, batch))):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(out_queue, _DONE)
+
+    def _conflict_stage(self, in_queue, out_queue):
+        """第二阶段：按顺序逐个文件判断冲突"""
+        merge_file = self.co_detector._merge_modified_file
+        if self.metrics is not None:
+            merge_file = self.metrics.timed("conflict", merge_file)
+        try:
+            while True:
+                item = self._get(in_queue)
+                if item is _DONE:
+                    break
+                batch, future = item
+                for file, statuses in zip(batch, future.result()):
+                    if statuses:
+                        self._analyze(file, statuses, out_queue, merge_file)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(out_queue, _DONE)
+
+    def _analyze(self, file, statuses, out_queue, merge_file):
+        """判断单个文件的冲突，要写入master的操作放进队列"""
+        co_detector = self.co_detector
+        self._statuses[file] = statuses
+
+        # 新增文件（同_check_new_files_conflict）
+        new_branches = [b for b in self.branches if statuses.get(b) == "new"]
+        if new_branches:
+            co_detector.new_file_branches[file] = new_branches
+            if len(new_branches) > 1:
+                co_detector.conflicts["new_files_conflict"].append(file)
+            else:
+                co_detector.merge_data["new_files"].append((file, new_branches[0]))
+                self._put(out_queue, ("new", file, new_branches[0]))
+
+        # 修改文件（同_check_modified_files_conflict）
+        modified_branches = [b for b in self.branches if statuses.get(b) == "modified"]
+        if modified_branches:
+            binary_count = len(co_detector.merge_data["binary_files"])
+            merge_file(file, modified_branches)
+            if file in co_detector.merge_data["modified_files"]:
+                self._put(out_queue, ("modified", file, co_detector.merge_data["modified_files"][file]))
+                # 写入后内容就不再需要，不在merge_data里一直占着内存
+                co_detector.merge_data["modified_files"][file] = None
+            elif len(co_detector.merge_data["binary_files"]) > binary_count:
+                self._put(out_queue, ("binary",) + co_detector.merge_data["binary_files"][-1])
+
+    def _write_stage(self, in_queue):
+        """第三阶段（主线程）：按顺序写入master"""
+        merger = self.merger
+        while True:
+            item = self._get(in_queue)
+            if item is _DONE:
+                break
+            kind, file, payload = item
+            if kind == "new":
+                if merger.merge_new_file(file, payload):
+                    merger.merge_result["success_new"].append(file)
+            elif kind == "modified":
+                if merger.merge_modified_file(file, payload):
+                    merger.merge_result["success_modified"].append(file)
+            elif merger.merge_binary_file(file, payload):
+                self._binary_merged.append(file)
+
+    def _build_changes(self, branch_snapshots):
+        """整理出和ChangeDetector.send_changes格式、顺序都相同的变化结果"""
+        changes = {branch_name: {"new": [], "modified": []} for branch_name in self.branches}
+        for file, statuses in self._statuses.items():
+            for branch_name, status in statuses.items():
+                changes[branch_name][status].append(file)
+        # 按分支中的文件顺序排列
+        for branch_name, branch_changes in changes.items():
+            index = branch_snapshots[branch_name].index
+            for files in branch_changes.values():
+                files.sort(key=index.__getitem__)
+        return changes
+
+    def run(self):
+        """
+        执行流水线
+        :return: 各分支的变化（同ChangeDetector.send_changes）；冲突和合并结果在co_detector、merger中
+        """
+        # 扫描目录树（只读stat，很快），得到所有要处理的文件
+        master_snapshot = self.detector._get_master_snapshot()
+        branch_snapshots = {}
+        for branch_name in self.branches:
+            branch_snapshots[branch_name] = self.detector._get_branch_snapshot(branch_name)
+            if self.metrics is not None:
+                self.metrics.add("files_scanned", len(branch_snapshots[branch_name]))
+        files = sorted(set().union(*(snapshot.paths for snapshot in branch_snapshots.values())))
+
+        detect_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        with ThreadPoolExecutor(max_workers=self.detector.compare_engine.workers) as pool:
+            threads = [
+                threading.Thread(target=self._detect_stage, name="t2-detect",
+                                 args=(files, master_snapshot, branch_snapshots, pool, detect_queue)),
+                threading.Thread(target=self._conflict_stage, name="t2-conflict",
+                                 args=(detect_queue, write_queue)),
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                self._write_stage(write_queue)
+            except BaseException as e:
+                self._fail(e)
+            finally:
+                for thread in threads:
+                    thread.join()
+        if self._error is not None:
+            raise self._error
+
+        # 报告中二进制文件排在文本修改文件之后，收集冲突文件
+        self.merger.merge_result["success_modified"].extend(self._binary_merged)
+        self.merger.collect_conflicts()
+
+        changes = self._build_changes(branch_snapshots)
+        self.co_detector.changes = changes
+        self.detector.save_cache()
+        return changes
@@ -0,0 +1,177 @@
+import os
+import bisect
+from collections import Counter
+
+from file_io import looks_binary
+
+# 相似度达到这个百分比才算重命名（和git的默认值一样）
+DEFAULT_THRESHOLD = 50
+
+# 每个新增文件最多和多少个大小最接近的候选文件比较相似度
+MAX_CANDIDATES = 10
+
+# 超过这个大小的文件只做完全相同的匹配，不比较相似度
+MAX_SIMILARITY_SIZE = 8 * 1024 * 1024
+
+
+class RenameDetector:
+    """
+    重命名/移动检测：master中有、分支中没有的文件是候选的原文件，分支中的新增文件是候选的新文件
+    1. 先按大小分组，大小相同的才计算内容摘要，摘要相同就是原样重命名
+    2. 剩下的文件只和大小相近的几个候选比较行相似度，超过阈值的算作改名后又修改了内容
+    """
+
+    def __init__(self, digest_func, threshold=DEFAULT_THRESHOLD, max_candidates=MAX_CANDIDATES, metrics=None):
+        """
+        :param digest_func: 计算文件摘要的函数，参数为 (树名称, 相对路径, 目录树快照)
+        :param threshold: 相似度阈值（百分比）
+        :param max_candidates: 每个新增文件最多比较的候选文件数
+        :param metrics: 运行指标（RunMetrics），为None时不统计
+        """
+        self.digest_func = digest_func
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.metrics = metrics
+
+    def detect(self, branch_name, master_snapshot, branch_snapshot, new_files):
+        """
+        检测一个分支中的重命名
+        :param new_files: 该分支的新增文件列表
+        :return: (重命名列表 [(原路径, 新路径, 相似度)], 剩下的新增文件列表)
+        """
+        removed = [f for f in master_snapshot.paths if f not in branch_snapshot.index]
+        if not removed or not new_files:
+            return [], new_files
+
+        matches = self._exact_matches(branch_name, master_snapshot, branch_snapshot, removed, new_files)
+        if self.threshold < 100:
+            matched = {old for old, _ in matches.values()}
+            left_removed = [f for f in removed if f not in matched]
+            left_new = [f for f in new_files if f not in matches]
+            matches.update(self._similar_matches(master_snapshot, branch_snapshot, left_removed, left_new))
+
+        # 按新增文件原来的顺序输出
+        renamed = [(matches[f][0], f, matches[f][1]) for f in new_files if f in matches]
+        return renamed, [f for f in new_files if f not in matches]
+
+    def _exact_matches(self, branch_name, master_snapshot, branch_snapshot, removed, new_files):
+        """
+        内容完全相同的重命名：只有大小相同的文件才计算摘要
+        :return: {新路径: (原路径, 100)}
+        """
+        by_size = {}  # 大小 -> 候选原文件列表
+        for file in removed:
+            size = master_snapshot.stat(file)[0]
+            if size:  # 空文件内容都一样，不参与匹配
+                by_size.setdefault(size, []).append(file)
+
+        digests = {}  # 大小 -> {摘要: 原文件列表}（用到时才计算）
+        used = set()
+        matches = {}
+        for file in new_files:
+            stat = branch_snapshot.stat(file)
+            if stat[0] not in by_size:
+                continue
+            if stat[0] not in digests:
+                index = digests[stat[0]] = {}
+                for old in by_size[stat[0]]:
+                    digest = self.digest_func("master", old, master_snapshot)
+                    index.setdefault(digest, []).append(old)
+            digest = self.digest_func(branch_name, file, branch_snapshot)
+            candidates = [old for old in digests[stat[0]].get(digest, []) if old not in used]
+            if candidates:
+                old = self._prefer_same_name(file, candidates)
+                used.add(old)
+                matches[file] = (old, 100)
+        return matches
+
+    @staticmethod
+    def _prefer_same_name(file, candidates):
+        """有多个候选时优先选文件名相同的（即只是移动了目录）"""
+        name = os.path.basename(file)
+        for old in candidates:
+            if os.path.basename(old) == name:
+                return old
+        return candidates[0]
+
+    def _similar_matches(self, master_snapshot, branch_snapshot, removed, new_files):
+        """
+        内容相似的重命名：每个新增文件只和大小最接近的几个候选比较
+        :return: {新路径: (原路径, 相似度)}
+        """
+        removed = [f for f in removed if master_snapshot.stat(f)[0] <= MAX_SIMILARITY_SIZE]
+        if not removed:
+            return {}
+        removed.sort(key=lambda f: master_snapshot.stat(f)[0])
+        sizes = [master_snapshot.stat(f)[0] for f in removed]
+
+        fingerprints = {}  # 原文件 -> 行计数（多个新增文件共用）
+        scored = []
+        for file in new_files:
+            size = branch_snapshot.stat(file)[0]
+            if size > MAX_SIMILARITY_SIZE:
+                continue
+            candidates = self._nearest(removed, sizes, size)
+            if not candidates:
+                continue
+            lines = self._line_counts(branch_snapshot, file)
+            if lines is None:
+                continue  # 二进制文件不比较相似度
+            for old in candidates:
+                if old not in fingerprints:
+                    fingerprints[old] = self._line_counts(master_snapshot, old)
+                if fingerprints[old] is None:
+                    continue
+                score = self._similarity(fingerprints[old], master_snapshot.stat(old)[0], lines, size)
+                if score >= self.threshold:
+                    same_name = os.path.basename(old) == os.path.basename(file)
+                    scored.append((-score, not same_name, file, old))
+
+        # 相似度高的优先，每个原文件只能对应一个新文件
+        scored.sort()
+        used = set()
+        matches = {}
+        for score, _, file, old in scored:
+            if file in matches or old in used:
+                continue
+            used.add(old)
+            matches[file] = (old, -score)
+        return matches
+
+    def _nearest(self, removed, sizes, size):
+        """二分查找大小最接近的候选（大小相差太多的不可能达到相似度阈值）"""
+        low = size * self.threshold // 100
+        high = size * 100 // self.threshold if self.threshold else float("inf")
+        pos = bisect.bisect_left(sizes, size)
+        left, right = pos - 1, pos
+        candidates = []
+        while len(candidates) < self.max_candidates:
+            left_ok = left >= 0 and sizes[left] >= low
+            right_ok = right < len(sizes) and sizes[right] <= high
+            if not left_ok and not right_ok:
+                break
+            if right_ok and (not left_ok or sizes[right] - size <= size - sizes[left]):
+                candidates.append(removed[right])
+                right += 1
+            else:
+                candidates.append(removed[left])
+                left -= 1
+        return candidates
+
+    def _line_counts(self, snapshot, rel_path):
+        """读取文件并统计每一行出现的次数，二进制文件返回None（snapshot可以是文件夹或压缩包的目录树）"""
+        with snapshot.open(rel_path) as f:
+            data = f.read()
+        if self.metrics is not None:
+            self.metrics.add("bytes_read", len(data))
+        if looks_binary(data):
+            return None
+        return Counter(data.splitlines(keepends=True))
+
+    @staticmethod
+    def _similarity(old_lines, old_size, new_lines, new_size):
+        """相似度：两边共有的行的字节数 / 较大的文件大小（百分比）"""
+        if len(old_lines) > len(new_lines):
+            old_lines, new_lines = new_lines, old_lines
+        common = sum(len(line) * min(count, new_lines[line]) for line, count in old_lines.items() if line in new_lines)
+        return common * 100 // max(old_size, new_size, 1)
@@ -0,0 +1,343 @@
+"""
+事务合并：合并结果先并行写进影子目录，全部写好、刷盘之后再用原子改名提交到master
+
+    .t2_txn/                 影子目录（在根目录下，和master在同一个文件系统，改名不复制数据）
+        files/<编号>         暂存的合并结果
+        backup/<编号>        提交时被替换的master原文件（硬链接，回滚用）
+        journal.jsonl        日志：每行一条记录，攒够一批才fsync一次
+
+日志记录：
+    {"op": "write", "path": 相对路径, "staged": 暂存文件编号, "key": 输入指纹, "meta": 附加信息}
+                                        该文件已暂存并刷盘；meta是生成内容时得到的信息（如是否有冲突），复用时交还调用方
+    {"op": "move", "old": 原路径, "new": 新路径}                                 要在master中移动的文件
+    {"op": "prepared", "ops": [...], "dirs": [...]}
+                                        所有文件都已暂存，ops是按顺序要提交的操作，dirs是提交时要新建的目录；
+                                        写下这条之后就只剩提交
+    {"op": "done", "i": 操作序号}       第i个操作已提交到master
+    提交完成后删除整个影子目录
+
+中断之后：
+    - 已经prepared：继续提交剩下的操作（recover），不用重新合并；或者撤销已提交的操作（rollback）
+    - 还没prepared：master完全没动过；再次运行时，输入没变的文件直接用暂存好的结果，不用重新生成
+"""
+import os
+import json
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from compare_engine import DEFAULT_WORKERS
+
+# 影子目录名称（和master、各分支文件夹同级）
+TXN_DIR_NAME = ".t2_txn"
+
+# 日志攒够这么多条才写入并fsync一次
+JOURNAL_BATCH = 64
+
+
+def _fsync_dir(path):
+    """刷新目录项（改名、新建文件之后目录本身也要刷盘才算持久）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Windows不能打开目录，跳过
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class MergeTransaction:
+    """事务合并：暂存（并行） -> prepared -> 提交（原子改名），每一步都记日志"""
+
+    def __init__(self, base_path, workers=DEFAULT_WORKERS):
+        """
+        :param base_path: 根目录路径（影子目录建在这里）
+        :param workers: 并行暂存文件的线程数
+        """
+        self.base_path = base_path
+        self.master_path = os.path.join(base_path, "master")
+        self.txn_path = os.path.join(base_path, TXN_DIR_NAME)
+        self.files_path = os.path.join(self.txn_path, "files")
+        self.backup_path = os.path.join(self.txn_path, "backup")
+        self.journal_path = os.path.join(self.txn_path, "journal.jsonl")
+        self.workers = max(1, workers)
+
+        self.ops = []  # 按提交顺序的操作：("move", 原路径, 新路径) / ("write", 相对路径, 暂存编号)
+        self.errors = {}  # 暂存失败的文件 -> 异常
+        self.reused = 0  # 直接复用上次暂存结果的文件数
+        self._reusable = {}  # 上次中断时已经暂存好的文件：相对路径 -> (暂存编号, 输入指纹, 附加信息)
+        self._next_id = 0
+        self._futures = []
+        self._pool = None
+        self._journal = None
+        self._buffer = []  # 还没写入日志的记录
+        self._lock = threading.Lock()
+
+    # ---------- 日志 ----------
+
+    def _read_journal(self):
+        """读取日志（最后一行可能只写了一半，丢掉）"""
+        records = []
+        if not os.path.exists(self.journal_path):
+            return records
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        return records
+
+    def _log(self, record, flush=False):
+        """追加一条日志记录（攒够一批或flush=True时写入并fsync）"""
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False))
+            if flush or len(self._buffer) >= JOURNAL_BATCH:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        self._journal.write("".join(line + "\n" for line in self._buffer))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._buffer = []
+
+    def pending(self):
+        """
+        上次运行留下的未完成事务
+        :return: "prepared"（master可能已经提交了一部分）、"staging"（master没动过）或None
+        """
+        records = self._read_journal()
+        if any(record["op"] == "prepared" for record in records):
+            return "prepared"
+        return "staging" if os.path.isdir(self.txn_path) else None
+
+    # ---------- 暂存 ----------
+
+    def begin(self):
+        """开始事务；上次中断在暂存阶段的，已经暂存好的文件留着复用"""
+        if self.pending() == "prepared":
+            raise RuntimeError("上次的事务合并还没提交完，请先用 --transaction 继续提交或用 --rollback 撤销")
+        for record in self._read_journal():
+            if record["op"] == "write":
+                self._reusable[record["path"]] = (record["staged"], record["key"], record.get("meta"))
+                self._next_id = max(self._next_id, record["staged"] + 1)
+
+        os.makedirs(self.files_path, exist_ok=True)
+        # 日志重新开始，复用的文件会重新记一遍
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="t2-stage")
+
+    def _staged_file(self, staged_id):
+        return os.path.join(self.files_path, str(staged_id))
+
+    def stage_move(self, old_path, new_path):
+        """登记在master中移动的文件（提交时最先执行）"""
+        self.ops.append(("move", old_path, new_path))
+
+    def stage_write(self, file_path, key, producer, on_reuse=None, mode_from=None):
+        """
+        暂存一个文件：在线程池中生成内容，写完立即fsync
+        :param file_path: 在master中的相对路径
+        :param key: 输入指纹（字符串）；和上次中断时暂存的一样就直接复用
+        :param producer: 生成内容的函数，参数为要写入的文件路径；返回值（可以写成JSON的字典或None）随日志保存
+        :param on_reuse: 复用上次暂存的结果时调用（producer不会执行），参数为当时producer的返回值
+        :param mode_from: master中的相对路径，暂存文件沿用它的权限（如可执行位）；为None或文件不存在时不处理
+        """
+        reusable = self._reusable.pop(file_path, None)
+        if reusable is not None and reusable[1] == key and os.path.exists(self._staged_file(reusable[0])):
+            staged_id, _, meta = reusable
+            self.reused += 1
+            self.ops.append(("write", file_path, staged_id))
+            self._log({"op": "write", "path": file_path, "staged": staged_id, "key": key, "meta": meta})
+            if on_reuse is not None:
+                on_reuse(meta)
+            return
+
+        staged_id = self._next_id
+        self._next_id += 1
+        self.ops.append(("write", file_path, staged_id))
+        self._futures.append(self._pool.submit(self._stage, file_path, key, producer, staged_id, mode_from))
+
+    def _stage(self, file_path, key, producer, staged_id, mode_from=None):
+        """线程池中执行：生成内容、刷盘、记日志"""
+        staged_file = self._staged_file(staged_id)
+        try:
+            meta = producer(staged_file)
+            if mode_from is not None:
+                # 提交时暂存文件直接改名成master文件，权限要在这里先设好
+                mode_source = os.path.join(self.master_path, mode_from)
+                if os.path.exists(mode_source):
+                    shutil.copymode(mode_source, staged_file)
+            with open(staged_file, 'rb+') as f:
+                os.fsync(f.fileno())
+        except Exception as e:
+            with self._lock:
+                self.errors[file_path] = e
+            if os.path.exists(staged_file):
+                os.remove(staged_file)
+            return
+        self._log({"op": "write", "path": file_path, "staged": staged_id, "key": key, "meta": meta})
+
+    def prepare(self):
+        """
+        等待所有文件暂存完成，写下prepared记录（提交点）
+        :return: 暂存失败的文件 -> 异常（这些文件不会提交）
+        """
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self.ops = [op for op in self.ops if op[0] == "move" or op[1] not in self.errors]
+        _fsync_dir(self.files_path)
+        self._log({"op": "prepared", "ops": self.ops, "dirs": self._new_dirs()}, flush=True)
+        return self.errors
+
+    def _new_dirs(self):
+        """提交时会在master中新建的目录（回滚时删掉）"""
+        new_dirs = set()
+        for kind, first, second in self.ops:
+            rel_dir = os.path.dirname(first if kind == "write" else second)
+            while rel_dir and rel_dir not in new_dirs and not os.path.isdir(os.path.join(self.master_path, rel_dir)):
+                new_dirs.add(rel_dir)
+                rel_dir = os.path.dirname(rel_dir)
+        return sorted(new_dirs)
+
+    # ---------- 提交/回滚 ----------
+
+    def _commit_op(self, i, op):
+        """
+        提交一个操作（可以重复执行：中断后继续提交时，已经完成的步骤会被识别出来跳过）
+        :return: 这次是否真的改动了master
+        """
+        kind, first, second = op
+        if kind == "move":
+            source = os.path.join(self.master_path, first)
+            target = os.path.join(self.master_path, second)
+            if not os.path.exists(source) and os.path.exists(target):
+                return False  # 已经移动过
+            self._backup(i, target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            return True
+
+        staged_file = self._staged_file(second)
+        if not os.path.exists(staged_file):
+            return False  # 已经改名到master
+        target = os.path.join(self.master_path, first)
+        self._backup(i, target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(staged_file, target)
+        return True
+
+    def _backup(self, i, target):
+        """被替换的master文件先做一个硬链接备份（不复制数据，原路径一直可用）"""
+        backup = os.path.join(self.backup_path, str(i))
+        if os.path.exists(backup) or not os.path.exists(target):
+            return
+        os.makedirs(self.backup_path, exist_ok=True)
+        try:
+            os.link(target, backup)
+        except OSError:
+            shutil.copy2(target, backup)  # 不支持硬链接的文件系统
+
+    def commit(self):
+        """按顺序提交所有操作，完成后删除影子目录"""
+        self._run_commit(self.ops, set())
+
+    def _run_commit(self, ops, done):
+        """提交done以外的操作，返回实际改动master的操作数"""
+        touched = set()
+        applied = 0
+        for i, op in enumerate(ops):
+            if i in done:
+                continue
+            applied += self._commit_op(i, op)
+            paths = [op[1]] if op[0] == "write" else [op[1], op[2]]
+            touched.update(os.path.dirname(os.path.join(self.master_path, path)) for path in paths)
+            self._log({"op": "done", "i": i})
+        for path in touched:
+            _fsync_dir(path)
+        self._finish()
+        return applied
+
+    def _finish(self):
+        """关闭日志，删除影子目录"""
+        if self._journal is not None:
+            with self._lock:
+                self._flush_locked()
+            self._journal.close()
+            self._journal = None
+        shutil.rmtree(self.txn_path, ignore_errors=True)
+
+    def _prepared_state(self):
+        """读取日志中prepared的操作列表、新建的目录和已完成的操作序号"""
+        records = self._read_journal()
+        ops, new_dirs, done = None, [], set()
+        for record in records:
+            if record["op"] == "prepared":
+                ops = [tuple(op) for op in record["ops"]]
+                new_dirs = record["dirs"]
+            elif record["op"] == "done":
+                done.add(record["i"])
+        return ops, new_dirs, done
+
+    def recover(self):
+        """
+        继续提交上次中断的事务（只有已经prepared的才继续）
+        :return: 继续提交的操作数；没有需要继续的事务返回0（日志显示还没提交完，实际都已完成时也返回0）
+        """
+        if self.pending() != "prepared":
+            return 0
+        ops, _, done = self._prepared_state()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return self._run_commit(ops, done)
+
+    def rollback(self):
+        """
+        撤销上次中断的事务：已经提交的操作按相反顺序恢复，master回到合并之前的样子
+        :return: 撤销的操作数
+        """
+        state = self.pending()
+        if state is None:
+            return 0
+        undone = 0
+        if state == "prepared":
+            ops, new_dirs, _ = self._prepared_state()
+            for i in range(len(ops) - 1, -1, -1):
+                if self._rollback_op(i, ops[i]):
+                    undone += 1
+            # 提交时新建的目录，从最深的开始删（里面还有别的文件就留着）
+            for rel_dir in sorted(new_dirs, key=len, reverse=True):
+                try:
+                    os.rmdir(os.path.join(self.master_path, rel_dir))
+                except OSError:
+                    pass
+        shutil.rmtree(self.txn_path, ignore_errors=True)
+        return undone
+
+    def _rollback_op(self, i, op):
+        """撤销一个操作，返回是否真的撤销了（没提交过的操作什么都不做）"""
+        kind, first, second = op
+        backup = os.path.join(self.backup_path, str(i))
+        if kind == "move":
+            source = os.path.join(self.master_path, first)
+            target = os.path.join(self.master_path, second)
+            if os.path.exists(source) or not os.path.exists(target):
+                return False
+            os.replace(target, source)
+            if os.path.exists(backup):
+                os.replace(backup, target)
+            return True
+
+        if os.path.exists(self._staged_file(second)):
+            return False  # 还没改名到master
+        target = os.path.join(self.master_path, first)
+        if os.path.exists(backup):
+            os.replace(backup, target)
+        elif os.path.exists(target):
+            os.remove(target)  # 合并新增的文件
+        return True
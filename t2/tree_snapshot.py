@@ -0,0 +1,46 @@
+import os
+import sys
+
+# 共用模块在仓库根目录的common文件夹
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from dir_scanner import FileTable, scan_tree  # noqa: E402
+
+
+class TreeSnapshot(FileTable):
+    """目录树快照：一次遍历记录所有文件的相对路径、大小、修改时间和inode"""
+
+    is_archive = False
+    sequential = False
+
+    def __init__(self, root_dir, ignore_rules=None):
+        """
+        扫描目录并建立索引
+        :param root_dir: 要扫描的根目录
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的目录整个跳过，不进入遍历
+        """
+        super().__init__()
+        self.root_dir = root_dir
+        self.ignore_rules = ignore_rules
+        self._scan()
+
+    def _scan(self):
+        """用os.scandir遍历目录（复用DirEntry自带的信息，减少系统调用）"""
+        # 先处理当前目录的文件，再按名称顺序进入子目录；排序保证每次结果顺序一致
+        ignore = self.ignore_rules.match if self.ignore_rules is not None else None
+        for rel_path, entry in scan_tree(self.root_dir, ignore=ignore, sort=True):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue  # 失效的符号链接等无法读取的条目直接跳过
+            self._add(rel_path, st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def abs_path(self, rel_path):
+        """相对路径转绝对路径"""
+        return os.path.join(self.root_dir, rel_path)
+
+    def open(self, rel_path):
+        """以二进制方式打开文件（和压缩包目录树的接口一致）"""
+        return open(self.abs_path(rel_path), 'rb')
@@ -0,0 +1,224 @@
+"""
+压缩包分支：分支文件夹不存在时，直接读取同名的压缩包（branch_a.zip、branch_a.tar.gz等），不用先解压到磁盘
+
+压缩包目录树和TreeSnapshot接口相同（paths、index、stat、open），找差异、判冲突、合并都不用关心分支是文件夹还是压缩包：
+    - 文件列表、大小、修改时间来自压缩包的目录信息，不解压任何内容
+    - zip里每个成员都记录了CRC32，和master文件的CRC32不同就说明被修改，不用解压成员；相同时仍要比较内容确认
+    - 需要内容时边解压边读，只有合并结果会写进master
+master是合并结果的写入目标，必须是文件夹。
+"""
+import os
+import io
+import abc
+import sys
+import time
+import shutil
+import tarfile
+import zipfile
+import threading
+
+# 共用模块在仓库根目录的common文件夹
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common")
+if COMMON_DIR not in sys.path:
+    sys.path.insert(0, COMMON_DIR)
+
+from dir_scanner import FileTable  # noqa: E402
+
+# 按顺序查找的压缩包后缀
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def find_archive(base_path, name):
+    """查找分支对应的压缩包，找不到返回None"""
+    for suffix in ARCHIVE_SUFFIXES:
+        path = os.path.join(base_path, name + suffix)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def open_archive_tree(base_path, name, ignore_rules=None):
+    """
+    打开分支对应的压缩包
+    :return: ZipTree/TarTree；分支是文件夹或找不到压缩包时返回None
+    """
+    if os.path.isdir(os.path.join(base_path, name)):
+        return None
+    path = find_archive(base_path, name)
+    if path is None:
+        return None
+    if path.endswith(".zip"):
+        return ZipTree(path, name, ignore_rules)
+    return TarTree(path, name, ignore_rules)
+
+
+class ArchiveTrees(dict):
+    """分支名称 -> 压缩包目录树（分支是文件夹时为None），第一次用到时打开，找差异、判冲突、合并共用"""
+
+    def __init__(self, base_path, ignore_rules=None):
+        super().__init__()
+        self.base_path = base_path
+        self.ignore_rules = ignore_rules
+
+    def __missing__(self, name):
+        tree = self[name] = open_archive_tree(self.base_path, name, self.ignore_rules)
+        return tree
+
+    def read_order(self, items, sources):
+        """
+        按成员在压缩包里的先后排列要读取的条目：压缩的tar包往回跳要从头解压，按路径顺序读取时几乎每个成员都要从头再解压一遍
+        :param items: 条目列表
+        :param sources: 函数，条目 -> 要读取的 [(分支名称, 分支中的相对路径), ...]（按其中第一个只能顺序读取的压缩包排序）
+        :return: 排好序的新列表；不用读取这类压缩包的条目保持原来的先后，排在最后
+        """
+        def key(item):
+            for name, rel_path in sources(item):
+                tree = self[name]
+                if tree is not None and tree.sequential and rel_path in tree:
+                    return 0, name, tree.offset(rel_path)
+            return 1, "", 0
+
+        return sorted(items, key=key)
+
+
+def _walk_key(rel_path):
+    """排序键：和TreeSnapshot的遍历顺序相同（同一目录下先文件后子目录，各自按名称排序）"""
+    parts = rel_path.split("/")
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+
+class ArchiveTree(FileTable, abc.ABC):
+    """压缩包中的目录树（只读），接口同TreeSnapshot"""
+
+    is_archive = True
+    sequential = False  # 是否只适合按成员顺序读取（压缩的tar包往回跳要从头解压）
+
+    def __init__(self, archive_path, name, ignore_rules=None):
+        """
+        :param archive_path: 压缩包路径
+        :param name: 分支名称（压缩包里只有一个同名的顶层目录时，自动去掉这一层）
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的成员不进入目录树
+        """
+        super().__init__()  # 成员标识：zip为CRC32，tar为数据偏移，在摘要缓存中代替inode
+        self.root_dir = archive_path
+        self.name = name
+        self.ignore_rules = ignore_rules
+        self._members = []  # 下标 -> 压缩包成员信息
+
+    def _build(self, entries):
+        """
+        建立索引
+        :param entries: [(包内路径, 大小, 修改时间纳秒, 成员标识, 成员信息)]
+        """
+        # tar包里常见的 ./ 开头
+        entries = [(entry[0][2:],) + entry[1:] if entry[0].startswith("./") else entry for entry in entries]
+        prefix = self.name + "/"
+        if entries and all(entry[0].startswith(prefix) for entry in entries):
+            entries = [(entry[0][len(prefix):],) + entry[1:] for entry in entries]
+
+        entries.sort(key=lambda entry: _walk_key(entry[0]))
+        for name, size, mtime_ns, ident, member in entries:
+            parts = name.split("/")
+            # 绝对路径和带..的成员会写到master外面，直接跳过
+            if not name or name.startswith("/") or ".." in parts or "" in parts:
+                continue
+            rel_path = os.path.join(*parts)
+            if self.ignore_rules is not None and self.ignore_rules.is_ignored(rel_path):
+                continue
+            if rel_path in self.index:
+                continue  # 同名成员只取第一个
+            self._add(rel_path, size, mtime_ns, ident)
+            self._members.append(member)
+
+    def checksum(self, rel_path):
+        """压缩包中记录的CRC32（没有记录时返回None）"""
+        return None
+
+    @abc.abstractmethod
+    def open(self, rel_path):
+        """以二进制流打开成员（边解压边读）"""
+
+    def extract(self, rel_path, target_path):
+        """把单个成员写到指定路径（保留修改时间），返回写入的字节数"""
+        with self.open(rel_path) as src, open(target_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            written = dst.tell()
+        mtime_ns = self.mtimes[self.index[rel_path]]
+        os.utime(target_path, ns=(mtime_ns, mtime_ns))
+        return written
+
+
+class ZipTree(ArchiveTree):
+    """zip压缩包：目录信息在文件末尾，打开时只读这一块"""
+
+    def __init__(self, archive_path, name, ignore_rules=None):
+        super().__init__(archive_path, name, ignore_rules)
+        self._zip = zipfile.ZipFile(archive_path)
+        entries = []
+        for info in self._zip.infolist():
+            if info.is_dir():
+                continue
+            # zip用DOS格式记录本地时间，精度只有2秒；只和同一个压缩包读出的值比较，不拿去和磁盘文件的修改时间比
+            mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 1000000000
+            entries.append((info.filename, info.file_size, mtime_ns, info.CRC, info))
+        self._build(entries)
+
+    def checksum(self, rel_path):
+        return self._members[self.index[rel_path]].CRC
+
+    def open(self, rel_path):
+        # ZipFile可以在多个线程中同时打开不同成员
+        return self._zip.open(self._members[self.index[rel_path]])
+
+
+class _LockedMember(io.RawIOBase):
+    """tar成员的读取流：tar包只有一个文件句柄，从打开到关闭期间其他线程要等待"""
+
+    def __init__(self, lock, opener):
+        super().__init__()
+        lock.acquire()
+        try:
+            self._file = opener()
+        except BaseException:
+            lock.release()
+            raise
+        self._lock = lock
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._file.close()
+            finally:
+                self._lock.release()
+        super().close()
+
+
+class TarTree(ArchiveTree):
+    """tar压缩包（可以是gz/bz2/xz压缩的）：打开时顺序读一遍所有成员头"""
+
+    sequential = True
+
+    def __init__(self, archive_path, name, ignore_rules=None):
+        super().__init__(archive_path, name, ignore_rules)
+        self._tar = tarfile.open(archive_path, "r:*")
+        self._lock = threading.Lock()
+        entries = []
+        for member in self._tar.getmembers():
+            if member.isfile():
+                entries.append((member.name, member.size, int(member.mtime) * 1000000000,
+                                member.offset_data, member))
+        self._build(entries)
+
+    def offset(self, rel_path):
+        """成员数据在包中的位置（按这个顺序读取时不用往回跳）"""
+        return self._members[self.index[rel_path]].offset_data
+
+    def open(self, rel_path):
+        member = self._members[self.index[rel_path]]
+        return io.BufferedReader(_LockedMember(self._lock, lambda: self._tar.extractfile(member)))
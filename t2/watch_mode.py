@@ -0,0 +1,323 @@
+"""
+监听模式：常驻运行，分支文件夹有变化时只重新比较被改动的文件，随时可以取出最新的冲突和合并数据
+
+Linux 下用 inotify 接收文件变化通知，其他系统（或 inotify 不可用时）退回定时扫描对比
+"""
+import os
+import time
+import threading
+
+from tree_snapshot import TreeSnapshot
+from detect_changes import ChangeDetector
+from conflict_detector import ConflictDetector
+# common文件夹已由tree_snapshot加入sys.path
+from inotify import Inotify, IN_CREATE, IN_MOVED_TO, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR
+
+# 事件回调中的特殊路径：事件太多被内核丢弃，需要全量重新扫描
+RESCAN = None
+
+
+class InotifyWatcher:
+    """用 inotify 监听多个目录树（递归为每个子目录添加监听）"""
+
+    def __init__(self, roots, ignore_rules=None):
+        """
+        :param roots: {树名称: 目录路径}，如 {"master": ".../master", "branch_a": ...}
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的目录不添加监听
+        :raises OSError: 当前系统不支持inotify或监听数量超过系统限制
+        """
+        self.ignore_rules = ignore_rules
+        self._inotify = Inotify()
+        self._watches = {}  # 监听编号 -> (树名称, 相对目录, 绝对目录)
+        try:
+            for name, root in roots.items():
+                self._add_tree(name, root, "")
+        except OSError:
+            self._inotify.close()
+            raise
+
+    def _add_tree(self, name, abs_dir, rel_dir):
+        """为目录及其所有子目录添加监听"""
+        stack = [(abs_dir, rel_dir)]
+        while stack:
+            abs_dir, rel_dir = stack.pop()
+            wd = self._inotify.add_watch(abs_dir)
+            if wd is None:
+                continue  # 目录刚被删掉
+            self._watches[wd] = (name, rel_dir, abs_dir)
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                            if self.ignore_rules is None or not self.ignore_rules.match(rel_path, True):
+                                stack.append((entry.path, rel_path))
+            except OSError:
+                pass
+
+    def read_events(self, timeout):
+        """
+        等待并读取事件
+        :param timeout: 最长等待秒数
+        :return: [(树名称, 相对路径, 是否目录), ...]；事件溢出时返回 [(None, RESCAN, False)]
+        """
+        events = []
+        for wd, mask, filename in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                return [(None, RESCAN, False)]
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches or not filename:
+                continue
+
+            name, rel_dir, abs_dir = self._watches[wd]
+            rel_path = os.path.join(rel_dir, filename) if rel_dir else filename
+            is_dir = bool(mask & IN_ISDIR)
+            if self.ignore_rules is not None and self.ignore_rules.is_ignored(rel_path, is_dir):
+                continue
+            # 新建或移入的子目录也要监听
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(name, os.path.join(abs_dir, filename), rel_path)
+            events.append((name, rel_path, is_dir))
+        return events
+
+    def close(self):
+        self._inotify.close()
+
+
+class PollingWatcher:
+    """定时重新扫描目录树，对比 (大小, 修改时间, inode) 找出变化的文件（inotify不可用时使用）"""
+
+    def __init__(self, roots, interval=2.0, ignore_rules=None):
+        """
+        :param roots: {树名称: 目录路径}
+        :param interval: 扫描间隔（秒）
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的目录不扫描
+        """
+        self.roots = roots
+        self.interval = interval
+        self.ignore_rules = ignore_rules
+        self._snapshots = {name: TreeSnapshot(root, ignore_rules) for name, root in roots.items()}
+        self._next_scan = time.monotonic() + interval
+
+    def read_events(self, timeout):
+        """到了扫描时间就重新扫描，返回有变化的文件；还没到时间就等待（最多timeout秒）"""
+        wait = self._next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(timeout, wait))
+            if time.monotonic() < self._next_scan:
+                return []
+        self._next_scan = time.monotonic() + self.interval
+
+        events = []
+        for name, root in self.roots.items():
+            old = self._snapshots[name]
+            new = TreeSnapshot(root, self.ignore_rules)
+            for rel_path in new.paths:
+                if old.stat(rel_path) != new.stat(rel_path):
+                    events.append((name, rel_path, False))
+            for rel_path in old.paths:
+                if rel_path not in new.index:
+                    events.append((name, rel_path, False))
+            self._snapshots[name] = new
+        return events
+
+    def close(self):
+        pass
+
+
+class WatchSession:
+    """常驻检测会话：维护每个文件的变化和冲突状态，只重新处理被改动的文件"""
+
+    def __init__(self, base_path, branches=None, use_cache=True, debounce=0.5, max_delay=5.0,
+                 poll_interval=2.0, force_polling=False, ignore_rules=None):
+        """
+        :param base_path: 根目录路径
+        :param branches: 分支文件夹名称列表（默认branch_a、branch_b）
+        :param use_cache: 是否使用摘要缓存
+        :param debounce: 最后一个事件之后等待多久（秒）再处理，把一连串修改合成一批
+        :param max_delay: 事件持续不断时，最多攒这么久（秒）也要处理一次
+        :param poll_interval: 定时扫描模式的扫描间隔（秒）
+        :param force_polling: 不使用inotify，直接定时扫描
+        :param ignore_rules: 忽略规则（IgnoreRules），被忽略的文件不监听、不检测
+        """
+        self.base_path = base_path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.detector = ChangeDetector(base_path, use_cache=use_cache, branches=branches, ignore_rules=ignore_rules)
+        self.ignore_rules = ignore_rules
+        self.branches = self.detector.branches
+
+        self.statuses = {}  # 文件相对路径 -> {分支名称: "new"/"modified"}（只记录有变化的文件）
+        self.fragments = {}  # 文件相对路径 -> 该文件的冲突检测结果 (conflicts, merge_data)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        # 压缩包分支不会变化，只监听文件夹
+        roots = {"master": self.detector.master_path}
+        roots.update((name, path) for name, path in self.detector.branch_paths.items()
+                     if self.detector.archives[name] is None)
+        self.roots = roots
+        self.watcher = None
+        if not force_polling:
+            try:
+                self.watcher = InotifyWatcher(roots, ignore_rules)
+            except OSError as e:
+                print(f"inotify不可用（{e}），改为每{poll_interval}秒扫描一次")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(roots, poll_interval, ignore_rules)
+        self.mode = "inotify" if isinstance(self.watcher, InotifyWatcher) else "polling"
+
+        # 先做一次完整检测
+        self._full_scan()
+
+    def _full_scan(self):
+        """完整检测一遍（启动时或事件溢出时）"""
+        self.detector._master_snapshot = None  # master可能也变了，重新扫描
+        changes = self.detector.send_changes()
+        statuses = {}
+        for branch_name, branch_changes in changes.items():
+            for status in ("new", "modified"):
+                for file in branch_changes[status]:
+                    statuses.setdefault(file, {})[branch_name] = status
+        fragments = {file: self._analyze(file, file_statuses) for file, file_statuses in statuses.items()}
+        with self._lock:
+            self.statuses = statuses
+            self.fragments = fragments
+
+    def _analyze(self, file, file_statuses):
+        """对单个文件做冲突检测（把只含这一个文件的变化交给ConflictDetector）"""
+        changes = {
+            branch_name: {
+                "new": [file] if file_statuses.get(branch_name) == "new" else [],
+                "modified": [file] if file_statuses.get(branch_name) == "modified" else [],
+            }
+            for branch_name in self.branches
+        }
+        co_detector = ConflictDetector(self.base_path, changes, ignore_rules=self.ignore_rules,
+                                       archives=self.detector.archives)
+        co_detector.detect_all_conflicts()
+        return co_detector.conflicts, co_detector.merge_data
+
+    def _expand_dir(self, rel_dir):
+        """目录整体新建/删除/移动时，找出目录下所有需要重新比较的文件"""
+        files = set()
+        prefix = rel_dir + os.sep
+        with self._lock:
+            files.update(f for f in self.statuses if f.startswith(prefix))
+        for root in self.roots.values():
+            abs_dir = os.path.join(root, rel_dir)
+            if os.path.isdir(abs_dir):
+                files.update(os.path.join(rel_dir, f) for f in TreeSnapshot(abs_dir).paths)
+        return files
+
+    def refresh(self, files):
+        """
+        重新比较指定的文件并更新状态
+        :param files: 文件相对路径集合
+        """
+        for file in files:
+            file_statuses = {}
+            for branch_name in self.branches:
+                status = self.detector.file_status(file, branch_name)
+                if status is not None:
+                    file_statuses[branch_name] = status
+            fragment = self._analyze(file, file_statuses) if file_statuses else None
+            with self._lock:
+                if fragment is None:
+                    self.statuses.pop(file, None)
+                    self.fragments.pop(file, None)
+                else:
+                    self.statuses[file] = file_statuses
+                    self.fragments[file] = fragment
+
+    def _collect_batch(self):
+        """收集一批事件：最后一个事件之后安静debounce秒，或总共等了max_delay秒"""
+        files = set()
+        dirs = set()
+        first_event = None
+        while not self._stopped.is_set():
+            timeout = self.debounce if first_event is not None else 1.0
+            if first_event is not None:
+                timeout = min(timeout, max(0.0, first_event + self.max_delay - time.monotonic()))
+            events = self.watcher.read_events(timeout)
+            if not events:
+                if first_event is not None:
+                    break
+                continue
+            if first_event is None:
+                first_event = time.monotonic()
+            for _, rel_path, is_dir in events:
+                if rel_path is RESCAN:
+                    return None, None
+                (dirs if is_dir else files).add(rel_path)
+            if time.monotonic() - first_event >= self.max_delay:
+                break
+        return files, dirs
+
+    def run(self, on_update=None):
+        """
+        持续监听，直到调用stop()或按Ctrl+C
+        :param on_update: 每处理完一批变化后调用，参数为 (本批文件数, 耗时秒数)
+        """
+        try:
+            while not self._stopped.is_set():
+                files, dirs = self._collect_batch()
+                if self._stopped.is_set():
+                    break
+                start = time.perf_counter()
+                if self.detector.hash_cache is not None:
+                    self.detector.hash_cache.start_batch()
+                if files is None:
+                    # 事件太多被丢弃了，只能重新完整检测
+                    self._full_scan()
+                    count = len(self.statuses)
+                else:
+                    for rel_dir in dirs:
+                        files |= self._expand_dir(rel_dir)
+                    self.refresh(files)
+                    count = len(files)
+                if self.detector.hash_cache is not None:
+                    self.detector.hash_cache.save()
+                if on_update is not None:
+                    on_update(count, time.perf_counter() - start)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
+
+    def stop(self):
+        """停止监听（可以从其他线程调用）"""
+        self._stopped.set()
+
+    def current_changes(self):
+        """当前各分支的变化（格式同ChangeDetector.send_changes，按路径排序）"""
+        with self._lock:
+            statuses = dict(self.statuses)
+        changes = {branch_name: {"new": [], "modified": []} for branch_name in self.branches}
+        for file in sorted(statuses):
+            for branch_name, status in statuses[file].items():
+                changes[branch_name][status].append(file)
+        return changes
+
+    def current_state(self):
+        """
+        当前的冲突和可合并数据（格式同ConflictDetector.conflicts/merge_data），不需要重新扫描
+        :return: (conflicts, merge_data)
+        """
+        with self._lock:
+            fragments = dict(self.fragments)
+        conflicts = {"new_files_conflict": [], "modified_files_conflict": [], "binary_files_conflict": [],
+                     "rename_conflict": []}
+        merge_data = {"new_files": [], "modified_files": {}, "binary_files": [], "renamed_files": []}
+        # 按路径顺序拼接每个文件的结果，和完整运行一次ConflictDetector的顺序一致
+        for file in sorted(fragments):
+            file_conflicts, file_merge_data = fragments[file]
+            for key in conflicts:
+                conflicts[key].extend(file_conflicts[key])
+            merge_data["new_files"].extend(file_merge_data["new_files"])
+            merge_data["modified_files"].update(file_merge_data["modified_files"])
+            merge_data["binary_files"].extend(file_merge_data["binary_files"])
+            merge_data["renamed_files"].extend(file_merge_data["renamed_files"])
+        return conflicts, merge_data